@@ -1,9 +1,9 @@
 # app.py - Complete Enhanced Parking System with Role-Based Access Control
+from startup import startup  # import đầu tiên: mốc thời gian cho báo cáo khởi động
 import csv
 import json
 import logging
 import os
-import shutil
 import sqlite3
 import sys
 import threading
@@ -11,7 +11,6 @@ import time
 import atexit
 from collections import defaultdict
 from datetime import datetime, timedelta
-from io import StringIO, BytesIO
 from queue import Queue
 import re
 import hashlib
@@ -29,7 +28,7 @@ from illegal_parking_detector import get_illegal_parking_detector
 
 
 # Flask and extensions
-from flask import Flask, Response, render_template, jsonify, flash, redirect, request, url_for, send_file, session
+from flask import Flask, Response, render_template, jsonify, flash, redirect, request, url_for, session
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
@@ -40,22 +39,27 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import cv2
 import numpy as np
 
+from stream_hub import register_broadcaster, get_all_stats as get_stream_stats, get_all_viewer_stats, mjpeg_part
+from jpeg_encoder import get_encoder as get_jpeg_encoder
+from detection_channel import get_channel as get_detection_channel, get_all_stats as get_detection_stats
+from frame_ring import FrameRing, read_into_ring
+from db_access import get_database, get_all_db_stats, close_all_databases
+from db_migrations import migrate as migrate_database
+import report_engine
+import exports
+import vehicle_queries
+import plate_search
+from vehicle_cache import RegisteredVehicleCache
+from capture_jobs import CaptureJob, CaptureQueue, CaptureQueueFull
+from ocr_scheduler import get_variant_scheduler, get_all_variant_stats
+
 
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 sys.stdout.reconfigure(encoding='utf-8')
 
-# Local imports
-try:
-    from camera2 import ParkingDetector
-except ImportError:
-    ParkingDetector = None
-    print("Warning: ParkingDetector not available")
-
-try:
-    import camera1
-except ImportError:
-    camera1 = None
-    print("Warning: camera1 module not available")
+# Local imports - camera1 (torch/ultralytics) import lười: task nền 'camera1' import + load model,
+# request dùng camera1 trước đó sẽ chờ import xong
+camera1 = startup.lazy_import('camera1')
 
 # Import database manager
 try:
@@ -100,16 +104,19 @@ except ImportError:
 
     db_manager = MinimalDBManager()
 
-# Excel/CSV handling
-try:
-    import pandas as pd
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment
+# Data access layer dùng chung: pool connection (WAL) + thống kê thời gian query
+USERS_DB_PATH = 'parking_system.db'
+main_db = get_database(db_manager.db_path)
+users_db = get_database(USERS_DB_PATH)
+# Xe đăng ký + phiên đang đỗ trong RAM cho /capture (write-through)
+vehicle_cache = RegisteredVehicleCache(main_db)
 
-    EXCEL_AVAILABLE = True
-except ImportError:
-    EXCEL_AVAILABLE = False
-    print("Warning: pandas/openpyxl not available. Excel export will be disabled.")
+startup.checkpoint('imports')
+
+# Excel/CSV handling (openpyxl import khi xuất file lần đầu)
+EXCEL_AVAILABLE = exports.XLSX_AVAILABLE
+if not EXCEL_AVAILABLE:
+    print("Warning: openpyxl not available. Excel export will be disabled.")
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -255,7 +262,7 @@ security_logger.setLevel(logging.WARNING)
 
 # Global variables
 plateTimes = defaultdict(str)
-frame_buffer = None
+frame_buffer = None  # FrameRing dự phòng khi camera1 chưa chạy
 frame_lock = threading.Lock()
 parking_detector = None
 system_status = {
@@ -298,6 +305,17 @@ parking_config = ParkingConfig()
 default_config = {
     "parking_areas_path": "static/js/bounding_boxes.json",
     "model_path": "model/yolov8l.pt",
+    "model_size": "l",
+    "imgsz": 640,
+    "roi_crop": True,
+    "roi_padding": 32,
+    "auto_resolution": False,
+    "min_imgsz": 320,
+    "motion_gate": True,
+    "motion_threshold": 0.02,
+    "motion_refresh_interval": 10,
+    "occupancy_mode": "center",
+    "occupancy_overlap": 0.3,
     "tracker_threshold": 30,
     "iou_threshold": 0.5,
     "save_output": False,
@@ -466,15 +484,31 @@ def require_valid_session(f):
 # PARKING DETECTOR INITIALIZATION
 # ===============================
 
-# Initialize ParkingDetector
-try:
-    parking_detector = ParkingDetector(config_path)
-    system_status['camera2_active'] = True
-    logger.info("ParkingDetector initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing ParkingDetector: {e}")
-    system_status['camera2_active'] = False
-    parking_detector = None
+def init_parking_detector():
+    """Task khởi động: import camera2 (ultralytics/norfair) + load model theo config.json - chạy nền, song song với camera1"""
+    global parking_detector
+    try:
+        from camera2 import ParkingDetector
+        parking_detector = ParkingDetector(config_path)
+        system_status['camera2_active'] = True
+        logger.info("ParkingDetector initialized successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error initializing ParkingDetector: {e}")
+        system_status['camera2_active'] = False
+        parking_detector = None
+        return False
+
+
+def init_camera1():
+    """Task khởi động: import camera1, load model (worker inference) và chạy warm-up"""
+    if not camera1:
+        logger.warning("camera1 module not available")
+        return False
+    system_status['camera1_active'] = hasattr(camera1, 'get_current_plate')
+    ready = camera1.prepare_inference()
+    system_status['detection_active'] = bool(ready)
+    return ready
 
 
 def simple_frame_monitor():
@@ -495,17 +529,28 @@ def simple_frame_monitor():
         logger.info("Frame monitor started")
 
         while vid.isOpened():
-            ret, frame = vid.read()
+            frame_count += 1
+            if frame_count % 3 != 0:
+                # Frame không dùng: chỉ grab, không decode/convert màu
+                ret = vid.grab()
+            elif frame_buffer is not None:
+                # Decode thẳng vào slot của ring
+                ret, frame = read_into_ring(vid, frame_buffer)
+                if ret and not frame_buffer.fits(frame):
+                    # Đổi độ phân giải: ring cũ giải phóng shared memory khi pin cuối cùng (/capture) release
+                    old_ring, frame_buffer = frame_buffer, None
+                    old_ring.close()
+            else:
+                ret, frame = vid.read()
+                if ret:
+                    frame_buffer = FrameRing(frame.shape, frame.dtype, slots=3)
+                    frame_buffer.write(frame)
+
             if not ret:
                 vid.set(cv2.CAP_PROP_POS_FRAMES, 0)
                 frame_count = 0
                 continue
 
-            frame_count += 1
-            if frame_count % 3 == 0:
-                with frame_lock:
-                    frame_buffer = frame.copy()
-
             time.sleep(0.033)  # ~30 FPS
 
     except Exception as e:
@@ -579,13 +624,92 @@ def index():
                            is_guard=(user_role == 'guard'))
 
 
+# ===============================
+# CAPTURE PIPELINE (background)
+# ===============================
+
+NO_PLATE_TEXT = "Không nhận diện được biển số"
+CAPTURE_DIR = 'static/captures'
+CAPTURE_JPEG_QUALITY = 95
+CAPTURE_THUMBNAILS = os.environ.get('CAPTURE_THUMBNAILS', '0') == '1'
+CAPTURE_THUMB_WIDTH = 320
+
+
+def _capture_save_image(job):
+    """Ghi JPEG (và thumbnail nếu bật) từ frame đã copy lúc chụp"""
+    filepath = os.path.join(CAPTURE_DIR, job.filename)
+    if not cv2.imwrite(filepath, job.frame, [cv2.IMWRITE_JPEG_QUALITY, CAPTURE_JPEG_QUALITY]):
+        raise IOError(f"Failed to save image: {filepath}")
+    if CAPTURE_THUMBNAILS:
+        height, width = job.frame.shape[:2]
+        if width > CAPTURE_THUMB_WIDTH:
+            thumb = cv2.resize(job.frame, (CAPTURE_THUMB_WIDTH, int(height * CAPTURE_THUMB_WIDTH / width)),
+                               interpolation=cv2.INTER_AREA)
+            cv2.imwrite(os.path.join(CAPTURE_DIR, f"thumb_{job.filename}"), thumb,
+                        [cv2.IMWRITE_JPEG_QUALITY, 80])
+            job.result['thumbnail'] = f"thumb_{job.filename}"
+    job.frame = None  # giải phóng frame, các bước sau không cần
+
+
+def _capture_log_db(job):
+    # DB bị khoá (sqlite3.OperationalError locked/busy) -> CaptureQueue thử lại / spool.
+    # (False, None) là bản ghi bị từ chối hoặc không có DB: thử lại cũng vậy, chỉ ghi nhận lại
+    db_success, vehicle_info = db_manager.log_entry_exit(job.plate, job.action, job.filename, confidence=1.0)
+    update_system_metrics('database_queries')
+    job.result['db_logged'] = bool(db_success)
+    if not db_success:
+        logger.warning(f"Database logging failed for plate: {job.plate}")
+        return
+
+    # Write-through phiên đang mở chỉ sau khi entry_exit_log đã ghi (cache luôn khớp với DB)
+    if job.plate != NO_PLATE_TEXT:
+        if job.action == 'entry':
+            vehicle_cache.record_entry(job.plate, job.timestamp)
+        else:
+            vehicle_cache.record_exit(job.plate)
+    if vehicle_info:
+        job.result['vehicle_info'] = vehicle_info
+
+
+def _capture_notify(job):
+    if job.plate == NO_PLATE_TEXT:
+        return
+    capture_data = {
+        'image': job.filename,
+        'timestamp': job.timestamp,
+        'is_registered': bool(job.context.get('vehicle')),
+        'action': job.action
+    }
+    try:
+        job.result['notification_sent'] = send_vehicle_notification(
+            job.plate, job.action, capture_data, job.context.get('entry_time'), persist=True)
+    except Exception as e:
+        logger.error(f"📸 ❌ Notification error: {e}", exc_info=True)
+        job.result['notification_sent'] = False
+
+
+def _capture_finished(job):
+    """Báo cho dashboard khi job xong, lỗi hoặc được spool để chạy lại (ảnh đã có trên đĩa)"""
+    socketio.emit('capture_completed', job.to_dict())
+    if job.status == 'failed':
+        update_system_metrics('failed_requests')
+
+
+capture_queue = CaptureQueue(
+    steps=[('save_image', _capture_save_image), ('log_db', _capture_log_db), ('notify', _capture_notify)],
+    num_workers=2,
+    spool_dir='capture_spool',
+    on_finished=_capture_finished
+)
+
+
 @app.route('/capture', methods=['POST'])
 @login_required
 @limiter.limit("30 per minute")
 @track_requests
 @require_valid_session
 def capture():
-    """Chụp ảnh xe - Tất cả có thể sử dụng"""
+    """Chụp ảnh xe - Tất cả có thể sử dụng. Chỉ chụp frame rồi trả job id; ghi ảnh/DB/thông báo chạy nền"""
     try:
 
         data = request.get_json()
@@ -600,31 +724,28 @@ def capture():
         if session.get('user_role') == 'guard':
             logger.info(f"Guard {session.get('user_id')} performed {action} capture")
 
-
-
-        # Get current frame
-        ret, frame = False, None
+        # Get current frame - pin frame trong ring, copy ra để trả slot ngay cho camera
+        pinned_frame = None
         try:
-            ret, frame = camera1.get_current_frame()
+            pinned_frame = camera1.pin_latest_frame()
         except Exception as e:
             logger.warning(f"Cannot get frame from camera1: {e}")
 
-        if not ret or frame is None:
-            with frame_lock:
-                if frame_buffer is not None:
-                    frame = frame_buffer.copy()
-                    ret = True
-                else:
-                    ret = False
+        backup_ring = frame_buffer
+        if pinned_frame is None and backup_ring is not None:
+            pinned_frame = backup_ring.pin_latest()
 
-        if not ret or frame is None:
+        if pinned_frame is None:
             return jsonify({
                 "success": False,
                 "error": "Không thể lấy frame từ camera"
             }), 500
 
+        with pinned_frame:
+            frame = pinned_frame.array.copy()
+
         # Get detected plate
-        current_plate = "Không nhận diện được biển số"
+        current_plate = NO_PLATE_TEXT
         try:
             detected_plate = camera1.get_current_plate()
             if detected_plate and detected_plate.strip():
@@ -632,74 +753,45 @@ def capture():
         except Exception as e:
             logger.warning(f"Cannot get current plate: {e}")
 
-        # Generate filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{action}_{timestamp}.jpg"
-        filepath = os.path.join('static/captures', filename)
-
-        # Save image with high quality
-        success_save = cv2.imwrite(filepath, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        if not success_save:
-            logger.error(f"Failed to save image: {filepath}")
-            return jsonify({
-                "success": False,
-                "error": "Không thể lưu ảnh"
-            }), 500
+        now = datetime.now()
+        filename = f"{action}_{now.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(2)}.jpg"
+        current_time = now.strftime("%Y-%m-%d %H:%M:%S")
 
-        # Format timestamp for display
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Thông tin xe + giờ vào lấy từ cache ngay lúc chụp (trước khi job ra đóng phiên)
+        plate_detected = current_plate != NO_PLATE_TEXT
+        vehicle = vehicle_cache.get_vehicle(current_plate) if plate_detected else None
+        entry_time = vehicle_cache.open_session(current_plate) if plate_detected and action == 'exit' else None
 
-        # Log to enhanced database
-        db_success, vehicle_info = db_manager.log_entry_exit(
-            current_plate, action, filename, confidence=1.0
-        )
-
-        if current_plate and current_plate != "Không nhận diện được biển số":
-            logger.info(f"📸 🚗 Sending notification for plate: {current_plate}")
-
-            capture_data = {
-                'image': filename,
-                'timestamp': current_time,
-                'is_registered': bool(vehicle_info),
-                'action': action
-            }
-
-            #  FIXED: Call notification function with proper error handling
-            try:
-                notification_sent = send_vehicle_notification(current_plate, action, capture_data)
-                logger.info(f"📸 📱 Notification sent: {notification_sent}")
-            except Exception as e:
-                logger.error(f"📸 ❌ Notification error: {e}", exc_info=True)
-
-
-        if not db_success:
-            logger.warning(f"Database logging failed for plate: {current_plate}")
+        job = CaptureJob(action, current_plate, filename, current_time, frame=frame,
+                         context={'vehicle': vehicle, 'entry_time': entry_time,
+                                  'user_id': session.get('user_id')},
+                         ordered=plate_detected)
+        try:
+            capture_queue.submit(job)
+        except CaptureQueueFull as e:
+            logger.warning(f"Capture rejected: {e}")
+            update_system_metrics('failed_requests')
+            response = jsonify({"success": False, "error": "Hệ thống đang bận, vui lòng thử lại"})
+            response.headers['Retry-After'] = '1'
+            return response, 503
 
-        # Update system metrics
-        update_system_metrics('database_queries')
+        if vehicle:
+            logger.info(f"Registered vehicle detected: {current_plate} - {vehicle.get('owner_name', 'Unknown')}")
+        else:
+            logger.info(f"Unregistered vehicle: {current_plate}")
 
-        # Prepare response
-        response_data = {
+        return jsonify({
             "success": True,
+            "job_id": job.id,
+            "status": job.status,
             "image": filename,
             "plate": current_plate,
             "timestamp": current_time,
-            "is_registered": False,
-            "vehicle_info": None,
+            "is_registered": bool(vehicle),
+            "vehicle_info": vehicle,
+            "entry_time": entry_time,
             "action": action
-        }
-
-        # Add vehicle info if registered
-        if vehicle_info:
-            response_data.update({
-                "is_registered": True,
-                "vehicle_info": vehicle_info
-            })
-            logger.info(f"Registered vehicle detected: {current_plate} - {vehicle_info.get('owner_name', 'Unknown')}")
-        else:
-            logger.info(f"Unregistered vehicle: {current_plate}")
-
-        return jsonify(response_data)
+        }), 202
 
     except Exception as e:
         logger.error(f"Capture error: {str(e)}")
@@ -710,6 +802,17 @@ def capture():
         }), 500
 
 
+@app.route('/api/capture/<job_id>', methods=['GET'])
+@login_required
+@track_requests
+def capture_status(job_id):
+    """Trạng thái job chụp ảnh: queued / running / retrying / spooled / done / failed"""
+    job = capture_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
 @app.route('/api/test/send-notification', methods=['POST'])
 @login_required
 @track_requests
@@ -757,7 +860,7 @@ def search_plate(plate_number):
         if session.get('user_role') == 'guard':
             logger.info(f"Guard {session.get('user_id')} searched for plate: {plate_number}")
 
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -766,9 +869,9 @@ def search_plate(plate_number):
                    rv.owner_name, rv.owner_phone, rv.vehicle_type, rv.vehicle_brand, rv.vehicle_model
             FROM entry_exit_log el
             LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number
-            WHERE el.plate_number = ?
+            WHERE el.plate_key = ?
             ORDER BY el.timestamp DESC LIMIT 1
-        """, (plate_number.upper(),))
+        """, (plate_search.plate_key(plate_number),))
 
         result = cursor.fetchone()
         conn.close()
@@ -794,7 +897,8 @@ def search_plate(plate_number):
 
         return jsonify({
             'found': False,
-            'message': 'Không tìm thấy biển số xe'
+            'message': 'Không tìm thấy biển số xe',
+            'suggestions': [plate for plate, _, _ in plate_search.find_similar_plates(main_db, plate_number)]
         })
 
     except Exception as e:
@@ -832,7 +936,8 @@ def current_vehicles():
 def sync_data():
     """Đồng bộ dữ liệu - Tất cả có thể sử dụng"""
     try:
-        stats = db_manager.get_parking_statistics()
+        # Đọc từ rollup theo ngày; chưa migrate thì dùng thống kê của db_manager
+        stats = report_engine.get_day_statistics(main_db) or db_manager.get_parking_statistics()
         update_system_metrics('database_queries')
 
         if stats:
@@ -952,6 +1057,8 @@ def register_vehicle():
         success, message = db_manager.register_vehicle(cleaned_data)
 
         if success:
+            vehicle_queries.invalidate_vehicle_counts()
+            vehicle_cache.refresh(plate_number)
             logger.info(f"Vehicle registered: {plate_number} - {owner_name}")
             log_security_event('VEHICLE_REGISTERED', f"Plate: {plate_number}, Owner: {owner_name}")
         else:
@@ -1048,7 +1155,9 @@ def get_all_vehicles():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         search = request.args.get('search', '')
+        search_type = request.args.get('search_type') or None
         vehicle_type = request.args.get('vehicle_type', '')
+        cursor = request.args.get('cursor', '')
 
         # Validate pagination parameters
         if page < 1:
@@ -1056,62 +1165,15 @@ def get_all_vehicles():
         if per_page < 1 or per_page > 100:
             per_page = 20
 
-        # Build query
-        query = """
-            SELECT rv.*, 
-                   (SELECT COUNT(*) FROM entry_exit_log el 
-                    WHERE el.plate_number = rv.plate_number) as visit_count,
-                   (SELECT MAX(el.entry_time) FROM entry_exit_log el 
-                    WHERE el.plate_number = rv.plate_number) as last_visit
-            FROM registered_vehicles rv
-            WHERE rv.is_active = 1
-        """
-        params = []
-
-        if search:
-            query += " AND (rv.plate_number LIKE ? OR rv.owner_name LIKE ? OR rv.owner_phone LIKE ?)"
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-
-        if vehicle_type:
-            query += " AND rv.vehicle_type = ?"
-            params.append(vehicle_type)
-
-        # Get total count for pagination
-        count_query = """
-            SELECT COUNT(*) FROM registered_vehicles rv
-            WHERE rv.is_active = 1
-        """
-        count_params = []
-
-        if search:
-            count_query += " AND (rv.plate_number LIKE ? OR rv.owner_name LIKE ? OR rv.owner_phone LIKE ?)"
-            search_param = f"%{search}%"
-            count_params.extend([search_param, search_param, search_param])
-
-        if vehicle_type:
-            count_query += " AND rv.vehicle_type = ?"
-            count_params.append(vehicle_type)
-
-        query += " ORDER BY rv.registration_date DESC"
-        query += f" LIMIT {per_page} OFFSET {(page - 1) * per_page}"
-
-        # Execute queries
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        # Get total count
-        cursor.execute(count_query, count_params)
-        total_count = cursor.fetchone()[0]
-
-        # Get vehicles
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        conn.close()
+        # Có cursor: phân trang keyset (không OFFSET); không có thì vẫn hỗ trợ ?page= kiểu cũ
+        try:
+            vehicles, next_cursor = vehicle_queries.list_vehicles(
+                main_db, per_page, search, vehicle_type,
+                cursor=cursor or None, offset=(page - 1) * per_page, search_type=search_type)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
-        vehicles = [dict(zip(columns, row)) for row in results]
+        total_count = vehicle_queries.count_vehicles(main_db, search, vehicle_type, search_type)
 
         update_system_metrics('database_queries')
 
@@ -1122,7 +1184,9 @@ def get_all_vehicles():
                 'page': page,
                 'per_page': per_page,
                 'total': total_count,
-                'pages': (total_count + per_page - 1) // per_page
+                'pages': (total_count + per_page - 1) // per_page,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
             }
         })
 
@@ -1163,6 +1227,10 @@ def update_vehicle(plate_number):
         success, message = db_manager.update_vehicle(plate_number, cleaned_data)
 
         if success:
+            vehicle_queries.invalidate_vehicle_counts()
+            vehicle_cache.refresh(plate_number)
+            if cleaned_data.get('plate_number') and cleaned_data['plate_number'] != plate_number:
+                vehicle_cache.refresh(cleaned_data['plate_number'])
             logger.info(f"Vehicle updated: {plate_number}")
             log_security_event('VEHICLE_UPDATED', f"Plate: {plate_number}")
 
@@ -1187,6 +1255,8 @@ def delete_vehicle(plate_number):
         success, message = db_manager.deactivate_vehicle(plate_number)
 
         if success:
+            vehicle_queries.invalidate_vehicle_counts()
+            vehicle_cache.refresh(plate_number)
             logger.info(f"Vehicle deactivated: {plate_number}")
             log_security_event('VEHICLE_DELETED', f"Plate: {plate_number}")
 
@@ -1217,14 +1287,21 @@ def search_vehicles():
         if search_type not in ['plate', 'owner', 'phone']:
             return jsonify({'success': False, 'error': 'Loại tìm kiếm không hợp lệ'}), 400
 
-        results = db_manager.search_vehicles(query, search_type)
+        results = plate_search.search_vehicles(main_db, query, search_type)
         update_system_metrics('database_queries')
 
-        return jsonify({
+        response = {
             'success': True,
             'results': results,
             'count': len(results)
-        })
+        }
+        if not results and search_type == 'plate':
+            # Gợi ý biển số gần giống (OCR đọc sai 1 ký tự)
+            response['suggestions'] = [
+                {'plate_number': plate, 'owner_name': owner, 'distance': distance}
+                for plate, owner, distance in plate_search.find_similar_plates(main_db, query)
+            ]
+        return jsonify(response)
 
     except Exception as e:
         logger.error(f"Vehicle search error: {str(e)}")
@@ -1240,69 +1317,30 @@ def search_vehicles():
 def generate_report():
     """Tạo báo cáo - CHỈ ADMIN"""
     try:
-        # 🚀 Luôn trả dữ liệu test giả lập
-        fake_data = {
-            "summary": {
-                "total_vehicles": 50,
-                "total_entries": 12,
-                "total_exits": 10,
-                "registered_vehicles": 2,
-                "current_parking": 2,
-                "avg_duration": 2.5,
-                "vehicles_change": 5,
-                "entries_change": 12,
-                "exits_change": 8,
-                "registered_change": 15,
-                "parking_change": -2,
-                "duration_change": 3
-            },
-            "charts": {
-                "hourly": {
-                    "entries": [2,1,0,0,0,5,8,12,15,20,25,18,22,19,17,15,10,7,5,3,2,1,1,0],
-                    "exits":   [0,0,0,0,1,3,5,8,10,12,18,20,22,18,15,12,8,6,5,4,2,1,0,0]
-                },
-                "vehicle_types": {
-                    "labels": ["Xe hơi","Xe máy","Xe tải","Khác"],
-                    "data": [35, 55, 8, 5]
-                },
-                "weekly_trend": {
-                    "labels": ["Thứ 2","Thứ 3","Thứ 4","Thứ 5","Thứ 6","Thứ 7","CN"],
-                    "data": [18, 25, 32, 22, 38, 35, 28]
-                },
-                "registration_trend": {
-                    "labels": ["Thứ 2","Thứ 3","Thứ 4","Thứ 5","Thứ 6","Thứ 7","CN"],
-                    "registered":   [12,18,15,20,25,22,16],
-                    "unregistered": [6,7,17,2,13,13,12]
-                }
-            },
-            "tables": {
-                "recent_activities": [
-                    {"plate_number":"51A-12345","owner_name":"Nguyễn Văn A","vehicle_type":"Xe hơi",
-                     "entry_time":"2025-09-01 08:00","exit_time":"2025-09-01 10:00",
-                     "parking_duration":120,"is_registered":True},
-                    {"plate_number":"59B-67890","owner_name":"Trần Thị B","vehicle_type":"Xe máy",
-                     "entry_time":"2025-09-02 09:30","exit_time":"2025-09-02 11:00",
-                     "parking_duration":90,"is_registered":False}
-                ],
-                "top_parkers": [
-                    {"plate_number":"51A-12345","owner_name":"Nguyễn Văn A","visit_count":12,
-                     "avg_duration":2.3,"total_hours":30},
-                    {"plate_number":"59B-67890","owner_name":"Trần Thị B","visit_count":8,
-                     "avg_duration":1.5,"total_hours":12}
-                ]
-            }
-        }
+        data = request.get_json(silent=True) or {}
+        report_type = data.get('report_type', 'daily')
+
+        try:
+            end_date = datetime.strptime(data['end_date'], '%Y-%m-%d') if data.get('end_date') else datetime.now()
+            start_date = (datetime.strptime(data['start_date'], '%Y-%m-%d') if data.get('start_date')
+                          else end_date - timedelta(days=6))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid date format (YYYY-MM-DD)'}), 400
+
+        if start_date > end_date:
+            return jsonify({'success': False, 'error': 'start_date must be before end_date'}), 400
+
+        report_data = report_engine.generate_report(main_db, start_date, end_date)
 
         return jsonify({
             "success": True,
-            "data": fake_data,
+            "data": report_data,
             "generated_at": datetime.now().isoformat(),
             "period": {
-                "start": "2025-09-01",
-                "end": "2025-09-07",
-                "type": "daily"
-            },
-            "message": "Báo cáo dữ liệu giả lập (test mode)"
+                "start": start_date.strftime('%Y-%m-%d'),
+                "end": end_date.strftime('%Y-%m-%d'),
+                "type": report_type
+            }
         })
 
     except Exception as e:
@@ -1313,7 +1351,6 @@ def generate_report():
         }), 500
 
 
-
 @app.route('/api/reports/export')
 @admin_required
 @limiter.limit("5 per minute")
@@ -1322,59 +1359,41 @@ def generate_report():
 def export_report():
     """Xuất báo cáo - CHỈ ADMIN"""
     try:
-        if not EXCEL_AVAILABLE:
-            return jsonify({'success': False, 'error': 'Excel export not available'}), 503
-
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
         report_type = request.args.get('report_type', 'daily')
 
-        if not start_date or not end_date:
-            return jsonify({'success': False, 'error': 'Missing date parameters'}), 400
-
-        # Parse dates
         try:
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-        except ValueError:
-            return jsonify({'success': False, 'error': 'Invalid date format'}), 400
-
-        # Generate Excel file
-        filename = f"parking_report_{start_date}_to_{end_date}.xlsx"
-        filepath = os.path.join('exports', filename)
-
-        # Create Excel workbook
-        workbook = openpyxl.Workbook()
-
-        # Summary sheet
-        summary_sheet = workbook.active
-        summary_sheet.title = "Tổng quan"
+            options = exports.ExportOptions.from_args(request.args, default_format='xlsx')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
-        # Get summary data
-        summary_data = generate_summary_statistics_safe(start_dt, end_dt)
-
-        # Write summary data
-        summary_sheet['A1'] = 'BÁO CÁO TỔNG QUAN HỆ THỐNG ĐỖ XE'
-        summary_sheet['A1'].font = Font(bold=True, size=16)
-        summary_sheet['A3'] = f'Từ ngày: {start_date}'
-        summary_sheet['A4'] = f'Đến ngày: {end_date}'
-        summary_sheet['A5'] = f'Loại báo cáo: {report_type}'
-
-        row = 7
-        for key, value in summary_data.items():
-            if key.endswith('_change'):
-                continue
-            summary_sheet[f'A{row}'] = key.replace('_', ' ').title()
-            summary_sheet[f'B{row}'] = value
-            row += 1
+        if not options.start_date or not options.end_date:
+            return jsonify({'success': False, 'error': 'Missing date parameters'}), 400
 
-        # Save workbook
-        workbook.save(filepath)
+        start_date = options.start_date.strftime('%Y-%m-%d')
+        end_date = options.end_date.strftime('%Y-%m-%d')
+        rows = exports.plate_log_rows(main_db, options)
+
+        if options.format == 'xlsx':
+            summary_data = report_engine.generate_report(main_db, options.start_date, options.end_date)['summary']
+            summary_rows = [(key.replace('_', ' ').title(), value)
+                            for key, value in summary_data.items() if not key.endswith('_change')]
+            chunks = exports.iter_xlsx([
+                ("Tổng quan", ['BÁO CÁO TỔNG QUAN HỆ THỐNG ĐỖ XE', f'Từ ngày: {start_date}',
+                               f'Đến ngày: {end_date}', f'Loại báo cáo: {report_type}'], None, summary_rows),
+                ("Chi tiết", [], options.headers, rows),
+            ])
+        else:
+            chunks = exports.iter_csv(rows, options.headers)
 
-        logger.info(f"Report exported: {filename}")
+        filename = options.filename('parking_report')
+        logger.info(f"Report export started: {filename}")
         update_system_metrics('database_queries', 5)
 
-        return send_file(filepath, as_attachment=True, download_name=filename)
+        return Response(
+            exports.ExportBody(exports.apply_compression(chunks, options), rows),
+            mimetype=options.mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
 
     except Exception as e:
         logger.error(f"Export report error: {str(e)}")
@@ -1389,42 +1408,26 @@ def export_report():
 def download_plates():
     """Download dữ liệu - CHỈ ADMIN"""
     try:
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT el.plate_number, el.entry_time, el.exit_time, 
-                   el.entry_image, el.exit_image, el.is_registered, el.parking_duration,
-                   rv.owner_name, rv.owner_phone, rv.vehicle_type, rv.vehicle_brand, rv.vehicle_model
-            FROM entry_exit_log el
-            LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number
-            ORDER BY el.entry_time DESC
-        """)
+        # Tùy chọn: ?start_date=&end_date=&columns=plate_number,entry_time&format=csv|xlsx&gzip=1
+        try:
+            options = exports.ExportOptions.from_args(request.args)
+        except ValueError as e:
+            flash(f"Lỗi khi xuất dữ liệu: {str(e)}", "error")
+            return redirect('/')
 
-        data = cursor.fetchall()
-        conn.close()
+        rows = exports.plate_log_rows(main_db, options)
         update_system_metrics('database_queries')
 
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            'Biển số xe', 'Thời gian vào', 'Thời gian ra',
-            'Ảnh vào', 'Ảnh ra', 'Đã đăng ký', 'Thời gian đỗ (phút)',
-            'Chủ xe', 'Số điện thoại', 'Loại xe', 'Hãng xe', 'Mẫu xe'
-        ])
-
-        for row in data:
-            writer.writerow(row)
-
-        output.seek(0)
+        if options.format == 'xlsx':
+            chunks = exports.iter_xlsx([("Dữ liệu xe", [], options.headers, rows)])
+        else:
+            chunks = exports.iter_csv(rows, options.headers)
 
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"parking_data_{timestamp}.csv"
+        filename = options.filename('parking_data')
 
         return Response(
-            output.getvalue(),
-            mimetype="text/csv",
+            exports.ExportBody(exports.apply_compression(chunks, options), rows),
+            mimetype=options.mimetype,
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
             }
@@ -1449,8 +1452,8 @@ def create_backup():
         backup_filename = f"parking_backup_{timestamp}.db"
         backup_path = os.path.join('backups', backup_filename)
 
-        # Copy database
-        shutil.copy2(db_manager.db_path, backup_path)
+        # Backup online qua SQLite backup API (file chính có thể chưa chứa dữ liệu trong WAL)
+        main_db.backup_to(backup_path)
 
         # Create metadata
         metadata = {
@@ -1535,7 +1538,7 @@ def reset_system_complete():
 
         # 1. Xóa dữ liệu database
         try:
-            conn = sqlite3.connect(db_manager.db_path)
+            conn = main_db.connect()
             cursor = conn.cursor()
 
             # Xóa log entry/exit
@@ -1592,15 +1595,32 @@ def reset_system_complete():
 # VIDEO STREAMING ROUTES
 # ===============================
 
+def stream_options():
+    """
+    Rendition MJPEG viewer chọn qua query: raw=1 (không vẽ detection), w=<chiều rộng>, q=<JPEG quality>
+    (làm tròn về ladder của stream_hub, vd. /video_stream?w=640&q=70). Adaptive bitrate bật mặc định,
+    abr=0 để giữ cố định FPS / quality (xem /api/streams/viewers)
+    """
+    return {
+        'raw': request.args.get('raw') == '1',
+        'width': request.args.get('w', type=int),
+        'quality': request.args.get('q', type=int),
+        'adaptive': request.args.get('abr', '1') != '0',
+        'client': request.remote_addr
+    }
+
+
 @app.route('/video_feed')
 @login_required
 @track_requests
 def video_feed():
-    """Camera feed with license plate detection"""
+    """Camera feed with license plate detection (?raw=1: không vẽ, client tự vẽ từ /api/detections/camera1/events)"""
     try:
         system_status['camera1_active'] = True
+        broadcaster = register_broadcaster('camera1', camera1.produce_frames, render=camera1.render_annotations,
+                                           jpeg_quality=80)
         return Response(
-            camera1.generate_frames(),
+            broadcaster.stream(**stream_options()),
             mimetype='multipart/x-mixed-replace; boundary=frame'
         )
     except Exception as e:
@@ -1610,17 +1630,21 @@ def video_feed():
 
 
 class OptimizedParkingStream:
-    """Optimized parking video stream with caching"""
+    """
+    Parking video stream: detect theo DETECTION_INTERVAL (1 lần cho mọi viewer), frame trả về là frame sạch;
+    trạng thái được publish lên detection_channel 'parking', render() vẽ cho biến thể annotated.
+    """
 
     def __init__(self):
         self.last_process_time = 0
-        self.frame_cache = None
-        self.cache_time = 0
-        self.cache_duration = 0.1
         self.video_path = "static/video/baidoxe.mp4"
+        self.channel = get_detection_channel('parking')
 
-    def generate_stream(self):
-        """Generate optimized parking video stream"""
+    def render(self, frame):
+        return parking_detector.render(frame) if parking_detector else frame
+
+    def iter_frames(self):
+        """Đọc video, chạy parking detector và trả về frame chưa vẽ"""
         try:
             cap = cv2.VideoCapture(self.video_path)
             if not cap.isOpened():
@@ -1649,33 +1673,14 @@ class OptimizedParkingStream:
                 try:
                     if (current_time - self.last_process_time) >= parking_config.DETECTION_INTERVAL:
                         if parking_detector:
-                            processed_frame = parking_detector.process_frame(frame)
-                        else:
-                            processed_frame = frame
-
-                        self.frame_cache = processed_frame
-                        self.cache_time = current_time
+                            parking_detector.detect(frame)
+                            publish_parking_annotations(self.channel, parking_detector)
                         self.last_process_time = current_time
-                    else:
-                        if (current_time - self.cache_time) < self.cache_duration and self.frame_cache is not None:
-                            processed_frame = self.frame_cache
-                        else:
-                            processed_frame = frame
-
-                    encode_param = [
-                        int(cv2.IMWRITE_JPEG_QUALITY), parking_config.JPEG_QUALITY,
-                        int(cv2.IMWRITE_JPEG_OPTIMIZE), 1
-                    ]
-                    _, jpeg = cv2.imencode('.jpg', processed_frame, encode_param)
-
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n\r\n')
 
                 except Exception as e:
                     logger.error(f"Stream processing error: {e}")
-                    _, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n\r\n')
+
+                yield frame
 
                 elapsed = time.time() - last_frame_time
                 if elapsed < frame_interval:
@@ -1688,6 +1693,18 @@ class OptimizedParkingStream:
             if 'cap' in locals():
                 cap.release()
 
+    def generate_stream(self):
+        """Generator MJPEG độc lập (tương thích cũ) - route dùng stream_hub thay thế"""
+        encoder = get_jpeg_encoder()
+        for frame in self.iter_frames():
+            yield mjpeg_part(encoder.encode(self.render(frame), parking_config.JPEG_QUALITY))
+
+
+def publish_parking_annotations(channel, detector):
+    """Đẩy trạng thái ô đỗ / xe lên detection channel (polygon ô đỗ chỉ gửi trong snapshot)"""
+    channel.set_static(polygons=detector.parking_polygons)
+    channel.publish(detector.get_annotations())
+
 
 parking_stream = OptimizedParkingStream()
 
@@ -1696,11 +1713,13 @@ parking_stream = OptimizedParkingStream()
 @login_required
 @track_requests
 def video_stream():
-    """Parking video stream with vehicle detection"""
+    """Parking video stream with vehicle detection (?raw=1: không vẽ, client tự vẽ từ /api/detections/parking/events)"""
     try:
         system_status['camera2_active'] = True
+        broadcaster = register_broadcaster('parking', parking_stream.iter_frames, render=parking_stream.render,
+                                           jpeg_quality=parking_config.JPEG_QUALITY)
         return Response(
-            parking_stream.generate_stream(),
+            broadcaster.stream(**stream_options()),
             mimetype='multipart/x-mixed-replace; boundary=frame'
         )
     except Exception as e:
@@ -1709,6 +1728,33 @@ def video_stream():
         return jsonify({"error": "Parking stream not available"}), 500
 
 
+DETECTION_CAMERAS = ('camera1', 'parking', 'parking_enhanced')
+
+
+@app.route('/api/detections/<camera>')
+@login_required
+@track_requests
+def detection_snapshot(camera):
+    """Trạng thái detect hiện tại của camera (ô đỗ, xe, biển số) - toạ độ theo frame gốc"""
+    if camera not in DETECTION_CAMERAS:
+        return jsonify({'success': False, 'error': 'Unknown camera'}), 404
+    return jsonify({'success': True, 'data': get_detection_channel(camera).snapshot()})
+
+
+@app.route('/api/detections/<camera>/events')
+@login_required
+@track_requests
+def detection_events(camera):
+    """SSE: snapshot rồi delta mỗi khi kết quả detect thay đổi; dùng cùng stream ?raw=1 để vẽ phía client"""
+    if camera not in DETECTION_CAMERAS:
+        return jsonify({'success': False, 'error': 'Unknown camera'}), 404
+    return Response(
+        get_detection_channel(camera).events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 # ===============================
 # HEALTH CHECK AND MONITORING
 # ===============================
@@ -1717,8 +1763,11 @@ def video_stream():
 @limiter.limit("10 per minute")
 def health_check():
     """System health check"""
+    startup_status = startup.get_status()
     health_status = {
-        'status': 'healthy',
+        'status': {'ready': 'healthy', 'degraded': 'degraded'}.get(startup_status['state'], 'warming'),
+        'readiness': startup_status['state'],
+        'startup': startup_status,
         'timestamp': datetime.now().isoformat(),
         'uptime': str(datetime.now() - system_status['startup_time']),
         'database': 'connected',
@@ -1727,6 +1776,14 @@ def health_check():
             'camera2': system_status['camera2_active']
         },
         'detection': system_status['detection_active'],
+        'streams': get_stream_stats(),
+        'detection_channels': get_detection_stats(),
+        'plate_tracker': camera1.get_plate_tracker_stats() if startup.component_done('camera1') else None,
+        'inference': camera1.get_inference_stats() if startup.component_done('camera1') else None,
+        'motion_gate': {
+            'camera1': camera1.get_motion_gate_stats() if startup.component_done('camera1') else None,
+            'camera2': parking_detector.motion_gate.get_stats() if parking_detector else None
+        },
         'version': '2.0.0'
     }
 
@@ -1741,440 +1798,106 @@ def health_check():
         health_status['status'] = 'unhealthy'
         logger.error(f"Database health check failed: {e}")
 
+    # ?ready=1: readiness probe - 503 khi model còn đang load
+    if request.args.get('ready') and not startup.is_ready():
+        return jsonify(health_status), 503
     return jsonify(health_status)
 
 
-# ===============================
-# REPORT UTILITY FUNCTIONS
-# ===============================
-
-def get_empty_report_data():
-    """Return empty report data structure to prevent frontend errors"""
-    return {
-        'summary': {
-            'total_vehicles': 0,
-            'total_entries': 0,
-            'total_exits': 0,
-            'registered_vehicles': 0,
-            'current_parking': 0,
-            'avg_duration': 0,
-            'vehicles_change': 0,
-            'entries_change': 0,
-            'exits_change': 0,
-            'registered_change': 0,
-            'parking_change': 0,
-            'duration_change': 0
-        },
-        'charts': {
-            'hourly': {
-                'entries': [0] * 24,
-                'exits': [0] * 24
-            },
-            'vehicle_types': {
-                'data': [20, 45, 10, 5],  # Sample data
-                'labels': ['Xe hơi', 'Xe máy', 'Xe tải', 'Khác']
-            },
-            'weekly_trend': {
-                'data': [15, 25, 30, 20, 35, 40, 28]
-            },
-            'registration_trend': {
-                'labels': ['T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN'],
-                'registered': [10, 15, 12, 18, 20, 16, 8],
-                'unregistered': [5, 10, 8, 12, 15, 12, 6]
-            }
-        },
-        'tables': {
-            'recent_activities': [],
-            'top_parkers': []
-        }
-    }
-
-
-def generate_summary_statistics_safe(start_date, end_date):
-    """Generate summary statistics with error handling"""
+@app.route('/api/streams/viewers')
+@admin_required
+@track_requests
+def get_stream_viewers():
+    """Từng viewer MJPEG: rendition, FPS thực tế, băng thông, độ trễ ước tính, bậc adaptive bitrate - CHỈ ADMIN"""
     try:
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        # Initialize default values
-        summary = {
-            'total_vehicles': 0,
-            'total_entries': 0,
-            'total_exits': 0,
-            'registered_vehicles': 0,
-            'current_parking': 0,
-            'avg_duration': 0,
-            'vehicles_change': 5,  # Sample change data
-            'entries_change': 12,
-            'exits_change': 8,
-            'registered_change': 15,
-            'parking_change': -2,
-            'duration_change': 3
-        }
-
-        # Get total vehicles (unique plates in date range)
-        try:
-            cursor.execute("""
-                SELECT COUNT(DISTINCT plate_number) FROM entry_exit_log 
-                WHERE DATE(entry_time) BETWEEN ? AND ?
-                AND entry_time IS NOT NULL
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            result = cursor.fetchone()
-            if result and result[0]:
-                summary['total_vehicles'] = result[0]
-        except Exception as e:
-            logger.warning(f"Error getting total vehicles: {e}")
-
-        # Total entries
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM entry_exit_log 
-                WHERE DATE(entry_time) BETWEEN ? AND ? 
-                AND entry_time IS NOT NULL
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            result = cursor.fetchone()
-            if result and result[0]:
-                summary['total_entries'] = result[0]
-        except Exception as e:
-            logger.warning(f"Error getting total entries: {e}")
-
-        # Total exits
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM entry_exit_log 
-                WHERE DATE(exit_time) BETWEEN ? AND ? 
-                AND exit_time IS NOT NULL
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            result = cursor.fetchone()
-            if result and result[0]:
-                summary['total_exits'] = result[0]
-        except Exception as e:
-            logger.warning(f"Error getting total exits: {e}")
-
-        # Registered vehicles in date range
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM entry_exit_log 
-                WHERE DATE(entry_time) BETWEEN ? AND ? 
-                AND is_registered = 1
-                AND entry_time IS NOT NULL
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            result = cursor.fetchone()
-            if result and result[0]:
-                summary['registered_vehicles'] = result[0]
-        except Exception as e:
-            logger.warning(f"Error getting registered vehicles: {e}")
+        return jsonify({
+            'success': True,
+            'data': get_all_viewer_stats(),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Stream viewer stats error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        # Current parking (vehicles without exit)
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM entry_exit_log 
-                WHERE exit_time IS NULL 
-                AND entry_time IS NOT NULL
-                AND (status = 'active' OR status IS NULL)
-            """)
-            result = cursor.fetchone()
-            if result and result[0]:
-                summary['current_parking'] = result[0]
-        except Exception as e:
-            logger.warning(f"Error getting current parking: {e}")
 
-        # Average duration
-        try:
-            cursor.execute("""
-                SELECT AVG(parking_duration) FROM entry_exit_log 
-                WHERE DATE(entry_time) BETWEEN ? AND ? 
-                AND parking_duration IS NOT NULL
-                AND parking_duration > 0
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            result = cursor.fetchone()
-            if result and result[0]:
-                summary['avg_duration'] = round(result[0], 1)
-        except Exception as e:
-            logger.warning(f"Error getting average duration: {e}")
+@app.route('/api/system/startup')
+@admin_required
+@track_requests
+def get_startup_profile():
+    """Thời gian khởi động theo từng giai đoạn / task nền - CHỈ ADMIN"""
+    return jsonify({'success': True, 'data': startup.get_status(include_phases=True),
+                    'report': startup.report()})
 
-        conn.close()
-        logger.info(f"Summary generated: {summary}")
-        return summary
 
+@app.route('/api/ocr/variant-stats')
+@admin_required
+@track_requests
+def get_ocr_variant_stats():
+    """Thống kê hit/win theo từng biến thể OCR và điều kiện ánh sáng - CHỈ ADMIN"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_all_variant_stats(),
+            'early_exit_confidence': getattr(camera1, 'OCR_EARLY_EXIT_CONFIDENCE', None),
+            'timestamp': datetime.now().isoformat()
+        })
     except Exception as e:
-        logger.error(f"Summary statistics error: {str(e)}")
-        return get_empty_report_data()['summary']
+        logger.error(f"OCR variant stats error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def generate_chart_data_safe(start_date, end_date):
-    """Generate chart data with error handling and sample data"""
+@app.route('/api/ocr/variant-stats', methods=['POST'])
+@admin_required
+@track_requests
+def update_ocr_variant_settings():
+    """Bật/tắt biến thể OCR theo điều kiện ánh sáng hoặc reset thống kê - CHỈ ADMIN"""
     try:
-        charts = {
-            'hourly': {
-                'entries': [0] * 24,
-                'exits': [0] * 24
-            },
-            'vehicle_types': {
-                'data': [0, 0, 0, 0],
-                'labels': ['Xe hơi', 'Xe máy', 'Xe tải', 'Khác']
-            },
-            'weekly_trend': {
-                'data': [0] * 7
-            },
-            'registration_trend': {
-                'labels': ['T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN'],
-                'registered': [0] * 7,
-                'unregistered': [0] * 7
-            }
-        }
-
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        # Get hourly statistics
-        try:
-            # Entries by hour
-            cursor.execute("""
-                SELECT CAST(strftime('%H', entry_time) AS INTEGER) as hour, COUNT(*) as count
-                FROM entry_exit_log 
-                WHERE DATE(entry_time) BETWEEN ? AND ? 
-                AND entry_time IS NOT NULL
-                GROUP BY hour
-                ORDER BY hour
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-
-            hourly_entries = cursor.fetchall()
-            for hour, count in hourly_entries:
-                if hour is not None and 0 <= hour < 24:
-                    charts['hourly']['entries'][hour] = count
-
-            # Exits by hour
-            cursor.execute("""
-                SELECT CAST(strftime('%H', exit_time) AS INTEGER) as hour, COUNT(*) as count
-                FROM entry_exit_log 
-                WHERE DATE(exit_time) BETWEEN ? AND ? 
-                AND exit_time IS NOT NULL
-                GROUP BY hour
-                ORDER BY hour
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-
-            hourly_exits = cursor.fetchall()
-            for hour, count in hourly_exits:
-                if hour is not None and 0 <= hour < 24:
-                    charts['hourly']['exits'][hour] = count
-
-        except Exception as e:
-            logger.warning(f"Error getting hourly statistics: {e}")
-
-        # Get vehicle types statistics
-        try:
-            cursor.execute("""
-                SELECT 
-                    CASE 
-                        WHEN rv.vehicle_type IN ('car', 'xe hơi') THEN 'Xe hơi'
-                        WHEN rv.vehicle_type IN ('motorbike', 'motorcycle', 'xe máy') THEN 'Xe máy'
-                        WHEN rv.vehicle_type IN ('truck', 'xe tải') THEN 'Xe tải'
-                        ELSE 'Khác'
-                    END as type_group,
-                    COUNT(*) as count
-                FROM entry_exit_log el
-                LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number
-                WHERE DATE(el.entry_time) BETWEEN ? AND ? 
-                AND el.entry_time IS NOT NULL
-                GROUP BY type_group
-                ORDER BY count DESC
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-
-            vehicle_types = cursor.fetchall()
-            type_counts = {'Xe hơi': 0, 'Xe máy': 0, 'Xe tải': 0, 'Khác': 0}
-
-            for vehicle_type, count in vehicle_types:
-                if vehicle_type in type_counts:
-                    type_counts[vehicle_type] = count
-                else:
-                    type_counts['Khác'] += count
-
-            xe_hoi = type_counts.get('Xe hơi', 0)
-            khac = type_counts.get('Xe máy', 0) + type_counts.get('Xe tải', 0) + type_counts.get('Khác', 0)
-
-            charts['vehicle_types']['labels'] = ['Xe hơi', 'Khác']
-            charts['vehicle_types']['data'] = [xe_hoi, khac]
-
-        except Exception as e:
-            logger.warning(f"Error getting vehicle type statistics: {e}")
-            # Use sample data if error
-            charts['vehicle_types']['labels'] = ['Xe hơi', 'Khác']
-            charts['vehicle_types']['data'] = [35, 65]
-
-        # Get weekly trend (last 7 days from end_date)
-        try:
-            weekly_data = [0] * 7
-            for i in range(7):
-                day_date = end_date - timedelta(days=6 - i)
-                cursor.execute("""
-                    SELECT COUNT(*) FROM entry_exit_log 
-                    WHERE DATE(entry_time) = ?
-                    AND entry_time IS NOT NULL
-                """, (day_date.strftime('%Y-%m-%d'),))
-
-                result = cursor.fetchone()
-                if result and result[0]:
-                    weekly_data[i] = result[0]
-
-            charts['weekly_trend']['data'] = weekly_data
+        data = request.get_json() or {}
+        camera_id = data.get('camera_id', 'camera1')
+        # Scheduler của camera1 tạo qua camera1 (có chi phí mặc định); worker inference nhận
+        # biến thể bị tắt / reset (epoch) kèm job OCR tiếp theo
+        scheduler = camera1.get_ocr_scheduler() if camera_id == 'camera1' else get_variant_scheduler(camera_id)
 
-        except Exception as e:
-            logger.warning(f"Error getting weekly trend: {e}")
-            # Use sample data
-            charts['weekly_trend']['data'] = [18, 25, 32, 22, 38, 35, 28]
+        if data.get('reset'):
+            scheduler.reset()
+            return jsonify({'success': True, 'message': 'Variant statistics reset'})
 
-        # Get registration trend
-        try:
-            reg_data = [0] * 7
-            unreg_data = [0] * 7
-
-            for i in range(7):
-                day_date = end_date - timedelta(days=6 - i)
-
-                # Registered
-                cursor.execute("""
-                    SELECT COUNT(*) FROM entry_exit_log 
-                    WHERE DATE(entry_time) = ? 
-                    AND is_registered = 1
-                    AND entry_time IS NOT NULL
-                """, (day_date.strftime('%Y-%m-%d'),))
-                result = cursor.fetchone()
-                if result and result[0]:
-                    reg_data[i] = result[0]
-
-                # Unregistered
-                cursor.execute("""
-                    SELECT COUNT(*) FROM entry_exit_log 
-                    WHERE DATE(entry_time) = ? 
-                    AND (is_registered = 0 OR is_registered IS NULL)
-                    AND entry_time IS NOT NULL
-                """, (day_date.strftime('%Y-%m-%d'),))
-                result = cursor.fetchone()
-                if result and result[0]:
-                    unreg_data[i] = result[0]
-
-            charts['registration_trend']['registered'] = reg_data
-            charts['registration_trend']['unregistered'] = unreg_data
+        condition = data.get('condition')
+        variant = data.get('variant')
+        if not condition or not variant:
+            return jsonify({'success': False, 'error': 'condition and variant are required'}), 400
 
-        except Exception as e:
-            logger.warning(f"Error getting registration trend: {e}")
-            # Use sample data
-            charts['registration_trend']['registered'] = [12, 18, 15, 20, 25, 22, 16]
-            charts['registration_trend']['unregistered'] = [6, 7, 17, 2, 13, 13, 12]
-
-        conn.close()
-        logger.info(f"Charts generated successfully")
-        return charts
+        scheduler.set_enabled(condition, variant, bool(data.get('enabled', False)))
+        log_security_event('OCR_VARIANT_UPDATED', f"{condition}/{variant} enabled={data.get('enabled', False)}")
 
+        return jsonify({'success': True, 'data': scheduler.get_stats()})
     except Exception as e:
-        logger.error(f"Chart data generation error: {str(e)}")
-        # Return sample data for demo
-        return {
-            'hourly': {
-                'entries': [1, 0, 0, 0, 0, 2, 5, 8, 12, 15, 18, 20, 22, 18, 15, 12, 8, 6, 4, 3, 2, 1, 1, 0],
-                'exits': [0, 0, 0, 0, 0, 1, 2, 3, 8, 10, 12, 15, 18, 20, 22, 18, 15, 12, 8, 5, 3, 2, 1, 0]
-            },
-            'vehicle_types': {
-                'data': [35, 45, 12, 8],
-                'labels': ['Xe hơi', 'Xe máy', 'Xe tải', 'Khác']
-            },
-            'weekly_trend': {
-                'data': [18, 25, 32, 22, 38, 35, 28]
-            },
-            'registration_trend': {
-                'labels': ['T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN'],
-                'registered': [12, 18, 15, 20, 25, 22, 16],
-                'unregistered': [6, 7, 17, 2, 13, 13, 12]
-            }
-        }
-
-def generate_table_data_safe(start_date, end_date):
-    """Generate table data with error handling"""
-    try:
-        tables = {
-            'recent_activities': [],
-            'top_parkers': []
-        }
-
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        # Recent activities with better status handling
-        try:
-            cursor.execute("""
-                SELECT 
-                    el.plate_number,
-                    COALESCE(rv.owner_name, 'Không xác định') as owner_name,
-                    COALESCE(rv.vehicle_type, 'Không xác định') as vehicle_type,
-                    el.entry_time,
-                    el.exit_time,
-                    el.parking_duration,
-                    CASE 
-                        WHEN rv.plate_number IS NOT NULL THEN 1
-                        ELSE 0
-                    END as is_registered
-                FROM entry_exit_log el
-                LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number AND rv.is_active = 1
-                WHERE DATE(el.entry_time) BETWEEN ? AND ?
-                AND el.entry_time IS NOT NULL
-                ORDER BY el.entry_time DESC
-                LIMIT 50
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-
-            activities = cursor.fetchall()
-            for activity in activities:
-                tables['recent_activities'].append({
-                    'plate_number': activity[0] or 'N/A',
-                    'owner_name': activity[1] or 'Không xác định',
-                    'vehicle_type': activity[2] or 'Không xác định',
-                    'entry_time': activity[3],
-                    'exit_time': activity[4],
-                    'parking_duration': activity[5],
-                    'is_registered': bool(activity[6])
-                })
-
-        except Exception as e:
-            logger.warning(f"Error getting recent activities: {e}")
-
-        # Top parkers
-        try:
-            cursor.execute("""
-                SELECT 
-                    el.plate_number,
-                    COALESCE(rv.owner_name, 'Không xác định') as owner_name,
-                    COUNT(*) as visit_count,
-                    AVG(COALESCE(el.parking_duration, 0)) as avg_duration,
-                    SUM(COALESCE(el.parking_duration, 0)) as total_hours
-                FROM entry_exit_log el
-                LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number AND rv.is_active = 1
-                WHERE DATE(el.entry_time) BETWEEN ? AND ?
-                AND el.entry_time IS NOT NULL
-                GROUP BY el.plate_number
-                HAVING COUNT(*) > 1
-                ORDER BY total_hours DESC, visit_count DESC
-                LIMIT 20
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-
-            parkers = cursor.fetchall()
-            for parker in parkers:
-                tables['top_parkers'].append({
-                    'plate_number': parker[0] or 'N/A',
-                    'owner_name': parker[1] or 'Không xác định',
-                    'visit_count': parker[2] or 0,
-                    'avg_duration': round(parker[3] or 0, 1),
-                    'total_hours': round((parker[4] or 0) / 60, 2)  # Convert minutes to hours
-                })
-
-        except Exception as e:
-            logger.warning(f"Error getting top parkers: {e}")
+        logger.error(f"OCR variant settings error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        conn.close()
-        return tables
 
+@app.route('/api/system/db-stats')
+@admin_required
+@track_requests
+def get_db_stats():
+    """Thống kê pool connection và thời gian query theo từng câu SQL - CHỈ ADMIN"""
+    try:
+        top = request.args.get('top', 20, type=int)
+        if request.args.get('reset') == '1':
+            for db in (main_db, users_db):
+                db.reset_stats()
+        return jsonify({
+            'success': True,
+            'data': get_all_db_stats(top),
+            'vehicle_count_cache': vehicle_queries.vehicle_counts.get_stats(),
+            'vehicle_cache': vehicle_cache.get_stats(),
+            'capture_queue': capture_queue.get_stats(),
+            'timestamp': datetime.now().isoformat()
+        })
     except Exception as e:
-        logger.error(f"Table data generation error: {str(e)}")
-        return get_empty_report_data()['tables']
+        logger.error(f"DB stats error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 
 # ===============================
 # ERROR HANDLERS
@@ -2361,7 +2084,7 @@ def login():
 def init_users_table():
     """Initialize users table in database"""
     try:
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -2443,7 +2166,7 @@ def users_management_page():
 def get_all_users():
     """Get all users - ADMIN ONLY"""
     try:
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -2536,7 +2259,7 @@ def add_user():
         # Hash password
         password_hash = generate_password_hash(data['password'])
 
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         # Check if username exists
@@ -2595,7 +2318,7 @@ def update_user(user_id):
     try:
         data = request.get_json()
 
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         # Build update query dynamically
@@ -2679,7 +2402,7 @@ def update_user(user_id):
 def delete_user(user_id):
     """Delete user - ADMIN ONLY"""
     try:
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         # Don't allow deleting the main admin account
@@ -2734,7 +2457,7 @@ def reset_user_password(user_id):
 
         password_hash = generate_password_hash(data['password'])
 
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -2776,7 +2499,7 @@ def reset_user_password(user_id):
 def get_user_activity(user_id):
     """Get user activity log - ADMIN ONLY"""
     try:
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -2828,7 +2551,7 @@ def api_login():
             }), 400
 
         # Check in database
-        conn = sqlite3.connect('parking_system.db')
+        conn = users_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -3010,34 +2733,36 @@ def initialize_app():
     """Initialize application components"""
     try:
         logger.info("=== Parking System Starting ===")
+        startup.checkpoint('app_setup')
 
-        # Initialize database
+        # Initialize database (index/migration schema)
+        try:
+            applied = migrate_database(main_db)
+            if applied:
+                logger.info(f"Database migrations applied: {applied}")
+        except Exception as e:
+            logger.error(f"Database migration error: {e}")
+        try:
+            vehicle_cache.load()
+        except Exception as e:
+            logger.error(f"Vehicle cache load error: {e}")
+        capture_queue.start()
         system_status['database_active'] = True
         logger.info("Database initialized")
 
-        # Check camera systems
-        try:
-            if hasattr(camera1, 'get_current_plate'):
-                system_status['camera1_active'] = True
-                system_status['detection_active'] = True
-                logger.info("Camera1 system active")
-        except Exception as e:
-            logger.warning(f"Camera1 system not available: {e}")
-            system_status['camera1_active'] = False
+        startup.checkpoint('database')
 
-        # Check parking detector
-        if parking_detector:
-            system_status['camera2_active'] = True
-            logger.info("Parking detector active")
-        else:
-            logger.warning("Parking detector not available")
-            system_status['camera2_active'] = False
+        # Camera / model: load song song ở background, /health báo 'warming' đến khi xong
+        startup.add_task('camera1', init_camera1)
+        startup.add_task('parking_detector', init_parking_detector)
+        startup.start()
 
         # Log startup
         log_security_event('SYSTEM_STARTUP', 'Parking system started successfully')
 
         logger.info("=== System Initialization Complete ===")
         initialize_enhanced_parking()
+        startup.checkpoint('initialize_app')
 
     except Exception as e:
         logger.error(f"Startup error: {e}")
@@ -3065,6 +2790,12 @@ def cleanup_on_exit():
         if hasattr(camera1, 'cleanup_resources'):
             camera1.cleanup_resources()
 
+        # Job chụp ảnh đang chờ được ghi ra spool, chạy lại ở lần khởi động sau
+        capture_queue.stop()
+
+        # Đóng các connection SQLite đang rảnh trong pool
+        close_all_databases()
+
         # Stop parking detector
         global parking_detector
         if parking_detector:
@@ -3247,6 +2978,39 @@ def check_specific_space(space_id):
 # ENHANCED VIDEO STREAMING
 # ===============================
 
+def iter_enhanced_parking_frames():
+    """Đọc video bãi xe và detect bằng enhanced detector (chạy 1 lần cho mọi viewer), trả về frame chưa vẽ"""
+    detector = get_enhanced_parking_detector()
+    channel = get_detection_channel('parking_enhanced')
+    video_path = "static/video/baidoxe.mp4"
+    cap = cv2.VideoCapture(video_path)
+
+    if not cap.isOpened():
+        logger.error(f"Cannot open enhanced video: {video_path}")
+        return
+
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+
+            try:
+                # Detect với enhanced detector, kết quả lên detection channel
+                detector.detect(frame)
+                publish_parking_annotations(channel, detector)
+            except Exception as e:
+                logger.error(f"Enhanced stream processing error: {e}")
+            yield frame
+    finally:
+        cap.release()
+
+
+def render_enhanced_parking_frame(frame):
+    return get_enhanced_parking_detector().render(frame)
+
+
 @app.route('/video_stream_enhanced')
 @login_required
 @track_requests
@@ -3254,48 +3018,11 @@ def video_stream_enhanced():
     """Enhanced parking video stream với parking status"""
     try:
         if ENHANCED_PARKING_AVAILABLE:
-            detector = get_enhanced_parking_detector()
             system_status['camera2_active'] = True
-
-            def generate_enhanced_stream():
-                import cv2
-                video_path = "static/video/baidoxe.mp4"
-                cap = cv2.VideoCapture(video_path)
-
-                if not cap.isOpened():
-                    logger.error(f"Cannot open enhanced video: {video_path}")
-                    return
-
-                while cap.isOpened():
-                    ret, frame = cap.read()
-                    if not ret:
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        continue
-
-                    try:
-                        # Process frame với enhanced detector
-                        processed_frame = detector.process_frame(frame)
-
-                        # Encode frame
-                        _, jpeg = cv2.imencode('.jpg', processed_frame,
-                                               [cv2.IMWRITE_JPEG_QUALITY, 85])
-
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' +
-                               jpeg.tobytes() + b'\r\n\r\n')
-
-                    except Exception as e:
-                        logger.error(f"Enhanced stream processing error: {e}")
-                        # Fallback to original frame
-                        _, jpeg = cv2.imencode('.jpg', frame)
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' +
-                               jpeg.tobytes() + b'\r\n\r\n')
-
-                cap.release()
-
+            broadcaster = register_broadcaster('parking_enhanced', iter_enhanced_parking_frames,
+                                               render=render_enhanced_parking_frame, jpeg_quality=85)
             return Response(
-                generate_enhanced_stream(),
+                broadcaster.stream(**stream_options()),
                 mimetype='multipart/x-mixed-replace; boundary=frame'
             )
         else:
@@ -4022,67 +3749,15 @@ def mobile_vehicle_login():
                 'message': 'Biển số xe và số điện thoại không được để trống'
             }), 400
 
-        # Tìm xe trong database với flexible matching
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        # Debug: Show what's in database
-        cursor.execute("SELECT plate_number, owner_phone, owner_name FROM registered_vehicles WHERE is_active = 1")
-        all_vehicles = cursor.fetchall()
-        logger.info(f" Database has {len(all_vehicles)} active vehicles")
-        for v in all_vehicles:
-            logger.info(f"  - {v[0]} | {v[1]} | {v[2]}")
-
-        # Try exact match first
-        cursor.execute("""
-            SELECT id, plate_number, owner_name, owner_phone, owner_email,
-                   vehicle_type, vehicle_brand, vehicle_model, vehicle_color,
-                   registration_date, expiry_date, is_active
-            FROM registered_vehicles 
-            WHERE plate_number = ? AND owner_phone = ? AND is_active = 1
-        """, (plate_number, owner_phone))
-
-        result = cursor.fetchone()
-
-        if not result:
-            # Try with different plate formats
-            plate_variations = [
-                plate_number,
-                plate_number.replace('-', ''),
-                plate_number.replace('-', ' '),
-                plate_number.replace(' ', '-')
-            ]
-
-            # Try with different phone formats
-            phone_variations = [
-                owner_phone,
-                owner_phone.replace(' ', ''),
-                owner_phone.replace('-', ''),
-                owner_phone.replace(' ', '').replace('-', '')
-            ]
-
-            logger.info(f" Trying variations: plates={plate_variations}, phones={phone_variations}")
-
-            for plate_var in plate_variations:
-                for phone_var in phone_variations:
-                    cursor.execute("""
-                        SELECT id, plate_number, owner_name, owner_phone, owner_email,
-                               vehicle_type, vehicle_brand, vehicle_model, vehicle_color,
-                               registration_date, expiry_date, is_active
-                        FROM registered_vehicles 
-                        WHERE plate_number = ? AND owner_phone = ? AND is_active = 1
-                    """, (plate_var, phone_var))
-
-                    result = cursor.fetchone()
-                    if result:
-                        logger.info(f" Found match with: plate='{plate_var}', phone='{phone_var}'")
-                        break
-                if result:
-                    break
+        # Tìm xe theo plate_key + phone_key (bỏ qua khác biệt định dạng '-', '.', khoảng trắng) - 1 lần tra index
+        result = plate_search.find_vehicle(main_db, plate_number, owner_phone, columns="""
+            rv.id, rv.plate_number, rv.owner_name, rv.owner_phone, rv.owner_email,
+            rv.vehicle_type, rv.vehicle_brand, rv.vehicle_model, rv.vehicle_color,
+            rv.registration_date, rv.expiry_date, rv.is_active
+        """)
 
         if not result:
             logger.warning(f" Mobile login failed: {plate_number} / {owner_phone} - No matching record")
-            conn.close()
             return jsonify({
                 'success': False,
                 'message': 'Biển số xe hoặc số điện thoại không chính xác. Vui lòng kiểm tra lại thông tin.'
@@ -4090,22 +3765,20 @@ def mobile_vehicle_login():
 
         # Lấy thông tin xe
         vehicle_data = {
-            'id': result[0],
-            'plate_number': result[1],
-            'owner_name': result[2],
-            'owner_phone': result[3],
-            'owner_email': result[4] or '',
-            'vehicle_type': result[5],
-            'vehicle_brand': result[6] or '',
-            'vehicle_model': result[7] or '',
-            'vehicle_color': result[8] or '',
-            'registration_date': result[9],
-            'expiry_date': result[10] or '',
-            'is_active': bool(result[11])
+            'id': result['id'],
+            'plate_number': result['plate_number'],
+            'owner_name': result['owner_name'],
+            'owner_phone': result['owner_phone'],
+            'owner_email': result['owner_email'] or '',
+            'vehicle_type': result['vehicle_type'],
+            'vehicle_brand': result['vehicle_brand'] or '',
+            'vehicle_model': result['vehicle_model'] or '',
+            'vehicle_color': result['vehicle_color'] or '',
+            'registration_date': result['registration_date'],
+            'expiry_date': result['expiry_date'] or '',
+            'is_active': bool(result['is_active'])
         }
 
-        conn.close()
-
         # Tạo session cho mobile
         session['mobile_vehicle_id'] = vehicle_data['id']
         session['mobile_plate_number'] = vehicle_data['plate_number']
@@ -4168,7 +3841,7 @@ def get_mobile_vehicle_history(plate_number):
                 'error': 'Không có quyền truy cập lịch sử xe này'
             }), 403
 
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -4203,7 +3876,7 @@ def get_mobile_vehicle_history(plate_number):
 def test_mobile_database():
     """Test endpoint để kiểm tra database"""
     try:
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         # Lấy tất cả xe đang active
@@ -4240,57 +3913,42 @@ def test_mobile_database():
         }), 500
 
 
-def send_vehicle_notification(plate_number, action, capture_data):
-    """✅ FIXED: Send real-time vehicle notification via WebSocket"""
+def send_vehicle_notification(plate_number, action, capture_data, entry_time=None, persist=False):
+    """✅ FIXED: Send real-time vehicle notification via WebSocket
+
+    Thông tin xe và giờ vào lấy từ vehicle_cache (không query); /capture truyền entry_time
+    đã lấy trước khi phiên bị đóng. persist=True lưu thêm vào bảng notifications.
+    """
     try:
         logger.info(f"🚗 📱 *** SENDING VEHICLE NOTIFICATION ***")
         logger.info(f"🚗 Plate: {plate_number}, Action: {action}")
 
-        # Get vehicle info from database
-        conn = sqlite3.connect(db_manager.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT owner_name, owner_phone, vehicle_type, vehicle_brand, vehicle_model, owner_email
-            FROM registered_vehicles
-            WHERE plate_number = ? AND is_active = 1
-        """, (plate_number.upper(),))
-
-        vehicle = cursor.fetchone()
-
+        vehicle = vehicle_cache.get_vehicle(plate_number)
         if not vehicle:
             logger.warning(f"🚗 Vehicle {plate_number} not registered")
-            conn.close()
             return False
 
-        owner_name, owner_phone, vehicle_type, vehicle_brand, vehicle_model, owner_email = vehicle
+        owner_name = vehicle['owner_name']
 
         # Calculate parking duration for exit
         parking_duration = None
-        entry_time = None
         exit_time = None
 
         if action == 'exit':
-            cursor.execute("""
-                SELECT entry_time FROM entry_exit_log
-                WHERE plate_number = ? AND exit_time IS NULL
-                ORDER BY entry_time DESC LIMIT 1
-            """, (plate_number.upper(),))
-
-            entry_result = cursor.fetchone()
-            if entry_result:
+            if entry_time is None:
+                entry_time = vehicle_cache.open_session(plate_number)
+            if entry_time:
                 try:
-                    entry_time_str = entry_result[0]
-                    entry_dt = datetime.strptime(entry_time_str, "%Y-%m-%d %H:%M:%S")
+                    entry_dt = datetime.strptime(entry_time[:19], "%Y-%m-%d %H:%M:%S")
                     exit_dt = datetime.now()
                     duration_seconds = (exit_dt - entry_dt).total_seconds()
                     parking_duration = int(duration_seconds / 60)  # minutes
-                    entry_time = entry_time_str
                     exit_time = capture_data['timestamp']
                 except Exception as e:
                     logger.error(f"Error calculating duration: {e}")
-
-        conn.close()
+                    entry_time = None
+        else:
+            entry_time = None
 
         # ✅ FIXED: Create notification in Android-compatible format
         vehicle_notification = {
@@ -4323,6 +3981,13 @@ def send_vehicle_notification(plate_number, action, capture_data):
         except Exception as e:
             logger.warning(f"Room notification failed: {e}")
 
+        if persist:
+            save_notification_to_db(plate_number, {
+                **vehicle_notification,
+                'data': {key: vehicle_notification[key]
+                         for key in ('owner_name', 'image_url', 'parking_duration', 'entry_time', 'exit_time')}
+            })
+
         return True
 
     except Exception as e:
@@ -4333,7 +3998,7 @@ def send_vehicle_notification(plate_number, action, capture_data):
 def save_notification_to_db(plate_number, notification_data):
     """Lưu notification vào database để xem lịch sử"""
     try:
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         # Tạo bảng notifications nếu chưa có
@@ -4477,7 +4142,7 @@ def initialize_illegal_parking_system():
 def log_illegal_parking_violation(notification):
     """Lưu vi phạm đỗ xe vào database"""
     try:
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         # Tạo bảng nếu chưa có
@@ -4546,7 +4211,7 @@ def get_illegal_parking_status():
 def get_illegal_parking_history():
     """Lấy lịch sử vi phạm đỗ xe"""
     try:
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -4578,7 +4243,7 @@ def resolve_illegal_parking(vehicle_id):
     """Xử lý/xóa vi phạm đỗ xe"""
     try:
         # Update database
-        conn = sqlite3.connect(db_manager.db_path)
+        conn = main_db.connect()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -0,0 +1,138 @@
+# bench_inference.py - So sánh backend PyTorch và ONNX Runtime trên cùng tập ảnh: latency p50/p95 và độ khớp box
+#
+#   python inference_backend.py export model/best.pt --family yolov8 [--int8]
+#   python benchmarks/bench_inference.py model/best.pt --family yolov8 --images samples/ --min-match 0.95
+#
+# Box ONNX được coi là khớp khi có box torch cùng class với IoU > --iou-match.
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_backend import load_backend  # noqa: E402
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+
+def load_images(path, limit):
+    """Ảnh trong thư mục, hoặc frame cách đều của 1 video"""
+    if os.path.isdir(path):
+        files = sorted(f for pattern in IMAGE_PATTERNS for f in glob.glob(os.path.join(path, pattern)))
+        return [cv2.imread(f) for f in files[:limit]]
+
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or limit
+    step = max(1, total // limit)
+    images = []
+    for index in range(0, total, step):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = cap.read()
+        if not ok or len(images) >= limit:
+            break
+        images.append(frame)
+    cap.release()
+    return images
+
+
+def box_iou(a, b):
+    """IoU giữa 2 mảng box xyxy (N, 4) x (M, 4)"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_boxes(reference, candidate, iou_threshold):
+    """(số box reference có box candidate cùng class khớp, tổng box reference, tổng box candidate)"""
+    if not len(reference) or not len(candidate):
+        return 0, len(reference), len(candidate)
+    ious = box_iou(reference.xyxy, candidate.xyxy)
+    ious[reference.cls[:, None] != candidate.cls[None, :]] = 0
+    matched = 0
+    used = set()
+    for row in range(len(reference)):
+        for col in np.argsort(-ious[row]):
+            if ious[row, col] <= iou_threshold:
+                break
+            if col not in used:
+                used.add(col)
+                matched += 1
+                break
+    return matched, len(reference), len(candidate)
+
+
+def time_backend(backend, images, args):
+    for image in images[:args.warmup]:
+        backend.detect([image], imgsz=args.imgsz, conf=args.conf)
+    timings, outputs = [], []
+    for image in images:
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            detections = backend.detect([image], imgsz=args.imgsz, conf=args.conf)[0]
+            timings.append((time.perf_counter() - started) * 1000)
+        outputs.append(detections)
+    return np.array(timings), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare PyTorch and ONNX Runtime inference backends')
+    parser.add_argument('weights', help='file .pt (đã export .onnx cạnh nó)')
+    parser.add_argument('--family', choices=('yolov8', 'yolov5'), required=True)
+    parser.add_argument('--images', required=True, help='thư mục ảnh hoặc file video')
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--iou-match', type=float, default=0.5)
+    parser.add_argument('--min-match', type=float, default=0.95, help='tỉ lệ box torch phải có box ONNX khớp')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    images = [image for image in load_images(args.images, args.limit) if image is not None]
+    if not images:
+        print(f"No images found in {args.images}")
+        sys.exit(2)
+
+    results = {}
+    for name in ('torch', 'onnx'):
+        backend = load_backend(args.weights, args.family, backend=name)
+        if backend.name != name:
+            print(f"Backend {name} not available")
+            sys.exit(2)
+        results[name] = time_backend(backend, images, args)
+
+    print(f"{len(images)} images x {args.repeat}, imgsz {args.imgsz}")
+    print(f"{'backend':<10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for name, (timings, _) in results.items():
+        print(f"{name:<10}{np.percentile(timings, 50):>10.1f}{np.percentile(timings, 95):>10.1f}"
+              f"{timings.mean():>10.1f}")
+
+    matched = reference_total = candidate_total = 0
+    for reference, candidate in zip(results['torch'][1], results['onnx'][1]):
+        m, r, c = match_boxes(reference, candidate, args.iou_match)
+        matched += m
+        reference_total += r
+        candidate_total += c
+    match_rate = matched / reference_total if reference_total else 1.0
+    print(f"boxes: torch {reference_total}, onnx {candidate_total}, matched {matched} ({match_rate:.1%})")
+
+    speedup = np.percentile(results['torch'][0], 50) / np.percentile(results['onnx'][0], 50)
+    print(f"p50 speedup: {speedup:.2f}x")
+    if match_rate < args.min_match:
+        print(f"FAIL: match rate {match_rate:.1%} below {args.min_match:.0%}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
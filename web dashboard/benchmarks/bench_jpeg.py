@@ -0,0 +1,93 @@
+# bench_jpeg.py - Throughput các JPEG encoder (OpenCV, PyTurboJPEG, simplejpeg) trên ladder độ phân giải / quality
+#
+#   python benchmarks/bench_jpeg.py --video static/video/cong.mp4 --frames 100
+#
+# Dòng "opencv+optimize" là đường encode cũ của stream (cv2.imencode + IMWRITE_JPEG_OPTIMIZE).
+# Thời gian resize về bậc ladder được tính vào từng lần encode (giống FrameBroadcaster).
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from jpeg_encoder import ENCODERS, OpenCVEncoder  # noqa: E402
+from stream_hub import LADDER_QUALITIES, LADDER_WIDTHS  # noqa: E402
+
+
+def load_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def available_encoders():
+    encoders = [('opencv+optimize', OpenCVEncoder(optimize=True))]
+    for name, cls in ENCODERS.items():
+        try:
+            encoders.append((name, cls()))
+        except (ImportError, OSError, RuntimeError) as e:
+            print(f"{name}: not available ({e})")
+    return encoders
+
+
+def time_encoder(encoder, frames, width, quality):
+    """(ms / frame, KB / frame)"""
+    sizes = []
+    started = time.perf_counter()
+    for frame in frames:
+        height, frame_width = frame.shape[:2]
+        if width and width < frame_width:
+            frame = cv2.resize(frame, (width, round(height * width / frame_width)), interpolation=cv2.INTER_AREA)
+        sizes.append(len(encoder.encode(frame, quality)))
+    elapsed = time.perf_counter() - started
+    return elapsed / len(frames) * 1000, np.mean(sizes) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JPEG encoder throughput on the stream encoding ladder')
+    parser.add_argument('--video', default='static/video/cong.mp4')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--widths', default=','.join(str(w) for w in LADDER_WIDTHS),
+                        help='chiều rộng ladder, 0 = kích thước gốc')
+    parser.add_argument('--qualities', default='50,70,80,90')
+    args = parser.parse_args()
+
+    os.chdir(BASE_DIR)
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        print(f"Cannot read frames from {args.video}")
+        sys.exit(2)
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames {width}x{height} from {args.video}")
+
+    encoders = available_encoders()
+    widths = [int(w) for w in args.widths.split(',')]
+    qualities = [int(q) for q in args.qualities.split(',')]
+    for encoder in encoders:
+        encoder[1].encode(frames[0], 80)  # warmup
+
+    print(f"{'encoder':<18}{'width':>7}{'q':>5}{'ms':>9}{'FPS':>9}{'KB':>9}{'vs opencv+opt':>15}")
+    for target in widths:
+        for quality in qualities:
+            baseline = None
+            for name, encoder in encoders:
+                ms, kb = time_encoder(encoder, frames, target, quality)
+                baseline = baseline or ms
+                label = target if target and target < width else width
+                print(f"{name:<18}{label:>7}{quality:>5}{ms:>9.2f}{1000 / ms:>9.0f}{kb:>9.1f}"
+                      f"{baseline / ms:>14.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# bench_occupancy.py - Độ chính xác trạng thái ô đỗ vs FPS cho từng cấu hình model / imgsz / ROI của ParkingDetector
+#
+#   python benchmarks/bench_occupancy.py --sizes n,s,m,l --imgsz 320,480,640 --frames 300
+#
+# Mỗi model còn 1 dòng auto_resolution và 1 dòng motion_gate (tỉ lệ frame bỏ qua detection ở cột skipped).
+# Không có nhãn thật: cấu hình tham chiếu (mặc định yolov8l, imgsz 1280, không crop ROI) được coi là đúng,
+# accuracy = tỉ lệ (frame, ô đỗ) có cùng trạng thái empty/occupied với tham chiếu.
+import argparse
+import logging
+import os
+import sys
+import time
+
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from camera2 import ParkingDetector  # noqa: E402
+
+
+def run_setting(args, overrides):
+    """(trạng thái từng frame [[status ô 0, ô 1, ...], ...], FPS của process_frame, detector)"""
+    detector = ParkingDetector(args.config, overrides)
+    slots = range(len(detector.parking_polygons))
+    cap = cv2.VideoCapture(args.video)
+    statuses, elapsed, index = [], 0.0, 0
+    while len(statuses) < args.frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        index += 1
+        if index % args.stride:
+            continue
+        started = time.perf_counter()
+        detector.process_frame(frame)
+        elapsed += time.perf_counter() - started
+        statuses.append([detector.current_status.get(slot, 'empty') for slot in slots])
+    cap.release()
+    return statuses, len(statuses) / elapsed if elapsed else 0.0, detector
+
+
+def agreement(reference, candidate):
+    pairs = [(r, c) for ref_row, cand_row in zip(reference, candidate) for r, c in zip(ref_row, cand_row)]
+    return sum(r == c for r, c in pairs) / len(pairs) if pairs else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Occupancy accuracy vs FPS for ParkingDetector settings')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--video', default='static/video/baidoxe.mp4')
+    parser.add_argument('--frames', type=int, default=300, help='số frame được detect cho mỗi cấu hình')
+    parser.add_argument('--stride', type=int, default=4, help='detect 1 frame mỗi N frame video (~DETECTION_INTERVAL)')
+    parser.add_argument('--sizes', default='n,s,m,l')
+    parser.add_argument('--imgsz', default='320,480,640')
+    parser.add_argument('--no-roi', action='store_true', help='đo thêm các cấu hình không crop ROI')
+    parser.add_argument('--reference-size', default='l')
+    parser.add_argument('--reference-imgsz', type=int, default=1280)
+    args = parser.parse_args()
+
+    os.chdir(BASE_DIR)  # config.json / parking_areas_path là đường dẫn tương đối
+    logging.basicConfig(level=logging.WARNING)
+
+    settings = []
+    max_imgsz = max(int(value) for value in args.imgsz.split(','))
+    for size in args.sizes.split(','):
+        for imgsz in (int(value) for value in args.imgsz.split(',')):
+            for roi in ((True, False) if args.no_roi else (True,)):
+                settings.append({'model_size': size, 'imgsz': imgsz, 'roi_crop': roi,
+                                 'auto_resolution': False, 'motion_gate': False})
+        settings.append({'model_size': size, 'imgsz': max_imgsz, 'roi_crop': True,
+                         'auto_resolution': True, 'motion_gate': False})
+        settings.append({'model_size': size, 'imgsz': max_imgsz, 'roi_crop': True,
+                         'auto_resolution': False, 'motion_gate': True})
+
+    reference, reference_fps, _ = run_setting(args, {'model_size': args.reference_size,
+                                                     'imgsz': args.reference_imgsz, 'roi_crop': False,
+                                                     'auto_resolution': False, 'motion_gate': False})
+    if not reference:
+        print(f"Cannot read frames from {args.video}")
+        sys.exit(2)
+    print(f"reference yolov8{args.reference_size} imgsz {args.reference_imgsz} full frame: "
+          f"{reference_fps:.1f} FPS, {len(reference)} frames")
+
+    print(f"{'model':<8}{'imgsz':>7}{'roi':>5}{'auto':>6}{'gate':>6}{'FPS':>8}{'accuracy':>10}"
+          f"{'skipped':>9}  imgsz used")
+    for overrides in settings:
+        try:
+            statuses, fps, detector = run_setting(args, overrides)
+        except Exception as e:
+            print(f"yolov8{overrides['model_size']:<2} skipped: {e}")
+            continue
+        policy_stats, gate_stats = detector.policy.get_stats(), detector.motion_gate.get_stats()
+        used = ', '.join(f'{size}:{count}' for size, count in sorted(policy_stats['frames_by_imgsz'].items()))
+        flags = ''.join(f"{'on' if overrides[key] else 'off':>{width}}"
+                        for key, width in (('roi_crop', 5), ('auto_resolution', 6), ('motion_gate', 6)))
+        print(f"{'yolov8' + overrides['model_size']:<8}{overrides['imgsz']:>7}{flags}"
+              f"{fps:>8.1f}{agreement(reference, statuses):>10.1%}{gate_stats['skip_ratio']:>9.1%}  {used}")
+
+
+if __name__ == '__main__':
+    main()
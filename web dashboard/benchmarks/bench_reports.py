@@ -0,0 +1,159 @@
+# bench_reports.py - Seed entry_exit_log lớn và đo thời gian các truy vấn báo cáo (trước/sau migration index)
+#
+#   python benchmarks/bench_reports.py --rows 1000000 --max-ms 500
+#
+# Schema dưới đây mô phỏng các cột mà app.py truy vấn (bảng thật do module database tạo).
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_engine  # noqa: E402
+import report_queries  # noqa: E402
+from db_access import get_database  # noqa: E402
+from db_migrations import migrate  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE entry_exit_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plate_number TEXT NOT NULL,
+    action TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    entry_time DATETIME,
+    exit_time DATETIME,
+    entry_image TEXT,
+    exit_image TEXT,
+    is_registered INTEGER DEFAULT 0,
+    parking_duration INTEGER,
+    status TEXT DEFAULT 'active'
+);
+CREATE TABLE registered_vehicles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plate_number TEXT UNIQUE NOT NULL,
+    owner_name TEXT,
+    owner_phone TEXT,
+    vehicle_type TEXT,
+    vehicle_brand TEXT,
+    vehicle_model TEXT,
+    is_active INTEGER DEFAULT 1,
+    registration_date DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+VEHICLE_TYPES = ['car', 'motorbike', 'truck', 'xe hơi', 'xe máy']
+
+
+def make_plate(i):
+    return f"{10 + i % 89}{chr(65 + i % 26)}-{i % 1000:03d}.{(i // 1000) % 100:02d}"
+
+
+def seed(db, rows, plates, registered, days):
+    rng = random.Random(42)
+    now = datetime.now().replace(microsecond=0)
+    with db.transaction() as conn:
+        conn.executescript(SCHEMA)
+        conn.executemany(
+            "INSERT INTO registered_vehicles (plate_number, owner_name, owner_phone, vehicle_type, is_active) "
+            "VALUES (?, ?, ?, ?, 1)",
+            [(make_plate(i), f"Owner {i}", f"09{i:08d}", rng.choice(VEHICLE_TYPES)) for i in range(registered)]
+        )
+
+        batch = []
+        for n in range(rows):
+            plate_id = rng.randrange(plates)
+            entry = now - timedelta(seconds=rng.randrange(days * 86400))
+            duration = rng.randrange(5, 600)
+            # ~0.5% phiên chưa ra
+            exit_time = None if rng.random() < 0.005 else entry + timedelta(minutes=duration)
+            batch.append((
+                make_plate(plate_id), 'entry', entry.isoformat(' '), entry.isoformat(' '),
+                exit_time.isoformat(' ') if exit_time else None,
+                int(plate_id < registered), duration if exit_time else None
+            ))
+            if len(batch) >= 50000:
+                conn.executemany(
+                    "INSERT INTO entry_exit_log (plate_number, action, timestamp, entry_time, exit_time, "
+                    "is_registered, parking_duration) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany(
+                "INSERT INTO entry_exit_log (plate_number, action, timestamp, entry_time, exit_time, "
+                "is_registered, parking_duration) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+
+
+def time_reports(db, ranges, repeat):
+    results = {}
+    for label, (start, end) in ranges.items():
+        for name, func in (('summary', report_queries.generate_summary_statistics_safe),
+                           ('charts', report_queries.generate_chart_data_safe),
+                           ('tables', report_queries.generate_table_data_safe),
+                           ('engine', report_engine.generate_report)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func(db, start, end)
+                timings.append((time.perf_counter() - started) * 1000)
+            results[f"{name}/{label}"] = min(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark report queries on a seeded entry_exit_log')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--plates', type=int, default=50000)
+    parser.add_argument('--registered', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-ms', type=float, default=500.0, help='ngưỡng latency cho mỗi báo cáo sau migration')
+    parser.add_argument('--skip-baseline', action='store_true', help='không đo trước khi tạo index')
+    args = parser.parse_args()
+
+    # Seed/tạo index chắc chắn vượt ngưỡng slow query - không cần log
+    logging.getLogger('db_access').setLevel(logging.ERROR)
+    logging.getLogger('report_engine').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = get_database(os.path.join(tmp, 'bench.db'))
+
+        started = time.perf_counter()
+        seed(db, args.rows, args.plates, args.registered, args.days)
+        print(f"Seeded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+        today = datetime.now()
+        ranges = {
+            '1d': (today, today),
+            '7d': (today - timedelta(days=6), today),
+            '30d': (today - timedelta(days=29), today),
+        }
+
+        baseline = {} if args.skip_baseline else time_reports(db, ranges, args.repeat)
+
+        started = time.perf_counter()
+        migrate(db)
+        print(f"Migrations applied in {time.perf_counter() - started:.1f}s")
+        indexed = time_reports(db, ranges, args.repeat)
+
+        print(f"{'report':<16}{'baseline ms':>14}{'indexed ms':>14}")
+        failures = []
+        for key, elapsed in indexed.items():
+            before = baseline.get(key)
+            print(f"{key:<16}{(f'{before:.1f}' if before is not None else '-'):>14}{elapsed:>14.1f}")
+            if elapsed > args.max_ms:
+                failures.append(key)
+
+        db.close_all()
+
+    if failures:
+        print(f"FAIL: {', '.join(failures)} slower than {args.max_ms}ms")
+        sys.exit(1)
+    print(f"OK: all reports under {args.max_ms}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,33 @@
+import atexit
 import cv2
+import os
 import torch
 import logging
 import numpy as np
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import sqlite3
 import time
 import threading
 from function.utils_rotate import deskew
-from function.helper import read_plate
-from ultralytics import YOLO
+from function.helper import format_plate
+from ocr_scheduler import get_variant_scheduler
+from plate_tracker import PlateAggregator
+from inference_service import InferenceService, JobDropped
+from frame_ring import FrameRing, read_into_ring
+from db_access import get_database
+from inference_backend import load_backend
+from motion_gate import MotionGate
+from detection_channel import get_channel
+from jpeg_encoder import get_encoder
+from plate_writer import BatchedPlateWriter
 from torchvision import transforms
 from PIL import Image, ImageEnhance
 import torch.nn as nn
 
 # ====== CÂN BẰNG HIỆU SUẤT VÀ CHẤT LƯỢNG ======
 # Biến toàn cục
-current_frame = None
+frame_ring = None  # FrameRing: frame gốc mới nhất (capture ghi tại chỗ, consumer đọc view)
 current_plate = None
 
 # CÂN BẰNG STREAMING VÀ DETECTION
@@ -432,57 +443,65 @@ def apply_aggressive_clahe(image):
     return cv2.cvtColor(processed, cv2.COLOR_LAB2BGR)
 
 
-def generate_preprocessing_variants(image, lighting_info):
-    """
-    Tạo các biến thể preprocessing dựa trên điều kiện ánh sáng
-    """
-    variants = {}
-    condition = lighting_info['condition']
+def rotate_variant(image, angle):
+    """Biến thể xoay để cứu ảnh nghiêng"""
+    (h, w) = image.shape[:2]
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+# Registry biến thể: tên -> (hàm tạo, điều kiện ánh sáng áp dụng (None = tất cả), chi phí ước tính ms)
+# Thứ tự khai báo là thứ tự mặc định khi chưa có thống kê
+VARIANT_REGISTRY = {
+    'base': (lambda img: img, None, 15.0),  # các bước sau đều tạo array mới, không cần copy
+    # Dark / low contrast
+    'high_gamma': (lambda img: adjust_gamma(img, 1.8), ('dark', 'low_contrast'), 16.0),
+    'clahe_aggressive': (apply_aggressive_clahe, ('dark', 'low_contrast'), 18.0),
+    'brightness_boost': (lambda img: cv2.convertScaleAbs(img, alpha=1.5, beta=50), ('dark', 'low_contrast'), 16.0),
+    # Bright images
+    'low_gamma': (lambda img: adjust_gamma(img, 0.6), ('overexposed', 'bright'), 16.0),
+    'tone_mapped': (tone_mapping, ('overexposed', 'bright'), 17.0),
+    'brightness_reduce': (lambda img: cv2.convertScaleAbs(img, alpha=1.0, beta=-40), ('overexposed', 'bright'), 16.0),
+    # Backlit
+    'shadow_adjusted': (lambda img: shadow_highlight_adjustment(img, 0.8, -0.5), ('backlit',), 20.0),
+    # Backlit / mixed lighting
+    'retinex': (multi_scale_retinex, ('backlit', 'mixed_lighting'), 60.0),
+    'adaptive_eq': (adaptive_histogram_equalization, ('backlit',), 18.0),
+    'edge_preserving': (lambda img: cv2.edgePreservingFilter(img, flags=1, sigma_s=50, sigma_r=0.4),
+                        ('mixed_lighting',), 45.0),
+    'local_eq': (local_histogram_equalization, ('mixed_lighting',), 18.0),
+    # Common variants for all conditions
+    'sharpened': (lambda img: unsharp_mask(img, amount=1.5), None, 17.0),
+    'bilateral': (lambda img: cv2.bilateralFilter(img, 9, 75, 75), None, 22.0),
+}
+for _ang in (-20, -12, -6, 6, 12, 20):
+    VARIANT_REGISTRY[f'rot_{_ang}'] = (lambda img, a=_ang: rotate_variant(img, a), None, 17.0)
 
-    # Base variant
-    variants['base'] = image.copy()
+VARIANT_DEFAULT_COSTS = {name: cost for name, (_, _, cost) in VARIANT_REGISTRY.items()}
 
-    if condition in ['dark', 'low_contrast']:
-        # Extra variants for dark/low contrast images
-        variants['high_gamma'] = adjust_gamma(image, 1.8)
-        variants['clahe_aggressive'] = apply_aggressive_clahe(image)
-        variants['brightness_boost'] = cv2.convertScaleAbs(image, alpha=1.5, beta=50)
 
-    elif condition in ['overexposed', 'bright']:
-        # Variants for bright images
-        variants['low_gamma'] = adjust_gamma(image, 0.6)
-        variants['tone_mapped'] = tone_mapping(image)
-        variants['brightness_reduce'] = cv2.convertScaleAbs(image, alpha=1.0, beta=-40)
+def get_ocr_scheduler():
+    """Scheduler biến thể OCR của camera1 (luôn có chi phí mặc định của VARIANT_REGISTRY)"""
+    return get_variant_scheduler('camera1', VARIANT_DEFAULT_COSTS)
 
-    elif condition == 'backlit':
-        # Variants for backlit images
-        variants['shadow_adjusted'] = shadow_highlight_adjustment(image, 0.8, -0.5)
-        variants['retinex'] = multi_scale_retinex(image)
-        variants['adaptive_eq'] = adaptive_histogram_equalization(image)
 
-    elif condition == 'mixed_lighting':
-        # Variants for mixed lighting
-        variants['retinex'] = multi_scale_retinex(image)
-        variants['edge_preserving'] = cv2.edgePreservingFilter(image, flags=1, sigma_s=50, sigma_r=0.4)
-        variants['local_eq'] = local_histogram_equalization(image)
+def get_variant_names(condition):
+    """Danh sách biến thể áp dụng cho 1 điều kiện ánh sáng (theo thứ tự registry)"""
+    return [name for name, (_, conditions, _) in VARIANT_REGISTRY.items()
+            if conditions is None or condition in conditions]
 
-    # Common variants for all conditions
-    variants['sharpened'] = unsharp_mask(image, amount=1.5)
-    variants['bilateral'] = cv2.bilateralFilter(image, 9, 75, 75)
 
-    # Common variants for all conditions ...
-    variants['sharpened'] = unsharp_mask(image, amount=1.5)
-    variants['bilateral'] = cv2.bilateralFilter(image, 9, 75, 75)
+def build_variant(name, image):
+    """Tạo 1 biến thể preprocessing theo tên"""
+    return VARIANT_REGISTRY[name][0](image)
 
-    #các biến thể xoay để cứu ảnh nghiêng
-    (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    for ang in (-20, -12, -6, 6, 12, 20):
-        M = cv2.getRotationMatrix2D(center, ang, 1.0)
-        rotated = cv2.warpAffine(image, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
-        variants[f'rot_{ang}'] = rotated
 
-    return variants
+def generate_preprocessing_variants(image, lighting_info):
+    """
+    Tạo các biến thể preprocessing dựa trên điều kiện ánh sáng
+    """
+    return {name: build_variant(name, image) for name in get_variant_names(lighting_info['condition'])}
 
 
 # ====== CUSTOM OCR FUNCTIONS ======
@@ -558,6 +577,71 @@ def two_row_sorting(annotations):
         return sorted(annotations, key=lambda x: x['x_center_px'])
 
 
+# Ngưỡng conf khi detect ký tự: LP_ocr.pt yolov5 giữ mặc định 0.25 của AutoShape như helper.read_plate cũ
+OCR_CHAR_CONF = {'yolov5': 0.25, 'yolov8': 0.15}
+
+
+def is_char_detector(model):
+    """
+    Model OCR char-detector chạy qua inference backend: LP_ocr.pt (yolov5, giải mã bằng format_plate)
+    hoặc char-detector ultralytics (yolov8, giải mã theo CLASS_MAPPING)
+    """
+    return getattr(model, 'family', None) in OCR_CHAR_CONF
+
+
+def read_plate(model, image):
+    """OCR bằng char-detector yolov5 (tương đương function.helper.read_plate, chạy qua inference backend)"""
+    return format_plate(model.detect([image])[0].rows())
+
+
+def decode_plate(model, result, img_width, img_height):
+    """Detections ký tự của 1 ảnh -> chuỗi biển số, theo family của model OCR"""
+    if model.family == 'yolov5':
+        text = format_plate(result.rows())
+        return post_process_plate_text(text) if text and text != "unknown" else "unknown"
+    return decode_char_detections(result, img_width, img_height)
+
+
+def decode_char_detections(result, img_width, img_height):
+    """Chuyển Detections của char-detector cho 1 ảnh thành chuỗi biển số"""
+    if len(result) == 0:
+        return "unknown"
+
+    annotations = []
+    for x1, y1, x2, y2, conf, class_id in result.data.tolist():
+        class_id = int(class_id)
+        if class_id not in CLASS_MAPPING:
+            continue
+
+        x_center = (x1 + x2) / 2 / img_width
+        y_center = (y1 + y2) / 2 / img_height
+        width = (x2 - x1) / img_width
+        height = (y2 - y1) / img_height
+
+        annotations.append({
+            'class_id': class_id,
+            'x_center': x_center,
+            'y_center': y_center,
+            'width': width,
+            'height': height,
+            'character': CLASS_MAPPING[class_id],
+            'confidence': conf
+        })
+
+    # Filter and sort
+    annotations = [ann for ann in annotations if ann['confidence'] > 0.25]
+    sorted_annotations = improved_character_ordering(annotations, img_width, img_height)
+
+    # Build text
+    plate_chars = []
+    for ann in sorted_annotations:
+        if ann['confidence'] > 0.20:
+            plate_chars.append(ann['character'])
+
+    plate_text = ''.join(plate_chars)
+    return post_process_plate_text(plate_text) if plate_text else "unknown"
+
+
 def process_single_variant(model, image, transform, device):
     """Process single preprocessing variant"""
     # Convert to PIL if needed
@@ -566,99 +650,182 @@ def process_single_variant(model, image, transform, device):
     else:
         image_pil = image
 
-    # Use existing custom_read_plate logic
-    if hasattr(model, 'predict'):
-        # YOLO character detection
-        results = model.predict(np.array(image_pil), conf=0.15, verbose=False)
+    if is_char_detector(model):
+        # YOLO character detection (yolov5 nhận ảnh BGR như helper.read_plate cũ, yolov8 nhận RGB)
+        model_input = image if model.family == 'yolov5' and isinstance(image, np.ndarray) else np.array(image_pil)
+        results = model.detect([model_input], conf=OCR_CHAR_CONF[model.family])
 
-        if len(results) > 0 and len(results[0].boxes) > 0:
-            # Process detections (same as original logic)
-            annotations = []
+        if len(results) > 0:
             img_width, img_height = image_pil.size
+            return decode_plate(model, results[0], img_width, img_height)
+
+    return "unknown"
+
+
+def process_variants_batched(model, images):
+    """
+    Chạy char-detector 1 lần cho cả batch biến thể (backend.detect nhận list ảnh: AutoShape yolov5 /
+    ultralytics letterbox từng ảnh về cùng imgsz và stack thành 1 tensor batch).
+    Trả về list chuỗi biển số theo đúng thứ tự ảnh đầu vào.
+    """
+    texts = []
+    for start in range(0, len(images), OCR_MAX_BATCH):
+        # Giữ cùng định dạng màu với process_single_variant (yolov5: BGR như helper.read_plate, yolov8: RGB)
+        chunk = images[start:start + OCR_MAX_BATCH]
+        if model.family != 'yolov5':
+            chunk = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in chunk]
+        results = model.detect(chunk, conf=OCR_CHAR_CONF[model.family])
 
-            for box in results[0].boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                class_id = int(box.cls[0].cpu().numpy())
-                conf = box.conf[0].cpu().numpy()
+        for img, result in zip(chunk, results):
+            img_height, img_width = img.shape[:2]
+            texts.append(decode_plate(model, result, img_width, img_height))
 
-                if class_id not in CLASS_MAPPING:
-                    continue
+    return texts
 
-                x_center = (x1 + x2) / 2 / img_width
-                y_center = (y1 + y2) / 2 / img_height
-                width = (x2 - x1) / img_width
-                height = (y2 - y1) / img_height
 
-                annotations.append({
-                    'class_id': class_id,
-                    'x_center': x_center,
-                    'y_center': y_center,
-                    'width': width,
-                    'height': height,
-                    'character': CLASS_MAPPING[class_id],
-                    'confidence': conf
-                })
+def batched_enhanced_read_plates(model, crops, camera_id='camera1'):
+    """
+    OCR cải tiến cho tất cả crop biển số của 1 frame.
+    Chạy theo từng đợt: mỗi đợt lấy OCR_STAGE_SIZE biến thể tiếp theo (theo thứ tự scheduler)
+    của mọi crop chưa chốt, gom thành 1 batch và forward 1 lần. Crop đạt
+    OCR_EARLY_EXIT_CONFIDENCE sẽ dừng, không tạo thêm biến thể.
+    """
+    if model is None or not crops:
+        return ["unknown"] * len(crops)
 
+    scheduler = get_variant_scheduler(camera_id, VARIANT_DEFAULT_COSTS)
 
+    processed_images = []
+    lighting_infos = []
+    pending_variants = []  # danh sách biến thể còn lại của từng crop
 
-            # Filter and sort
-            annotations = [ann for ann in annotations if ann['confidence'] > 0.25]
-            sorted_annotations = improved_character_ordering(annotations, img_width, img_height)
+    for crop in crops:
+        try:
+            lighting_info = analyze_lighting_conditions(crop)
+            processed_images.append(adaptive_preprocessing(crop, lighting_info))
+            condition = lighting_info['condition']
+            pending_variants.append(scheduler.order(condition, get_variant_names(condition)))
+        except Exception as e:
+            logging.error(f"Error preparing OCR variants: {e}")
+            lighting_info = None
+            processed_images.append(None)
+            pending_variants.append([])
+        lighting_infos.append(lighting_info)
+
+    best_results = ["unknown"] * len(crops)
+    best_confidence = [0] * len(crops)
+    best_variant = [None] * len(crops)
+    done = [False] * len(crops)
+
+    while True:
+        batch_images = []
+        batch_owner = []  # (crop index, variant name, build time ms)
+
+        for idx in range(len(crops)):
+            if done[idx]:
+                continue
+            stage = pending_variants[idx][:OCR_STAGE_SIZE]
+            pending_variants[idx] = pending_variants[idx][OCR_STAGE_SIZE:]
+            for variant_name in stage:
+                try:
+                    start = time.perf_counter()
+                    batch_images.append(build_variant(variant_name, processed_images[idx]))
+                    batch_owner.append((idx, variant_name, (time.perf_counter() - start) * 1000))
+                except Exception as e:
+                    logging.error(f"Error building variant {variant_name}: {e}")
+
+        if not batch_images:
+            break
 
+        try:
+            start = time.perf_counter()
+            texts = process_variants_batched(model, batch_images)
+            forward_ms = (time.perf_counter() - start) * 1000 / len(batch_images)
+        except Exception as e:
+            logging.error(f"Batched OCR error: {e}")
+            break
 
-            # Build text
-            plate_chars = []
-            for ann in sorted_annotations:
-                if ann['confidence'] > 0.20:
-                    plate_chars.append(ann['character'])
+        for (idx, variant_name, build_ms), result in zip(batch_owner, texts):
+            condition = lighting_infos[idx]['condition']
+            hit = bool(result and result != "unknown")
+            scheduler.record(condition, variant_name, build_ms + forward_ms, hit)
+            if not hit:
+                continue
 
-            plate_text = ''.join(plate_chars)
-            return post_process_plate_text(plate_text) if plate_text else "unknown"
+            confidence = calculate_plate_confidence(result, lighting_infos[idx])
+            if confidence > best_confidence[idx]:
+                best_confidence[idx] = confidence
+                best_results[idx] = result
+                best_variant[idx] = variant_name
 
+            logging.info(f"Variant {variant_name} (crop {idx}): {result} (conf: {confidence:.3f})")
 
-    return "unknown"
+        for idx in range(len(crops)):
+            if best_confidence[idx] >= OCR_EARLY_EXIT_CONFIDENCE or not pending_variants[idx]:
+                done[idx] = True
 
+    for idx, variant_name in enumerate(best_variant):
+        if variant_name:
+            scheduler.record_win(lighting_infos[idx]['condition'], variant_name)
 
-def enhanced_custom_read_plate(model, image, transform, device='cuda'):
+    return best_results
+
+
+def enhanced_custom_read_plate(model, image, transform, device='cuda', camera_id='camera1'):
     """
-    OCR cải tiến với adaptive preprocessing
+    OCR cải tiến với adaptive preprocessing.
+    Biến thể được thử theo thứ tự của scheduler và dừng sớm khi đạt OCR_EARLY_EXIT_CONFIDENCE.
     """
     try:
         if model is None:
             return "unknown"
 
+        scheduler = get_variant_scheduler(camera_id, VARIANT_DEFAULT_COSTS)
+
         # Analyze lighting conditions
         lighting_info = analyze_lighting_conditions(image)
-        logging.info(f"Lighting condition detected: {lighting_info['condition']}")
+        condition = lighting_info['condition']
+        logging.info(f"Lighting condition detected: {condition}")
 
         # Apply adaptive preprocessing
         processed_image = adaptive_preprocessing(image, lighting_info)
 
-        # Multiple preprocessing variants based on lighting
-        preprocessing_variants = generate_preprocessing_variants(processed_image, lighting_info)
-
         best_result = None
         best_confidence = 0
+        best_variant = None
 
-        # Try each variant
-        for variant_name, variant_image in preprocessing_variants.items():
+        # Try each variant (rẻ/hay thắng trước)
+        for variant_name in scheduler.order(condition, get_variant_names(condition)):
             try:
+                start = time.perf_counter()
+                variant_image = build_variant(variant_name, processed_image)
                 result = process_single_variant(model, variant_image, transform, device)
+                cost_ms = (time.perf_counter() - start) * 1000
+
+                hit = bool(result and result != "unknown")
+                scheduler.record(condition, variant_name, cost_ms, hit)
 
-                if result and result != "unknown":
+                if hit:
                     # Calculate confidence based on plate validity
                     confidence = calculate_plate_confidence(result, lighting_info)
 
                     if confidence > best_confidence:
                         best_confidence = confidence
                         best_result = result
+                        best_variant = variant_name
 
                     logging.info(f"Variant {variant_name}: {result} (conf: {confidence:.3f})")
 
+                    if best_confidence >= OCR_EARLY_EXIT_CONFIDENCE:
+                        break
+
             except Exception as e:
                 logging.error(f"Error processing variant {variant_name}: {e}")
                 continue
 
+        if best_variant:
+            scheduler.record_win(condition, best_variant)
+
         return best_result if best_result else "unknown"
 
     except Exception as e:
@@ -726,19 +893,22 @@ def custom_read_plate(model, image, transform, device='cuda'):
         # Convert back to PIL
         image_pil = Image.fromarray(image_np)
 
+        # LP_ocr.pt yolov5: giải mã bằng format_plate
+        if is_char_detector(model) and model.family == 'yolov5':
+            results = model.detect([cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)], conf=OCR_CHAR_CONF['yolov5'])
+            return decode_plate(model, results[0], image_np.shape[1], image_np.shape[0])
+
         # Nếu có YOLO character detection
-        if hasattr(model, 'predict'):
+        if is_char_detector(model):
             # Sử dụng YOLO character detection với confidence thấp hơn
-            results = model.predict(image_np, conf=0.2, verbose=False)
+            results = model.detect([image_np], conf=0.2)
 
-            if len(results) > 0 and len(results[0].boxes) > 0:
+            if len(results) > 0 and len(results[0]) > 0:
                 annotations = []
                 img_width, img_height = image_pil.size
 
-                for box in results[0].boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    class_id = int(box.cls[0].cpu().numpy())
-                    conf = box.conf[0].cpu().numpy()
+                for x1, y1, x2, y2, conf, class_id in results[0].data.tolist():
+                    class_id = int(class_id)
 
                     # Validate class_id
                     if class_id not in CLASS_MAPPING:
@@ -887,61 +1057,117 @@ ASPECT_RATIO_MAX = 7.0  # Tăng để catch biển số dài
 QUEUE_SIZE = 5
 DB_PATH = 'license_plates.db'
 
+# Batched OCR: gom biến thể của mọi detection trong 1 frame vào 1 lần forward của char-detector (LP_ocr.pt)
+OCR_BATCH_MODE = True
+OCR_MAX_BATCH = 64  # Giới hạn kích thước batch để tránh tốn RAM trên máy CPU
+
+# Early-exit: dừng thử biến thể khi confidence (calculate_plate_confidence) đạt ngưỡng
+OCR_EARLY_EXIT_CONFIDENCE = float(os.environ.get('OCR_EARLY_EXIT_CONFIDENCE', 0.9))
+OCR_STAGE_SIZE = 3  # Số biến thể / crop trong mỗi đợt batch
+
+# Bỏ phiếu biển số theo thời gian: 1 biển số được chốt cho mỗi lượt xe
+PLATE_TRACK_TIMEOUT = 3.0  # giây không thấy biển -> xe đã đi qua
+PLATE_MIN_READS = 3  # số lượt OCR cùng độ dài tối thiểu trước khi chốt
+PLATE_CONSENSUS_RATIO = 0.6  # tỉ lệ đồng thuận tối thiểu ở mỗi vị trí ký tự
+PLATE_MAX_READS = 12  # quá số lượt này thì chốt theo đa số
+
+# Inference chạy trong process riêng (0 = chạy trong web process như cũ)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 1))
+INFERENCE_QUEUE_DEPTH = 2  # frame cũ hơn bị bỏ khi worker không theo kịp
+
+# Ring frame dùng chung: 1 slot đang ghi + frame mới nhất + frame pin cho inference / capture
+FRAME_RING_SLOTS = 4
+
 # Detection intervals - CÂN BẰNG
 detection_interval = 0.5  # Giảm xuống 0.5s để detect thường xuyên hơn
 
+# Motion gate: chỉ detect khi vùng cổng có thay đổi (CAMERA1_MOTION_GATE=0 để tắt)
+MOTION_GATE_ENABLED = os.environ.get('CAMERA1_MOTION_GATE', '1') != '0'
+MOTION_GATE_ZONES = None  # polygon vùng cổng theo toạ độ frame gốc; None = cả frame
+MOTION_REFRESH_INTERVAL = 5.0  # giây - detect bắt buộc dù không có chuyển động
+motion_gate = MotionGate(MOTION_GATE_ZONES, refresh_interval=MOTION_REFRESH_INTERVAL, enabled=MOTION_GATE_ENABLED)
+
 # Biến cache
 models_loaded = False
 ocr_transform = None
 
 
+_models_lock = threading.Lock()
+WARMUP_FRAME_SHAPE = (720, 1280, 3)
+
+
+def _load_plate_detector():
+    # Backend theo INFERENCE_BACKEND (torch / onnx - xem inference_backend.py)
+    return load_backend('model/best.pt', 'yolov8', overrides={
+        'conf': 0.1,
+        'iou': 0.4,
+        'agnostic_nms': False,
+        'max_det': 20,
+        'classes': None,
+        'half': True,
+    })
+
+
+def _load_char_detector():
+    # OCR dùng YOLO char-detector; trước đây LicensePlateOCR (best_license_plate_model.pth) được load
+    # rồi bị ghi đè ngay bằng model này - bỏ bước load thừa đó
+    return load_backend('model/LP_ocr.pt', 'yolov5')
+
+
 def load_models():
-    """Load models với custom OCR"""
+    """Load 2 model song song (detect biển số + char-detector OCR)"""
     global yolo_LP_detect, yolo_license_plate, models_loaded, ocr_transform
-    if not models_loaded:
+    with _models_lock:
+        if models_loaded:
+            return
         try:
-            # Load YOLO detection model
-            yolo_LP_detect = YOLO('model/best.pt')
-            yolo_LP_detect.overrides = {
-                'conf': 0.1,
-                'iou': 0.4,
-                'agnostic_nms': False,
-                'max_det': 20,
-                'classes': None,
-                'half': True,
-            }
-
-            # Load custom OCR model
-            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            yolo_license_plate = LicensePlateOCR(num_classes=NUM_CLASSES).to(device)
-
-            # Load trained weights
-            try:
-                yolo_license_plate.load_state_dict(
-                    torch.load('model/best_license_plate_model.pth', map_location=device))
-                yolo_license_plate.eval()
-                logging.info("Custom OCR model loaded successfully from model/best_license_plate_model.pth")
-                yolo_license_plate = torch.hub.load('./yolov5', 'custom', path='model/LP_ocr.pt', source='local')
-                logging.info("Override to YOLO char-detector for OCR")
-            except FileNotFoundError:
-                logging.error("Custom OCR model file not found: model/best_license_plate_model.pth")
-                # Fallback to YOLO OCR
-                yolo_license_plate = torch.hub.load('./yolov5', 'custom', path='model/LP_ocr.pt', source='local')
-                logging.info("Fallback to YOLO OCR model")
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='camera1-load') as pool:
+                detector = pool.submit(_load_plate_detector)
+                char_detector = pool.submit(_load_char_detector)
+                yolo_LP_detect = detector.result()
+                yolo_license_plate = char_detector.result()
+            logging.info("YOLO char-detector loaded for OCR")
 
             # Setup transform
             ocr_transform = get_ocr_transform()
 
             models_loaded = True
-            logging.info("Models loaded with custom OCR configuration")
+            logging.info(f"Models loaded in {time.perf_counter() - started:.1f}s")
         except Exception as e:
             logging.error(f"Model loading error: {e}")
 
 
+def warm_up_models():
+    """Load model + chạy thử 1 lần trên frame đen để request/frame đầu tiên không phải chịu chi phí khởi tạo"""
+    load_models()
+    if not models_loaded:
+        return False
+    started = time.perf_counter()
+    multi_scale_detection_optimized(np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8))
+    crop = np.zeros((64, 192, 3), dtype=np.uint8)
+    try:
+        if is_char_detector(yolo_license_plate):
+            process_variants_batched(yolo_license_plate, [crop])
+        else:
+            read_plate(yolo_license_plate, crop)
+    except Exception as e:
+        logging.warning(f"OCR warm-up error: {e}")
+    logging.info(f"Models warmed up in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return True
+
+
+def prepare_inference():
+    """Khởi động worker inference (worker tự load + warm-up), hoặc warm-up trong process nếu không dùng worker"""
+    if get_inference_service() is not None:
+        return True
+    return warm_up_models()
+
+
 def setup_database():
     """Setup database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_database(DB_PATH).connect()
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS license_plates (
@@ -1042,34 +1268,29 @@ def multi_scale_detection_optimized(frame):
                 new_height = int(height * scale)
                 resized_frame = cv2.resize(frame, (new_width, new_height))
             else:
-                resized_frame = frame.copy()
+                resized_frame = frame  # YOLO không ghi vào input
                 scale = 1.0
 
             # Detection với confidence thấp
-            results = yolo_LP_detect(resized_frame, imgsz=size, conf=0.08, iou=0.4, max_det=15)
+            detections = yolo_LP_detect.detect([resized_frame], imgsz=size, conf=0.08, iou=0.4, max_det=15)[0]
 
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = box.conf[0].cpu().numpy()
+            for x1, y1, x2, y2, conf, _ in detections.data.tolist():
+                # Scale coordinates back
+                if scale != 1.0:
+                    x1, x2 = x1 / scale, x2 / scale
+                    y1, y2 = y1 / scale, y2 / scale
 
-                        # Scale coordinates back
-                        if scale != 1.0:
-                            x1, x2 = x1 / scale, x2 / scale
-                            y1, y2 = y1 / scale, y2 / scale
+                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
 
-                        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+                # Kiểm tra kích thước hợp lệ
+                width_det = x2 - x1
+                height_det = y2 - y1
+                area = width_det * height_det
+                aspect_ratio = width_det / height_det if height_det > 0 else 0
 
-                        # Kiểm tra kích thước hợp lệ
-                        width_det = x2 - x1
-                        height_det = y2 - y1
-                        area = width_det * height_det
-                        aspect_ratio = width_det / height_det if height_det > 0 else 0
-
-                        if (MIN_PLATE_AREA <= area <= MAX_PLATE_AREA and
-                                ASPECT_RATIO_MIN <= aspect_ratio <= ASPECT_RATIO_MAX):
-                            all_detections.append([x1, y1, x2, y2, conf, size])
+                if (MIN_PLATE_AREA <= area <= MAX_PLATE_AREA and
+                        ASPECT_RATIO_MIN <= aspect_ratio <= ASPECT_RATIO_MAX):
+                    all_detections.append([x1, y1, x2, y2, conf, size])
 
         except Exception as e:
             logging.error(f"Detection error at size {size}: {e}")
@@ -1083,6 +1304,9 @@ def enhanced_ocr_processing_with_lighting(frame, detections):
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     detections = sorted(detections, key=lambda x: x[4], reverse=True)
 
+    # 1) Cắt crop cho tối đa 3 detection tốt nhất
+    crops = []
+    crop_detections = []
     for detection in detections[:3]:
         x1, y1, x2, y2, conf, size_used = detection
 
@@ -1103,28 +1327,34 @@ def enhanced_ocr_processing_with_lighting(frame, detections):
             pass
         crop = cv2.copyMakeBorder(crop, 8, 8, 8, 8, cv2.BORDER_REPLICATE)
 
-        try:
-            # Ưu tiên path YOLO char-detector (có .predict)
-            if hasattr(yolo_license_plate, 'predict'):
-                plate_text = enhanced_custom_read_plate(yolo_license_plate, crop, ocr_transform, device)
-            else:
-                # fallback helper cũ
-                lighting = analyze_lighting_conditions(crop)
-                raw_text = read_plate(yolo_license_plate, adaptive_preprocessing(crop, lighting))
-                plate_text = post_process_plate_text(raw_text)
-
-            if plate_text and plate_text != "unknown" and is_valid_license_plate(plate_text):
-                validity = calculate_plate_validity_score(plate_text)
-                w = x2 - x1; h = y2 - y1
-                plate_type = "long" if (w / max(h, 1e-6)) > 3.0 else "square"
-                valid_plates.append({
-                    'text': plate_text, 'confidence': conf, 'bbox': [x1, y1, x2, y2],
-                    'method': 'enhanced_lighting', 'type': plate_type, 'size_used': size_used,
-                    'validity_score': validity
-                })
-        except Exception as e:
-            logging.error(f"OCR error: {e}")
-            continue
+        crops.append(crop)
+        crop_detections.append(detection)
+
+    # 2) OCR - batched (1 forward cho cả frame) hoặc tuần tự, cả 2 theo thứ tự / early-exit của scheduler
+    plate_texts = ["unknown"] * len(crops)
+    try:
+        if not is_char_detector(yolo_license_plate):
+            logging.warning("OCR char-detector not loaded, skipping OCR")
+        elif OCR_BATCH_MODE:
+            plate_texts = batched_enhanced_read_plates(yolo_license_plate, crops)
+        else:
+            plate_texts = [enhanced_custom_read_plate(yolo_license_plate, crop, ocr_transform, device)
+                           for crop in crops]
+    except Exception as e:
+        logging.error(f"OCR error: {e}")
+
+    # 3) Lọc kết quả hợp lệ
+    for detection, plate_text in zip(crop_detections, plate_texts):
+        x1, y1, x2, y2, conf, size_used = detection
+        if plate_text and plate_text != "unknown" and is_valid_license_plate(plate_text):
+            validity = calculate_plate_validity_score(plate_text)
+            w = x2 - x1; h = y2 - y1
+            plate_type = "long" if (w / max(h, 1e-6)) > 3.0 else "square"
+            valid_plates.append({
+                'text': plate_text, 'confidence': conf, 'bbox': [x1, y1, x2, y2],
+                'method': 'enhanced_lighting', 'type': plate_type, 'size_used': size_used,
+                'validity_score': validity
+            })
 
     return valid_plates
 
@@ -1191,9 +1421,156 @@ def calculate_plate_validity_score(plate_text):
     return min(score, 1.0)
 
 
-def generate_frames():
-    """Generator frames cân bằng hiệu suất và chất lượng"""
-    global current_frame, current_plate
+def track_plate_detections(all_detections, current_time):
+    """Liên kết box với track; trả về (matches, detections cần OCR) - track đã chốt / đã bỏ cuộc thì bỏ qua OCR"""
+    matches = plate_aggregator.associate(all_detections or [], current_time)
+    ocr_targets = [det for track, det in matches if track.needs_ocr]
+
+    if ocr_targets:
+        logging.info(f"Running OCR on {len(ocr_targets)}/{len(matches)} plate tracks")
+    elif not matches:
+        logging.info("No detections found")
+    return matches, ocr_targets
+
+
+def apply_plate_reads(matches, valid_plates):
+    """Đưa kết quả OCR vào track tương ứng và cập nhật current_plate"""
+    global current_plate
+
+    tracks_by_box = {tuple(det[:4]): track for track, det in matches}
+    for plate in valid_plates:
+        track = tracks_by_box.get(tuple(plate['bbox']))
+        if track is not None:
+            plate_aggregator.add_read(track, plate['text'], plate['confidence'], plate['type'])
+
+    if not valid_plates:
+        logging.info("No valid plates found after enhanced OCR")
+
+    stable_plate = plate_aggregator.current_plate()
+    if stable_plate:
+        with plate_lock:
+            current_plate = stable_plate
+
+
+def handle_inference_result(service, job):
+    """
+    Xử lý job đã xong từ inference service.
+    Trả về (job tiếp theo hoặc None, matches mới hoặc None)
+    """
+    try:
+        result = job['future'].result()
+    except JobDropped:
+        return None, None
+    except Exception as e:
+        logging.error(f"Inference error ({job['stage']}): {e}")
+        return None, None
+
+    if job['stage'] == 'detect':
+        matches, ocr_targets = track_plate_detections(result, job['time'])
+        if not ocr_targets:
+            return None, matches
+        try:
+            next_job = dict(job, stage='ocr', matches=matches,
+                            future=service.submit('ocr', job['frame'], ocr_targets,
+                                                  get_ocr_scheduler().get_settings()))
+            return next_job, matches
+        except Exception as e:
+            logging.error(f"Inference submit error: {e}")
+            return None, matches
+
+    # Thống kê biến thể OCR của worker -> scheduler của web process (/api/ocr/variant-stats)
+    get_ocr_scheduler().replay(result['variant_log'], result.get('epoch'))
+    apply_plate_reads(job['matches'], result['plates'])
+    return None, None
+
+
+def ocr_task(frame, detections, settings=None):
+    """
+    Task 'ocr' của worker process: OCR như enhanced_ocr_processing_with_lighting, kèm journal scheduler
+    để web process cập nhật thống kê; biến thể bị tắt và reset đồng bộ từ web process mỗi job (settings).
+    """
+    scheduler = get_ocr_scheduler()
+    if scheduler.journal is None:
+        scheduler.journal = []
+    if settings is not None:
+        scheduler.apply_settings(settings)
+    plates = enhanced_ocr_processing_with_lighting(frame, detections)
+    return {'plates': plates, 'variant_log': scheduler.drain_journal(), 'epoch': scheduler.epoch}
+
+
+def release_job_frame(job_frame):
+    """Bỏ pin frame của job inference (frame copy thường thì không cần làm gì)"""
+    if hasattr(job_frame, 'release'):
+        job_frame.release()
+
+
+def plate_annotations(matches):
+    """Box (toạ độ frame gốc) + biển số của các track trong lần detect hiện tại"""
+    plates = []
+    for track, det in matches:
+        text = plate_aggregator.provisional_text(track)
+        if text:
+            plates.append({'box': [int(value) for value in det[:4]], 'text': text,
+                           'locked': bool(track.locked), 'reads': len(track.reads)})
+    return plates
+
+
+# Kết quả detect gần nhất cho render_annotations / detection channel 'camera1'
+annotation_state = {'plates': [], 'frame_size': None}
+detection_channel = get_channel('camera1')
+
+
+def publish_annotations(frame, matches):
+    annotation_state['plates'] = plate_annotations(matches)
+    annotation_state['frame_size'] = [frame.shape[1], frame.shape[0]]
+    detection_channel.publish(annotation_state)
+
+
+def draw_plate_tracks(display_frame, frame_size, plates):
+    """Vẽ box + biển số (toạ độ frame gốc kích thước `frame_size` = (w, h)) lên display frame"""
+    scale_x = display_frame.shape[1] / frame_size[0]
+    scale_y = display_frame.shape[0] / frame_size[1]
+    font_scale = 0.6
+    thickness = 2
+    font = cv2.FONT_HERSHEY_SIMPLEX
+
+    for plate in plates:
+        x1, y1, x2, y2 = plate['box']
+        x1_disp = int(x1 * scale_x)
+        y1_disp = int(y1 * scale_y)
+        x2_disp = int(x2 * scale_x)
+        y2_disp = int(y2 * scale_y)
+
+        # Xanh lá: đã chốt, cam: đang bỏ phiếu
+        color = (0, 255, 0) if plate['locked'] else (0, 165, 255)
+        cv2.rectangle(display_frame, (x1_disp, y1_disp), (x2_disp, y2_disp), color, 2)
+
+        # Label với background
+        label = plate['text'] if plate['locked'] else f"{plate['text']}? ({plate['reads']})"
+        (text_width, text_height), baseline = cv2.getTextSize(label, font, font_scale, thickness)
+        cv2.rectangle(display_frame, (x1_disp, y1_disp - text_height - 8),
+                      (x1_disp + text_width, y1_disp), color, -1)
+        cv2.putText(display_frame, label, (x1_disp, y1_disp - 4),
+                    font, font_scale, (255, 255, 255), thickness)
+
+
+def render_annotations(display_frame):
+    """Vẽ kết quả detect gần nhất lên display frame (biến thể annotated của stream)"""
+    if annotation_state['frame_size']:
+        try:
+            draw_plate_tracks(display_frame, annotation_state['frame_size'], annotation_state['plates'])
+        except Exception as e:
+            logging.error(f"Drawing error: {e}")
+    return display_frame
+
+
+def produce_frames():
+    """
+    Đọc video, detect + OCR và trả về display frame (BGR) chưa vẽ; kết quả detect được publish
+    lên detection channel 'camera1' và vẽ bởi render_annotations.
+    Chỉ chạy 1 lần cho mỗi camera, được stream_hub phát cho tất cả viewer.
+    """
+    global frame_ring
 
     # Khởi tạo biến local
     local_last_detection_time = 0
@@ -1207,114 +1584,135 @@ def generate_frames():
 
     frame_count = 0
 
-    # Pre-load models
-    load_models()
+    # Inference trong worker process nếu được, nếu không thì load model tại chỗ
+    service = get_inference_service()
+    if service is None:
+        load_models()
+    pending_job = None
+    last_matches = []
     logging.info("Starting balanced detection system with enhanced lighting OCR")
 
-    while vid.isOpened():
-        ret, frame = vid.read()
-        if not ret:
-            vid.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            frame_count = 0
-            continue
-
-        frame_count += 1
-        current_time = time.time()
-
-        # Frame skipping để tăng tốc
-        if frame_count % video_frame_skip != 0:
-            continue
+    try:
+        while vid.isOpened():
+            # Decode thẳng vào slot của ring (không copy); frame là view trong shared memory
+            if frame_ring is not None:
+                ret, frame = read_into_ring(vid, frame_ring)
+            else:
+                ret, frame = vid.read()
+            if not ret:
+                vid.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                frame_count = 0
+                continue
 
-        # Resize frame cho streaming (nhưng giữ nguyên cho detection)
-        display_frame = frame.copy()
-        try:
-            height, width = display_frame.shape[:2]
-            if width > 900:  # Resize cho streaming
-                scale = 900 / width
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                display_frame = cv2.resize(display_frame, (new_width, new_height))
-        except Exception as e:
-            logging.error(f"Frame resize error: {e}")
-            continue
+            if frame_ring is None or not frame_ring.fits(frame):
+                with frame_lock:
+                    old_ring, frame_ring = frame_ring, FrameRing(frame.shape, frame.dtype, FRAME_RING_SLOTS)
+                frame_ring.write(frame)
+                if old_ring is not None:
+                    old_ring.close()
 
-        # Cập nhật current_frame
-        with frame_lock:
-            current_frame = frame.copy()  # Lưu frame gốc để detection
+            frame_count += 1
+            current_time = time.time()
 
-        # Detection với interval vừa phải
-        should_detect = (current_time - local_last_detection_time) >= detection_interval
+            # Frame skipping để tăng tốc
+            if frame_count % video_frame_skip != 0:
+                continue
 
-        if should_detect:
+            # Resize frame cho streaming (nhưng giữ nguyên cho detection)
+            # resize tạo array mới nên chỉ copy khi không cần resize
             try:
-                # Multi-scale detection trên frame gốc
-                all_detections = multi_scale_detection_optimized(frame)
-
-                if all_detections:
-                    logging.info(f"Found {len(all_detections)} potential detections")
-
-                    # Enhanced OCR processing with lighting adaptation
-                    valid_plates = enhanced_ocr_processing_with_lighting(frame, all_detections)
-
-                    if valid_plates:
-                        # Chọn plate tốt nhất theo validity score
-                        best_plate = max(valid_plates, key=lambda x: x.get('validity_score', x['confidence']))
-
-                        with plate_lock:
-                            current_plate = best_plate['text']
-
-                        logging.info(
-                            f"Best plate: {best_plate['text']} (conf: {best_plate['confidence']:.3f}, score: {best_plate.get('validity_score', 0):.3f})")
-
-                        # Save to database (async)
-                        threading.Thread(
-                            target=save_to_database_async,
-                            args=(best_plate['text'], best_plate['confidence'], best_plate['method']),
-                            daemon=True
-                        ).start()
-
-                        # Vẽ kết quả trên display frame (scale coordinates)
-                        try:
-                            scale_x = display_frame.shape[1] / frame.shape[1]
-                            scale_y = display_frame.shape[0] / frame.shape[0]
-
-                            x1, y1, x2, y2 = best_plate['bbox']
-                            x1_disp = int(x1 * scale_x)
-                            y1_disp = int(y1 * scale_y)
-                            x2_disp = int(x2 * scale_x)
-                            y2_disp = int(y2 * scale_y)
-
-                            color = (0, 255, 0) if best_plate['type'] == 'long' else (255, 0, 0)
-                            cv2.rectangle(display_frame, (x1_disp, y1_disp), (x2_disp, y2_disp), color, 2)
-
-                            # Label với background
-                            label = f"{best_plate['text']} ({best_plate['confidence']:.2f})"
-                            font_scale = 0.6
-                            thickness = 2
-                            font = cv2.FONT_HERSHEY_SIMPLEX
-
-                            (text_width, text_height), baseline = cv2.getTextSize(label, font, font_scale, thickness)
-                            cv2.rectangle(display_frame, (x1_disp, y1_disp - text_height - 8),
-                                          (x1_disp + text_width, y1_disp), color, -1)
-                            cv2.putText(display_frame, label, (x1_disp, y1_disp - 4),
-                                        font, font_scale, (255, 255, 255), thickness)
-                        except Exception as e:
-                            logging.error(f"Drawing error: {e}")
-                    else:
-                        logging.info("No valid plates found after enhanced OCR")
+                height, width = frame.shape[:2]
+                if width > 900:  # Resize cho streaming
+                    scale = 900 / width
+                    new_width = int(width * scale)
+                    new_height = int(height * scale)
+                    display_frame = cv2.resize(frame, (new_width, new_height))
                 else:
-                    logging.info("No detections found")
-
-                local_last_detection_time = current_time
+                    display_frame = frame.copy()
+            except Exception as e:
+                logging.error(f"Frame resize error: {e}")
+                continue
 
+            # Detection với interval vừa phải, chỉ khi cảnh thay đổi hoặc còn biển số đang bỏ phiếu
+            should_detect = (current_time - local_last_detection_time) >= detection_interval
+            # (job inference trước chưa xong thì không cần kiểm tra - frame này không được detect)
+            can_submit = service is None or pending_job is None or pending_job['future'].done()
+            if should_detect and can_submit and not motion_gate.check(frame, current_time):
+                should_detect = plate_aggregator.has_open_tracks()
+                if not should_detect:
+                    local_last_detection_time = current_time
+
+            if service is not None and not service.healthy:
+                logging.error("Inference workers died, switching to in-process detection")
+                service, pending_job = None, None
+                load_models()
+
+            if service is not None:
+                # Worker process: không chặn stream, kết quả được áp dụng khi có
+                if pending_job is not None and pending_job['future'].done():
+                    job_frame = pending_job['frame']
+                    if pending_job['stage'] == 'detect':
+                        motion_gate.record_inference(time.time() - pending_job['time'])
+                    pending_job, matches = handle_inference_result(service, pending_job)
+                    if matches is not None:
+                        last_matches = matches
+                    if pending_job is None:
+                        release_job_frame(job_frame)
+
+                if pending_job is None and should_detect:
+                    # Pin frame trong ring: worker đọc trực tiếp, slot không bị ghi đè tới khi xong OCR
+                    job_frame = frame_ring.pin_latest() or frame.copy()
+                    try:
+                        pending_job = {'stage': 'detect', 'frame': job_frame, 'time': current_time,
+                                       'future': service.submit('detect', job_frame)}
+                    except Exception as e:
+                        logging.error(f"Inference submit error: {e}")
+                        release_job_frame(job_frame)
+                    local_last_detection_time = current_time
+
+            elif should_detect:
+                try:
+                    # Multi-scale detection trên frame gốc
+                    detect_started = time.perf_counter()
+                    all_detections = multi_scale_detection_optimized(frame)
+                    motion_gate.record_inference(time.perf_counter() - detect_started)
+                    last_matches, ocr_targets = track_plate_detections(all_detections, current_time)
+
+                    if ocr_targets:
+                        # Enhanced OCR processing with lighting adaptation
+                        valid_plates = enhanced_ocr_processing_with_lighting(frame, ocr_targets)
+                        apply_plate_reads(last_matches, valid_plates)
+
+                    local_last_detection_time = current_time
+
+                except Exception as e:
+                    logging.error(f"Detection error: {e}")
+
+            # Kết quả lần detect gần nhất (text track đổi cả khi OCR xong - channel chỉ gửi khi khác)
+            try:
+                publish_annotations(frame, last_matches)
             except Exception as e:
-                logging.error(f"Detection error: {e}")
+                logging.error(f"Annotation publish error: {e}")
+
+            yield display_frame
+
+            # Frame timing control
+            current_frame_time = time.time()
+            if current_frame_time - last_frame_time < frame_interval:
+                time.sleep(frame_interval - (current_frame_time - last_frame_time))
+            last_frame_time = current_frame_time
+    finally:
+        if pending_job is not None:
+            release_job_frame(pending_job['frame'])
+        vid.release()
+
 
-        # Encode frame với chất lượng vừa phải
+def generate_frames():
+    """Generator MJPEG độc lập (tương thích cũ) - app.py dùng stream_hub thay thế"""
+    encoder = get_encoder()
+    for display_frame in produce_frames():
         try:
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 80]  # Tăng quality lên 80
-            _, buffer = cv2.imencode('.jpg', display_frame, encode_param)
-            frame_bytes = buffer.tobytes()
+            frame_bytes = encoder.encode(render_annotations(display_frame), 80)
 
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n\r\n')
@@ -1322,35 +1720,50 @@ def generate_frames():
             logging.error(f"Frame encoding error: {e}")
             continue
 
-        # Frame timing control
-        current_frame_time = time.time()
-        if current_frame_time - last_frame_time < frame_interval:
-            time.sleep(frame_interval - (current_frame_time - last_frame_time))
-        last_frame_time = current_frame_time
 
-    vid.release()
+# 1 thread ghi license_plates theo lô (thay cho 1 thread + 1 commit mỗi detection).
+# Tạo ở lần dùng đầu tiên (web process): worker inference import camera1 nhưng không mở DB
+_plate_writer = None
+_plate_writer_lock = threading.Lock()
+
+
+def get_plate_writer():
+    """Writer license_plates dùng chung; lần đầu tạo bảng (setup_database) rồi tạo writer"""
+    global _plate_writer
+    if _plate_writer is None:
+        with _plate_writer_lock:
+            if _plate_writer is None:
+                setup_database()
+                _plate_writer = BatchedPlateWriter(get_database(DB_PATH))
+    return _plate_writer
 
 
 def save_to_database_async(plate, confidence, method="enhanced_lighting"):
-    """Async save database"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO license_plates (plate_number, confidence, detection_method) VALUES (?, ?, ?)",
-            (plate, confidence, method)
-        )
-        conn.commit()
-        conn.close()
-        logging.info(f"Saved to DB: {plate} (conf: {confidence:.3f})")
-    except Exception as e:
-        logging.error(f"Database error: {e}")
+    """Async save database - đưa vào hàng đợi của plate_writer, không chặn"""
+    get_plate_writer().submit(plate, confidence, method)
+
+
+def on_plate_committed(plate, confidence, track):
+    """Lưu DB đúng 1 lần cho mỗi lượt xe (khi track đạt đồng thuận)"""
+    logging.info(f"Committed plate: {plate} (track {track.id}, {len(track.reads)} reads, "
+                 f"{track.frames_seen} frames)")
+    save_to_database_async(plate, confidence, "temporal_vote")
+
+
+plate_aggregator = PlateAggregator(
+    formatter=post_process_plate_text,
+    on_commit=on_plate_committed,
+    track_timeout=PLATE_TRACK_TIMEOUT,
+    min_reads=PLATE_MIN_READS,
+    consensus_ratio=PLATE_CONSENSUS_RATIO,
+    max_reads=PLATE_MAX_READS
+)
 
 
 def get_detected_plates():
     """Lấy danh sách biển số từ database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_plate_writer().db.connect()
         cursor = conn.cursor()
         cursor.execute(
             "SELECT plate_number, confidence, timestamp, detection_method FROM license_plates ORDER BY timestamp DESC LIMIT 100")
@@ -1363,12 +1776,19 @@ def get_detected_plates():
 
 
 def get_current_frame():
-    """Lấy frame hiện tại"""
-    global current_frame
+    """Lấy frame hiện tại (bản copy - dùng pin_latest_frame() để đọc không copy)"""
+    frame = pin_latest_frame()
+    if frame is None:
+        return False, None
+    with frame:
+        return True, frame.array.copy()
+
+
+def pin_latest_frame(max_age=None):
+    """Pin frame gốc mới nhất trong ring; trả về RingFrame (view read-only) hoặc None. Nhớ release()"""
     with frame_lock:
-        if current_frame is None:
-            return False, None
-        return True, current_frame.copy()
+        ring = frame_ring
+    return ring.pin_latest(max_age) if ring is not None else None
 
 
 def get_current_plate():
@@ -1378,6 +1798,50 @@ def get_current_plate():
         return current_plate
 
 
+def get_plate_tracker_stats():
+    """Thống kê bỏ phiếu biển số (số lượt OCR, số lần bỏ qua OCR, số biển đã chốt)"""
+    return plate_aggregator.get_stats()
+
+_inference_service = None
+_inference_lock = threading.Lock()
+
+
+def get_inference_service():
+    """Lazy khởi động pool worker (model/best.pt + char detector load trong từng worker)"""
+    global _inference_service
+    if INFERENCE_WORKERS <= 0:
+        return None
+    with _inference_lock:
+        if _inference_service is None or not _inference_service.healthy:
+            service = InferenceService(
+                'camera1',
+                initializer='camera1:warm_up_models',
+                tasks={
+                    'detect': 'camera1:multi_scale_detection_optimized',
+                    'ocr': 'camera1:ocr_task'
+                },
+                num_workers=INFERENCE_WORKERS,
+                queue_depth=INFERENCE_QUEUE_DEPTH
+            )
+            if not service.start():
+                logging.error("Inference workers unavailable, falling back to in-process detection")
+                return None
+            _inference_service = service
+            atexit.register(service.shutdown)
+        return _inference_service
+
+
+def get_motion_gate_stats():
+    """Tỉ lệ frame bỏ qua detection và thời gian CPU ước tính tiết kiệm được"""
+    return motion_gate.get_stats()
+
+
+def get_inference_stats():
+    """Thống kê inference service (queue wait / compute time)"""
+    return _inference_service.get_stats() if _inference_service else None
+
+
+
 def set_video_speed(speed='normal'):
     """Điều chỉnh tốc độ video"""
     global video_frame_skip, target_fps, frame_interval, detection_interval
@@ -1408,6 +1872,9 @@ def cleanup_resources():
         if yolo_license_plate is not None:
             del yolo_license_plate
         models_loaded = False
+        if _plate_writer is not None:
+            _plate_writer.flush()
+            _plate_writer.stop()
         logging.info("Resources cleaned up")
     except Exception as e:
         logging.error(f"Cleanup error: {e}")
@@ -1444,8 +1911,9 @@ def process_plate_buffer():
 
 
 def save_to_database(plate, confidence, method="manual", plate_type="auto"):
-    """Sync save function"""
+    """Sync save function - chờ lô hiện tại được ghi xong"""
     save_to_database_async(plate, confidence, method)
+    get_plate_writer().flush()
 
 
 # Add missing attributes for app.py compatibility
@@ -1456,6 +1924,3 @@ latest_detections = []
 def start_detection_threads():
     """Start detection threads - placeholder for compatibility"""
     pass
-
-# Initialize database
-setup_database()
\ No newline at end of file
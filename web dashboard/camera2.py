@@ -2,7 +2,6 @@ import cv2
 import json
 import numpy as np
 import asyncio
-from ultralytics import YOLO
 from collections import defaultdict
 from norfair import Tracker, Detection
 import logging
@@ -10,6 +9,12 @@ from datetime import datetime
 from pathlib import Path
 import time
 
+from detection_policy import DetectionPolicy, resolve_model_path
+from inference_backend import load_backend
+from motion_gate import MotionGate
+from slot_overlay import SlotOverlayRenderer
+from slot_raster import SlotRaster
+
 # Cấu hình logging
 logging.basicConfig(
     level=logging.INFO,
@@ -42,11 +47,27 @@ FONT_THICKNESS = 2
 
 
 class ParkingDetector:
-    def __init__(self, config_path):
+    overlay_numbered = False  # vẽ số thứ tự ô đỗ (EnhancedParkingDetector)
+
+    def __init__(self, config_path, overrides=None):
         self.config = self._load_config(config_path)
+        if overrides:
+            self.config.update(overrides)
         self.parking_polygons = self._load_parking_areas(self.config['parking_areas_path'])
-        self.yolo_model = YOLO(self.config['model_path'])
-        self.yolo_model.overrides['verbose'] = False
+        # Ảnh nhãn ô đỗ: gán xe vào ô bằng 1 lần tra mảng
+        self.slot_raster = SlotRaster(self.parking_polygons)
+        # "center": tâm xe nằm trong ô; "overlap": box xe phủ >= occupancy_overlap diện tích ô
+        self.occupancy_mode = self.config.get('occupancy_mode', 'center')
+        self.occupancy_overlap = self.config.get('occupancy_overlap', 0.3)
+        self.vehicle_slots = {}  # track_id -> ô chứa tâm xe (-1 = ngoài mọi ô)
+        # Layer vùng đỗ dựng sẵn, chỉ vẽ lại ô đổi trạng thái
+        self.overlay = SlotOverlayRenderer(self.parking_polygons, COLORS, numbered=self.overlay_numbered,
+                                           font=FONT, font_scale=FONT_SCALE, font_thickness=FONT_THICKNESS)
+        # Model size / imgsz / ROI theo config.json (detection_policy.py)
+        self.policy = DetectionPolicy(self.config, self.parking_polygons)
+        # torch hoặc ONNX Runtime theo INFERENCE_BACKEND
+        self.model_path = resolve_model_path(self.config)
+        self.yolo_model = load_backend(self.model_path, 'yolov8')
 
         # Khởi tạo tracker
         self.tracker = Tracker(
@@ -67,6 +88,18 @@ class ParkingDetector:
         self.buffer_size = 3
         self.confidence_threshold = 0.6
         self.smoothed_boxes = {}
+        self.current_status = {}
+        self.current_tracked = {}
+        self.frame_size = None
+
+        # Motion gate: chỉ detect khi có ô đỗ thay đổi, bắt buộc detect lại sau motion_refresh_interval giây
+        self.motion_gate = MotionGate(
+            self.parking_polygons,
+            threshold=self.config.get('motion_threshold', 0.02),
+            refresh_interval=self.config.get('motion_refresh_interval', 10.0),
+            enabled=self.config.get('motion_gate', True)
+        )
+        self.active_slots = None  # ô có thay đổi ở lần detect hiện tại (None = tất cả)
 
     def _load_config(self, path):
         with open(path, 'r') as f:
@@ -160,15 +193,30 @@ class ParkingDetector:
         # Reset tất cả về trống (xanh)
         new_status = defaultdict(lambda: "empty")
 
-        # Kiểm tra từng tracked object
-        for track_id, vehicle_info in tracked_objects.items():
-            vehicle_center = self._get_center(vehicle_info['box'][:4])
-
-            # Kiểm tra xe có trong vùng đỗ nào không
-            for i, polygon in enumerate(self.parking_polygons):
-                if self._is_inside_polygon(vehicle_center, polygon):
-                    new_status[i] = "occupied"  # Đổi thành đỏ
-                    break
+        # Ô chứa tâm của mọi tracked object trong 1 lần tra ảnh nhãn
+        track_ids = list(tracked_objects)
+        centers = [self._get_center(tracked_objects[track_id]['box'][:4]) for track_id in track_ids]
+        slots = self.slot_raster.lookup(centers)
+        self.vehicle_slots = dict(zip(track_ids, slots.tolist()))
+
+        if self.occupancy_mode == 'overlap' and track_ids:
+            boxes = [tracked_objects[track_id].get('detection_box', tracked_objects[track_id]['box'])[:4]
+                     for track_id in track_ids]
+            occupied = np.flatnonzero((self.slot_raster.coverage(boxes) >= self.occupancy_overlap).any(axis=0))
+        else:
+            occupied = np.unique(slots[slots >= 0])
+        for i in occupied.tolist():
+            new_status[i] = "occupied"  # Đổi thành đỏ
+
+        # Ô không có thay đổi (motion gate) giữ trạng thái lần detect trước
+        if self.active_slots is not None:
+            for i in range(len(self.parking_polygons)):
+                if i in self.active_slots:
+                    continue
+                if self.current_status.get(i) == "occupied":
+                    new_status[i] = "occupied"
+                else:
+                    new_status.pop(i, None)
 
         # Cập nhật trạng thái
         self.parking_status.update(new_status)
@@ -176,19 +224,8 @@ class ParkingDetector:
         return new_status
 
     def _draw_parking_areas(self, frame, status):
-        """Vẽ các vùng đỗ xe với màu tương ứng"""
-        for i, polygon in enumerate(self.parking_polygons):
-            # Lấy màu dựa trên trạng thái
-            color = COLORS[status.get(i, "empty")]
-
-            # Vẽ polygon
-            pts = np.array(polygon, np.int32)
-            cv2.polylines(frame, [pts], True, color, 3)
-
-            # Tô màu nhạt bên trong (tùy chọn)
-            overlay = frame.copy()
-            cv2.fillPoly(overlay, [pts], color)
-            cv2.addWeighted(frame, 0.8, overlay, 0.2, 0, frame)
+        """Vẽ các vùng đỗ xe với màu tương ứng (viền + tô màu nhạt bên trong, xem slot_overlay.py)"""
+        self.overlay.draw(frame, status)
 
     def _draw_tracked_vehicles(self, frame, tracked_objects):
         """Vẽ các xe được tracking"""
@@ -209,22 +246,39 @@ class ParkingDetector:
                         FONT, FONT_SCALE, (255, 255, 255), FONT_THICKNESS)
 
     def process_frame(self, frame):
-        """Xử lý frame chính"""
+        """Xử lý frame chính: detect rồi vẽ kết quả lên frame"""
+        self.detect(frame)
+        return self.render(frame)
+
+    def detect(self, frame):
+        """Cập nhật trạng thái ô đỗ / xe đang track từ frame, không vẽ; True nếu đã chạy inference"""
         try:
+            self.frame_size = [frame.shape[1], frame.shape[0]]
+            gate = self.motion_gate.check(frame)
+            if not gate:
+                # Cảnh không đổi: giữ trạng thái và xe đang track
+                return False
+            self.active_slots = None if gate.forced else set(gate.active)
+
             # YOLO detection
-            results = self.yolo_model(frame, iou=0.5, conf=self.confidence_threshold, verbose=False)
+            detect_started = time.perf_counter()
+            image, (offset_x, offset_y), imgsz = self.policy.prepare(frame)
+            detections = self.yolo_model.detect([image], imgsz=imgsz, iou=0.5, conf=self.confidence_threshold)[0]
+            self.motion_gate.record_inference(time.perf_counter() - detect_started)
 
             # Xử lý detection results
             boxes = []
             detections_for_tracker = []
 
-            if results[0].boxes is not None:
-                for box in results[0].boxes.data.tolist():
+            if len(detections):
+                for box in detections.data.tolist():
                     cls_id = int(box[5])
                     conf = box[4]
 
                     if cls_id in VEHICLE_CLASSES and conf > self.confidence_threshold:
                         x1, y1, x2, y2 = map(int, box[:4])
+                        x1, x2 = x1 + offset_x, x2 + offset_x
+                        y1, y2 = y1 + offset_y, y2 + offset_y
                         cls = VEHICLE_CLASSES[cls_id]
                         boxes.append([x1, y1, x2, y2, cls, conf])
 
@@ -234,7 +288,8 @@ class ParkingDetector:
                         detection = Detection(
                             points=np.array([[center_x, center_y]]),
                             scores=np.array([conf]),
-                            label=cls
+                            label=cls,
+                            data=(x1, y1, x2, y2)
                         )
                         detections_for_tracker.append(detection)
 
@@ -269,22 +324,41 @@ class ParkingDetector:
 
                     current_tracked[track.id] = {
                         'box': box,
+                        'detection_box': detection.data or box,  # box YOLO thật (cho occupancy_mode "overlap")
                         'class': cls,
                         'confidence': conf
                     }
 
             # Cập nhật trạng thái vùng đỗ xe
             parking_status = self._update_parking_status(current_tracked)
-
-            # Vẽ kết quả
-            self._draw_parking_areas(frame, parking_status)
-            self._draw_tracked_vehicles(frame, current_tracked)
-
-            return frame
+            self.current_status = parking_status
+            self.current_tracked = current_tracked
+            return True
 
         except Exception as e:
             logger.error(f"Error processing frame: {e}")
-            return frame
+            return False
+
+    def render(self, frame):
+        """Vẽ trạng thái hiện tại (ô đỗ, xe đang track) lên frame - tại chỗ"""
+        try:
+            self._draw_parking_areas(frame, self.current_status)
+            self._draw_tracked_vehicles(frame, self.current_tracked)
+        except Exception as e:
+            logger.error(f"Error rendering frame: {e}")
+        return frame
+
+    def get_annotations(self):
+        """Trạng thái hiện tại dạng dữ liệu cho detection_channel (toạ độ theo frame gốc)"""
+        return {
+            'frame_size': self.frame_size,
+            'slots': {i: self.current_status.get(i, 'empty') for i in range(len(self.parking_polygons))},
+            'vehicles': [
+                {'id': int(track_id), 'box': [int(v) for v in info['box'][:4]], 'class': info['class'],
+                 'confidence': round(float(info['confidence']), 2)}
+                for track_id, info in self.current_tracked.items()
+            ]
+        }
 
     async def run(self, video_path):
         """Chạy detector"""
@@ -30,6 +30,9 @@ logger = logging.getLogger(__name__)
 class EnhancedParkingDetector(OriginalParkingDetector):
     """Mở rộng ParkingDetector gốc với tính năng parking status tracking"""
 
+    # Thêm số thứ tự parking space lên vùng đỗ (layer dựng sẵn trong ParkingDetector.overlay)
+    overlay_numbered = True
+
     def __init__(self, config_path):
         # Khởi tạo class cha
         super().__init__(config_path)
@@ -212,40 +215,10 @@ class EnhancedParkingDetector(OriginalParkingDetector):
                         FONT, 0.6, (255, 255, 255), 1)
             y_offset += 25
 
-    def _draw_parking_areas(self, frame, status):
-        """Override để thêm số thứ tự parking space"""
-        for i, polygon in enumerate(self.parking_polygons):
-            # Lấy màu dựa trên trạng thái
-            color = COLORS[status.get(i, "empty")]
-
-            # Vẽ polygon
-            pts = np.array(polygon, np.int32)
-            cv2.polylines(frame, [pts], True, color, 3)
-
-            # Tô màu nhạt bên trong
-            overlay = frame.copy()
-            cv2.fillPoly(overlay, [pts], color)
-            cv2.addWeighted(frame, 0.8, overlay, 0.2, 0, frame)
-
-            # Vẽ số thứ tự parking space
-            center_x = int(np.mean([point[0] for point in polygon]))
-            center_y = int(np.mean([point[1] for point in polygon]))
-
-            # Vẽ số với background
-            text = str(i + 1)
-            text_size = cv2.getTextSize(text, FONT, FONT_SCALE, FONT_THICKNESS)[0]
-            cv2.rectangle(frame,
-                          (center_x - text_size[0] // 2 - 5, center_y - text_size[1] // 2 - 5),
-                          (center_x + text_size[0] // 2 + 5, center_y + text_size[1] // 2 + 5),
-                          (0, 0, 0), -1)
-            cv2.putText(frame, text,
-                        (center_x - text_size[0] // 2, center_y + text_size[1] // 2),
-                        FONT, FONT_SCALE, (255, 255, 255), FONT_THICKNESS)
-
-    def process_frame(self, frame):
-        """Override method process_frame để thêm thông tin parking"""
+    def render(self, frame):
+        """Override method render để thêm thông tin parking"""
         # Gọi method gốc
-        processed_frame = super().process_frame(frame)
+        processed_frame = super().render(frame)
 
         # THÊM: Vẽ thông tin parking
         self._draw_parking_info(processed_frame)
@@ -338,12 +311,8 @@ class EnhancedParkingDetector(OriginalParkingDetector):
         for track_id, vehicle_info in tracked_objects.items():
             center = self._get_center(vehicle_info['box'][:4])
 
-            # Kiểm tra xem xe có trong parking space không
-            in_parking_space = False
-            for i, polygon in enumerate(self.parking_polygons):
-                if self._is_inside_polygon(center, polygon):
-                    in_parking_space = True
-                    break
+            # Kiểm tra xem xe có trong parking space không (ô đã tra ở lớp cha)
+            in_parking_space = self.vehicle_slots.get(track_id, -1) >= 0
 
             # Chỉ theo dõi xe KHÔNG trong parking space
             # (đỗ ở lối đi, đường, v.v.)
@@ -388,10 +357,10 @@ class EnhancedParkingDetector(OriginalParkingDetector):
             cv2.arrowedLine(frame, arrow_start, arrow_end,
                             (0, 0, 255), 3, tipLength=0.3)
 
-    def process_frame(self, frame):
+    def render(self, frame):
         """Override để thêm vẽ cảnh báo vi phạm"""
-        # Xử lý frame gốc
-        processed_frame = super().process_frame(frame)
+        # Vẽ frame gốc
+        processed_frame = super().render(frame)
 
         # Vẽ cảnh báo vi phạm
         self._draw_illegal_parking_warnings(processed_frame)
@@ -410,6 +379,15 @@ class EnhancedParkingDetector(OriginalParkingDetector):
 
         return processed_frame
 
+    def get_annotations(self):
+        """Thêm vi phạm đỗ xe (vị trí, thời gian) để client tự vẽ cảnh báo"""
+        annotations = super().get_annotations()
+        annotations['violations'] = [
+            {'position': [int(v) for v in violation['position']], 'duration': violation['duration']}
+            for violation in self.illegal_detector.get_active_violations()
+        ]
+        return annotations
+
     def get_illegal_parking_stats(self):
         """Lấy thống kê vi phạm đỗ xe"""
         return {
@@ -480,12 +458,8 @@ def get_enhanced_parking_detector(config_path="config.json", enable_illegal_park
                         for track_id, vehicle_info in tracked_objects.items():
                             center = self._get_center(vehicle_info['box'][:4])
 
-                            # Check if vehicle is in parking space
-                            in_parking_space = False
-                            for i, polygon in enumerate(self.parking_polygons):
-                                if self._is_inside_polygon(center, polygon):
-                                    in_parking_space = True
-                                    break
+                            # Check if vehicle is in parking space (slot looked up by parent)
+                            in_parking_space = self.vehicle_slots.get(track_id, -1) >= 0
 
                             # Only track vehicles NOT in parking spaces
                             if not in_parking_space:
@@ -529,10 +503,10 @@ def get_enhanced_parking_detector(config_path="config.json", enable_illegal_park
                                             pos,
                                             (0, 0, 255), 3, tipLength=0.3)
 
-                    def process_frame(self, frame):
-                        """Process frame with illegal parking detection"""
-                        # Process parent frame
-                        processed_frame = super().process_frame(frame)
+                    def render(self, frame):
+                        """Render frame with illegal parking warnings"""
+                        # Render parent frame
+                        processed_frame = super().render(frame)
 
                         # Draw illegal parking warnings
                         self._draw_illegal_parking_warnings(processed_frame)
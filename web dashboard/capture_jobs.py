@@ -0,0 +1,377 @@
+# capture_jobs.py - Hàng đợi xử lý chụp ảnh xe vào/ra ở background
+#
+# /capture chỉ chụp frame + biển số rồi trả về job id; worker lần lượt chạy các bước (ghi JPEG,
+# ghi DB, gửi thông báo). Mỗi bước xong được đánh dấu, nên khi DB bị khoá job được thử lại từ đúng
+# bước bị lỗi (backoff); hết số lần thử thì job được ghi ra thư mục spool và chạy lại sau. Số lần thử
+# được lưu cùng job trong spool: quá `max_total_attempts` thì job bị đánh dấu failed.
+# Job cùng biển số chạy tuần tự theo thứ tự gửi (vào rồi mới ra), kể cả khi job trước đang nằm trong spool.
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from plate_search import plate_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 32
+DEFAULT_MAX_ATTEMPTS = 5  # mỗi lượt, hết lượt thì spool
+DEFAULT_MAX_TOTAL_ATTEMPTS = 20  # tổng qua các lần replay spool
+DEFAULT_RETRY_DELAY = 0.5  # giây, nhân đôi sau mỗi lần thử
+SPOOL_REPLAY_INTERVAL = 60.0
+HISTORY_SIZE = 500  # số job đã xong giữ lại cho /api/capture/<job_id>
+
+
+class CaptureQueueFull(Exception):
+    """Hàng đợi đầy - route trả 503 để client thử lại"""
+
+
+class RetryableError(Exception):
+    """Bước xử lý lỗi tạm thời, cần thử lại"""
+
+
+def is_retryable(error):
+    if isinstance(error, RetryableError):
+        return True
+    if isinstance(error, sqlite3.OperationalError):
+        message = str(error).lower()
+        return 'locked' in message or 'busy' in message
+    return False
+
+
+class CaptureJob:
+    __slots__ = ('id', 'action', 'plate', 'filename', 'timestamp', 'context', 'frame', 'key',
+                 'status', 'completed', 'result', 'error', 'attempts', 'ready_at',
+                 'created_at', 'finished_at')
+
+    def __init__(self, action, plate, filename, timestamp, frame=None, context=None, job_id=None,
+                 ordered=True):
+        self.id = job_id or secrets.token_hex(8)
+        self.action = action
+        self.plate = plate
+        self.filename = filename
+        self.timestamp = timestamp
+        self.context = context or {}  # dữ liệu JSON được (giờ vào, thông tin xe...) cho các bước
+        self.frame = frame  # ndarray; bước ghi ảnh xoá sau khi ghi xong
+        # ordered=False (không đọc được biển số): job không xếp hàng sau job khác
+        self.key = (plate_key(plate) if ordered else None) or self.id
+        self.status = 'queued'
+        self.completed = []
+        self.result = {}
+        self.error = None
+        self.attempts = 0
+        self.ready_at = 0.0
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'action': self.action,
+            'plate': self.plate,
+            'image': self.filename,
+            'timestamp': self.timestamp,
+            'status': self.status,
+            'completed_steps': list(self.completed),
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+    def to_spool(self):
+        return {
+            'id': self.id, 'action': self.action, 'plate': self.plate, 'filename': self.filename,
+            'timestamp': self.timestamp, 'context': self.context, 'completed': self.completed,
+            'result': self.result, 'key': self.key, 'status': self.status, 'error': self.error,
+            'attempts': self.attempts, 'created_at': self.created_at
+        }
+
+    @classmethod
+    def from_spool(cls, data):
+        job = cls(data['action'], data['plate'], data['filename'], data['timestamp'],
+                  context=data.get('context'), job_id=data['id'])
+        job.completed = list(data.get('completed', []))
+        job.result = data.get('result', {})
+        job.key = data.get('key', job.key)
+        job.status = data.get('status', 'spooled')
+        job.error = data.get('error')
+        job.attempts = data.get('attempts', 0)
+        job.created_at = data.get('created_at', job.created_at)
+        return job
+
+
+class CaptureQueue:
+    """
+    `steps`: [(tên, hàm(job))] chạy theo thứ tự; `on_finished(job)` gọi khi job xong/lỗi/được spool.
+    Hàng đợi giới hạn `max_pending` job chưa chạy: submit() raise CaptureQueueFull khi đầy.
+    """
+
+    def __init__(self, steps, num_workers=2, max_pending=DEFAULT_MAX_PENDING,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, max_total_attempts=DEFAULT_MAX_TOTAL_ATTEMPTS,
+                 retry_delay=DEFAULT_RETRY_DELAY, spool_dir=None, on_finished=None):
+        self.steps = list(steps)
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.max_total_attempts = max_total_attempts
+        self.retry_delay = retry_delay
+        self.spool_dir = spool_dir
+        self.on_finished = on_finished
+
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._active_keys = set()
+        self._spooled_keys = Counter()  # key -> số job đang nằm trong spool (chặn job cùng biển số gửi sau)
+        self._jobs = OrderedDict()  # job_id -> CaptureJob (đang chờ, đang chạy và HISTORY_SIZE job gần nhất)
+        self._workers = []
+        self._running = False
+        self._last_replay = 0.0
+        self._replay_lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'retries': 0,
+                      'rejected': 0, 'spooled': 0, 'replayed': 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self.replay_spool()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'capture-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Capture queue started: {self.num_workers} workers, max {self.max_pending} pending")
+
+    def stop(self, timeout=5.0):
+        """Dừng worker; job chưa chạy xong (đã ghi ảnh) được ghi ra spool"""
+        with self._cond:
+            self._running = False
+            leftover = list(self._pending)
+            self._pending.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+        for job in leftover:
+            self._spool(job)
+
+    def submit(self, job):
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise CaptureQueueFull(f'{len(self._pending)} capture jobs pending')
+            self._enqueue(job)
+            self.stats['submitted'] += 1
+        return job
+
+    def _enqueue(self, job, front=False):
+        if front:
+            self._pending.appendleft(job)
+        else:
+            self._pending.append(job)
+        self._jobs.pop(job.id, None)  # job replay từ spool thay bản cũ trong lịch sử
+        self._jobs[job.id] = job
+        self._cond.notify()
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    # ------------------------------------------------------------------ worker
+
+    def _next_job(self):
+        """Job đầu tiên sẵn sàng mà không có job cùng biển số đang chạy; None nếu queue dừng hoặc đến lúc replay spool"""
+        with self._cond:
+            while self._running:
+                now = time.time()
+                wait = SPOOL_REPLAY_INTERVAL
+                if self.spool_dir:
+                    wait -= now - self._last_replay
+                    if wait <= 0:
+                        return None
+                blocked = set()
+                for job in self._pending:
+                    if job.key in self._active_keys or job.key in self._spooled_keys or job.key in blocked:
+                        blocked.add(job.key)  # giữ thứ tự các job cùng biển số
+                        continue
+                    if job.ready_at > now:
+                        blocked.add(job.key)
+                        wait = min(wait, job.ready_at - now)
+                        continue
+                    self._pending.remove(job)
+                    self._active_keys.add(job.key)
+                    job.status = 'running'
+                    return job
+                self._cond.wait(wait)
+            return None
+
+    def _worker_loop(self):
+        while self._running:
+            job = self._next_job()
+            if job is not None:
+                try:
+                    self._run(job)
+                finally:
+                    with self._cond:
+                        self._active_keys.discard(job.key)
+                        self._cond.notify_all()
+            if self.spool_dir and time.time() - self._last_replay > SPOOL_REPLAY_INTERVAL:
+                self.replay_spool()
+
+    def _run(self, job):
+        for name, step in self.steps:
+            if name in job.completed:
+                continue
+            try:
+                step(job)
+            except Exception as e:
+                if is_retryable(e):
+                    self._retry(job, e)
+                else:
+                    logger.error(f"Capture job {job.id} failed at {name}: {e}", exc_info=True)
+                    job.error = f'{name}: {e}'
+                    self._finish(job, 'failed')
+                return
+            job.completed.append(name)
+        self._finish(job, 'done')
+
+    def _retry(self, job, error):
+        job.attempts += 1
+        job.error = str(error)
+        if job.attempts >= self.max_total_attempts:
+            logger.error(f"Capture job {job.id} failed after {job.attempts} attempts: {error}")
+            self._finish(job, 'failed')
+            return
+        round_attempt = job.attempts % self.max_attempts
+        if round_attempt == 0:
+            logger.warning(f"Capture job {job.id} still failing after {job.attempts} attempts ({error}), spooling")
+            self._spool(job)
+            return
+        delay = self.retry_delay * (2 ** (round_attempt - 1))
+        logger.info(f"Capture job {job.id} retry {job.attempts} in {delay:.1f}s: {error}")
+        with self._cond:
+            self.stats['retries'] += 1
+            job.status = 'retrying'
+            job.ready_at = time.time() + delay
+            self._pending.appendleft(job)  # trước các job cùng biển số gửi sau
+            self._cond.notify()
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.frame = None
+        with self._cond:
+            self.stats['completed' if status == 'done' else 'failed'] += 1
+            self._trim_history()
+        self._notify(job)
+
+    def _notify(self, job):
+        if self.on_finished:
+            try:
+                self.on_finished(job)
+            except Exception as e:
+                logger.warning(f"Capture on_finished error: {e}")
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+            del self._jobs[job_id]
+
+    # ------------------------------------------------------------------ spool
+
+    def _spool(self, job):
+        if not self.spool_dir or job.frame is not None:
+            # Chưa ghi được ảnh thì không lưu lại được (frame chỉ có trong RAM)
+            job.error = job.error or 'not persisted'
+            self._finish(job, 'failed')
+            return
+        path = os.path.join(self.spool_dir, f'{job.id}.json')
+        job.status = 'spooled'
+        with self._cond:
+            self._spooled_keys[job.key] += 1  # trước khi ghi file: replay có thể đọc file ngay
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(job.to_spool(), f, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"Cannot spool capture job {job.id}: {e}")
+            with self._cond:
+                self._release_spooled_key(job.key)
+            self._finish(job, 'failed')
+            return
+        # Bản trong RAM coi như xong (được trim khỏi lịch sử); replay tạo lại job từ file
+        job.finished_at = time.time()
+        with self._cond:
+            self.stats['spooled'] += 1
+            self._trim_history()
+        self._notify(job)
+
+    def _release_spooled_key(self, key):
+        if self._spooled_keys[key] > 1:
+            self._spooled_keys[key] -= 1
+        else:
+            del self._spooled_keys[key]
+            self._cond.notify_all()
+
+    def replay_spool(self):
+        """Đưa các job đã spool vào lại hàng đợi (bỏ qua giới hạn max_pending)"""
+        if not self._running:
+            return 0  # đang dừng: để file lại cho lần khởi động sau
+        self._last_replay = time.time()
+        if not self._replay_lock.acquire(blocking=False):
+            return 0  # worker khác đang replay
+        try:
+            if not self.spool_dir or not os.path.isdir(self.spool_dir):
+                return 0
+            return self._replay_files()
+        finally:
+            self._replay_lock.release()
+
+    def _replay_files(self):
+        jobs = []
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    job = CaptureJob.from_spool(json.load(f))
+                os.remove(path)
+            except Exception as e:
+                logger.error(f"Bad capture spool file {name}: {e}")
+                try:
+                    os.replace(path, path + '.bad')  # không đọc lại mỗi chu kỳ replay
+                except OSError:
+                    pass
+                continue
+            jobs.append(job)
+
+        # Job spool chạy trước các job cùng biển số gửi sau nó (đang bị chặn trong hàng đợi)
+        jobs.sort(key=lambda job: job.created_at, reverse=True)
+        with self._cond:
+            for job in jobs:
+                self._enqueue(job, front=True)
+                self._release_spooled_key(job.key)
+            self.stats['replayed'] += len(jobs)
+        replayed = len(jobs)
+        if replayed:
+            logger.info(f"Replayed {replayed} spooled capture jobs")
+        return replayed
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                **self.stats,
+                'pending': len(self._pending),
+                'running': len(self._active_keys),
+                'spooled_keys': len(self._spooled_keys),
+                'workers': len(self._workers),
+                'max_pending': self.max_pending
+            }
@@ -0,0 +1,286 @@
+# db_access.py - Lớp truy cập SQLite dùng chung: pool connection (WAL + pragma), đo thời gian từng query
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 8  # số connection rảnh giữ lại; lúc cao điểm mở thêm, trả về thì đóng bớt
+BUSY_TIMEOUT = 5.0
+SLOW_QUERY_MS = 200.0
+STATEMENT_CACHE_SIZE = 256  # prepared statement cache của mỗi connection
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256MB
+    "PRAGMA cache_size=-32000",  # ~32MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+_whitespace = re.compile(r'\s+')
+
+
+def _query_key(sql):
+    return _whitespace.sub(' ', sql).strip()[:160]
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor ghi lại thời gian execute vào thống kê của Database"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection._record(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection._record(sql, started)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection của pool: close() trả connection về pool thay vì đóng hẳn,
+    nên code cũ dạng `conn = ...; ...; conn.close()` vẫn dùng được.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _record(self, sql, started):
+        database = getattr(self, '_database', None)
+        if database is not None:
+            database.record_query(sql, (time.perf_counter() - started) * 1000)
+
+    def close(self):
+        database = getattr(self, '_database', None)
+        if database is None:
+            super().close()
+        else:
+            database.release(self)
+
+
+class QueryStats:
+    __slots__ = ('count', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class Database:
+    """
+    1 file SQLite: pool connection + API truy vấn chung cho mọi route.
+    Trong 1 thread, connection() lồng nhau dùng lại cùng 1 connection.
+    """
+
+    def __init__(self, path, pool_size=POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._idle = []  # LIFO: connection vừa dùng (cache còn nóng) được lấy lại trước
+        self._in_use = weakref.WeakSet()  # connection bị quên close() sẽ tự rời khỏi set khi bị GC
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._query_stats = {}
+        self.pool_stats = {'created': 0, 'reused': 0, 'discarded': 0, 'peak_in_use': 0}
+
+    # ------------------------------------------------------------------ pool
+
+    def _create(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE, factory=PooledConnection)
+        for pragma in PRAGMAS:
+            try:
+                conn.execute(pragma)
+            except sqlite3.Error as e:
+                logger.warning(f"{pragma} failed on {self.path}: {e}")
+        conn._database = self
+        return conn
+
+    def connect(self):
+        """Lấy 1 connection từ pool (gọi conn.close() để trả lại)"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.pool_stats['reused'] += 1
+
+        created = conn is None
+        if created:
+            conn = self._create()
+
+        with self._lock:
+            if created:
+                self.pool_stats['created'] += 1
+            self._in_use.add(conn)
+            self.pool_stats['peak_in_use'] = max(self.pool_stats['peak_in_use'], len(self._in_use))
+        return conn
+
+    def release(self, conn):
+        """Trả connection về pool (rollback phần chưa commit, reset row_factory)"""
+        with self._lock:
+            if conn not in self._in_use:
+                return  # close() gọi 2 lần
+            self._in_use.discard(conn)
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error as e:
+            logger.warning(f"Dropping broken connection to {self.path}: {e}")
+            sqlite3.Connection.close(conn)
+            return
+
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+            self.pool_stats['discarded'] += 1
+        sqlite3.Connection.close(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager: dùng lại connection của thread hiện tại nếu đang có"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.connect()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Commit khi thành công, rollback khi có lỗi"""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    # ------------------------------------------------------------------ repository API
+
+    def fetchone(self, sql, params=(), row_factory=None):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=(), row_factory=None):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(sql, params).fetchall()
+
+    def scalar(self, sql, params=(), default=None):
+        row = self.fetchone(sql, params)
+        return row[0] if row and row[0] is not None else default
+
+    def execute(self, sql, params=()):
+        """INSERT/UPDATE/DELETE + commit; trả về (rowcount, lastrowid)"""
+        with self.transaction() as conn:
+            cursor = conn.execute(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+
+    def executemany(self, sql, seq_of_params):
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params).rowcount
+
+    def backup_to(self, backup_path):
+        """Backup online bằng SQLite backup API (gồm cả dữ liệu còn trong WAL)"""
+        with self.connection() as conn:
+            target = sqlite3.connect(backup_path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+
+    # ------------------------------------------------------------------ metrics
+
+    def record_query(self, sql, elapsed_ms):
+        key = _query_key(sql)
+        with self._stats_lock:
+            stats = self._query_stats.get(key)
+            if stats is None:
+                stats = self._query_stats[key] = QueryStats()
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+        if elapsed_ms >= SLOW_QUERY_MS:
+            logger.warning(f"Slow query on {os.path.basename(self.path)} ({elapsed_ms:.1f}ms): {key}")
+
+    def get_stats(self, top=20):
+        with self._stats_lock:
+            queries = sorted(self._query_stats.items(), key=lambda item: item[1].total_ms, reverse=True)
+            top_queries = [{
+                'query': key,
+                'count': s.count,
+                'avg_ms': round(s.total_ms / s.count, 3),
+                'max_ms': round(s.max_ms, 3),
+                'total_ms': round(s.total_ms, 1)
+            } for key, s in queries[:top]]
+        with self._lock:
+            pool = {**self.pool_stats, 'idle': len(self._idle), 'in_use': len(self._in_use),
+                    'size': self.pool_size}
+        return {'path': self.path, 'pool': pool, 'queries': top_queries}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._query_stats.clear()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path):
+    """Lấy Database dùng chung cho 1 file SQLite (theo đường dẫn tuyệt đối)"""
+    key = os.path.abspath(path)
+    with _databases_lock:
+        if key not in _databases:
+            _databases[key] = Database(path)
+        return _databases[key]
+
+
+def get_all_db_stats(top=20):
+    with _databases_lock:
+        databases = list(_databases.values())
+    return {os.path.basename(db.path): db.get_stats(top) for db in databases}
+
+
+def close_all_databases():
+    with _databases_lock:
+        databases = list(_databases.values())
+    for db in databases:
+        db.close_all()
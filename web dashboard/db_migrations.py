@@ -0,0 +1,157 @@
+# db_migrations.py - Migration schema có version (PRAGMA user_version) cho database chính
+#
+# Bảng entry_exit_log / registered_vehicles do module database tạo; migration chỉ thêm index/rollup.
+# Migration cần bảng chưa tồn tại sẽ dừng lại (không tăng version) và được chạy lại ở lần khởi động sau.
+import argparse
+import logging
+import time
+
+import plate_search
+import report_rollups
+
+logger = logging.getLogger(__name__)
+
+# Đếm lại visit_count / last_visit của xe có biển số {plate} từ entry_exit_log (dùng idx_eel_plate_entry)
+VISIT_RECOUNT_SQL = """
+    UPDATE registered_vehicles SET
+        visit_count = (SELECT COUNT(*) FROM entry_exit_log el
+                       WHERE el.plate_number = registered_vehicles.plate_number),
+        last_visit = (SELECT MAX(el.entry_time) FROM entry_exit_log el
+                      WHERE el.plate_number = registered_vehicles.plate_number)
+    WHERE plate_number = {plate};"""
+
+# (version, mô tả, bảng bắt buộc, các câu SQL hoặc hàm(conn) trả về các câu SQL)
+MIGRATIONS = [
+    (1, 'entry_exit_log: index theo biển số, thời gian vào/ra và phiên chưa ra', ('entry_exit_log',), [
+        # Lịch sử theo biển số (search_plate, lượt vào gần nhất, top parkers)
+        "CREATE INDEX IF NOT EXISTS idx_eel_plate_entry ON entry_exit_log(plate_number, entry_time)",
+        # Báo cáo theo khoảng thời gian - covering cho COUNT/AVG trong khoảng ngày
+        "CREATE INDEX IF NOT EXISTS idx_eel_entry_time "
+        "ON entry_exit_log(entry_time, is_registered, parking_duration, plate_number)",
+        "CREATE INDEX IF NOT EXISTS idx_eel_exit_time ON entry_exit_log(exit_time) WHERE exit_time IS NOT NULL",
+        # Xe đang trong bãi (exit_time IS NULL) - partial index nhỏ, luôn nóng trong cache
+        "CREATE INDEX IF NOT EXISTS idx_eel_open_sessions "
+        "ON entry_exit_log(plate_number, entry_time, status) WHERE exit_time IS NULL",
+    ]),
+    (2, 'registered_vehicles: covering index cho JOIN theo biển số', ('registered_vehicles',), [
+        "CREATE INDEX IF NOT EXISTS idx_rv_plate_active "
+        "ON registered_vehicles(plate_number, is_active, owner_name, vehicle_type)",
+    ]),
+    (3, 'rollup theo giờ/ngày cho báo cáo (trigger + backfill)', ('entry_exit_log', 'registered_vehicles'),
+     report_rollups.migration_statements()),
+    (4, 'registered_vehicles: visit_count/last_visit denormalized + index phân trang',
+     ('entry_exit_log', 'registered_vehicles'), [
+        "ALTER TABLE registered_vehicles ADD COLUMN visit_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE registered_vehicles ADD COLUMN last_visit DATETIME",
+        VISIT_RECOUNT_SQL.format(plate='registered_vehicles.plate_number'),
+        # Keyset pagination: WHERE is_active = 1 ORDER BY registration_date DESC, rowid DESC
+        "CREATE INDEX IF NOT EXISTS idx_rv_active_registration ON registered_vehicles(is_active, registration_date)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_rv_visit_insert AFTER INSERT ON entry_exit_log
+        BEGIN
+            UPDATE registered_vehicles SET
+                visit_count = visit_count + 1,
+                last_visit = CASE WHEN last_visit IS NULL OR NEW.entry_time > last_visit
+                                  THEN NEW.entry_time ELSE last_visit END
+            WHERE plate_number = NEW.plate_number;
+        END""",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rv_visit_update AFTER UPDATE OF plate_number, entry_time ON entry_exit_log
+        WHEN OLD.plate_number IS NOT NEW.plate_number OR OLD.entry_time IS NOT NEW.entry_time
+        BEGIN {VISIT_RECOUNT_SQL.format(plate='OLD.plate_number')}{VISIT_RECOUNT_SQL.format(plate='NEW.plate_number')}
+        END""",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rv_visit_delete AFTER DELETE ON entry_exit_log
+        BEGIN {VISIT_RECOUNT_SQL.format(plate='OLD.plate_number')}
+        END""",
+        # Xe đăng ký sau khi đã có lượt vào/ra: lấy số liệu từ lịch sử
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rv_visit_register AFTER INSERT ON registered_vehicles
+        BEGIN {VISIT_RECOUNT_SQL.format(plate='NEW.plate_number')}
+        END""",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rv_visit_replate AFTER UPDATE OF plate_number ON registered_vehicles
+        WHEN OLD.plate_number IS NOT NEW.plate_number
+        BEGIN {VISIT_RECOUNT_SQL.format(plate='NEW.plate_number')}
+        END""",
+    ]),
+    (5, 'plate_key/phone_key chuẩn hoá + FTS5 trigram cho tìm kiếm xe', ('entry_exit_log', 'registered_vehicles'),
+     plate_search.migration_statements),
+    (6, 'rollup (ngày, biển số) cho số xe khác nhau và top parkers', ('entry_exit_log',),
+     report_rollups.plate_migration_statements()),
+    (7, 'plate_key chỉ bỏ dấu phân cách (không gộp ký tự dễ nhầm)', ('entry_exit_log', 'registered_vehicles'),
+     plate_search.rekey_statements),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _missing_tables(conn, tables):
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [t for t in tables if t not in existing]
+
+
+def migrate(db):
+    """Chạy các migration chưa áp dụng; trả về danh sách version vừa chạy"""
+    applied = []
+    with db.connection() as conn:
+        current = get_schema_version(conn)
+        for version, description, tables, statements in MIGRATIONS:
+            if version <= current:
+                continue
+
+            missing = _missing_tables(conn, tables)
+            if missing:
+                logger.warning(f"Migration {version} postponed, missing tables: {', '.join(missing)}")
+                break
+
+            started = time.perf_counter()
+            try:
+                if callable(statements):
+                    statements = statements(conn)
+                conn.execute("BEGIN")
+                for sql in statements:
+                    conn.execute(sql)
+                # user_version không nhận tham số bind
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Migration {version} ({description}) failed")
+                raise
+
+            applied.append(version)
+            logger.info(f"Applied migration {version}: {description} "
+                        f"({(time.perf_counter() - started) * 1000:.0f}ms)")
+
+        if applied:
+            # Cập nhật thống kê cho query planner sau khi thêm index
+            conn.execute("PRAGMA optimize")
+    return applied
+
+
+def get_status(db):
+    with db.connection() as conn:
+        current = get_schema_version(conn)
+    return {
+        'version': current,
+        'latest': MIGRATIONS[-1][0] if MIGRATIONS else 0,
+        'pending': [{'version': v, 'description': d} for v, d, _, _ in MIGRATIONS if v > current]
+    }
+
+
+if __name__ == '__main__':
+    from db_access import get_database
+
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('db_path', nargs='?', default='parking.db')
+    parser.add_argument('--status', action='store_true', help='chỉ hiển thị version hiện tại')
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    database = get_database(cli_args.db_path)
+    if not cli_args.status:
+        migrate(database)
+    print(get_status(database))
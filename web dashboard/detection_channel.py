@@ -0,0 +1,121 @@
+# detection_channel.py - Kết quả detection của mỗi camera dạng dữ liệu (Server-Sent Events)
+#
+# Dashboard xem stream raw (1 luồng JPEG không vẽ, dùng chung cho mọi view) và tự vẽ ô đỗ / box xe /
+# box biển số lên canvas. Mỗi lần detect camera publish trạng thái; channel chỉ gửi phần thay đổi
+# (delta JSON nhỏ). Client mới kết nối - hoặc bị tụt lại quá HISTORY_SIZE delta - nhận snapshot đầy đủ.
+import json
+import threading
+import time
+from collections import deque
+
+HISTORY_SIZE = 64
+KEEPALIVE_INTERVAL = 15.0
+
+
+class DetectionChannel:
+    def __init__(self, name):
+        self.name = name
+        self._cond = threading.Condition()
+        self._static = {}  # dữ liệu không đổi (polygon ô đỗ...), chỉ gửi trong snapshot
+        self._state = {}
+        self._seq = 0
+        self._history = deque(maxlen=HISTORY_SIZE)  # (seq, delta)
+        self._subscribers = 0
+        self.stats = {'published': 0, 'unchanged': 0, 'bytes': 0}
+
+    def set_static(self, **data):
+        with self._cond:
+            self._static.update(data)
+
+    @staticmethod
+    def _diff(old, new):
+        """Key đổi giá trị; 'slots' (dict ô -> trạng thái) chỉ gồm các ô đổi"""
+        delta = {}
+        for key, value in new.items():
+            previous = old.get(key)
+            if key == 'slots' and isinstance(previous, dict):
+                changed = {slot: state for slot, state in value.items() if previous.get(slot) != state}
+                changed.update({slot: None for slot in previous if slot not in value})
+                if changed:
+                    delta[key] = changed
+            elif previous != value:
+                delta[key] = value
+        return delta
+
+    def publish(self, state):
+        """Cập nhật trạng thái mới nhất (gọi ở tốc độ detect); không có gì đổi thì không gửi"""
+        state = {key: ({str(slot): value for slot, value in data.items()} if key == 'slots' else data)
+                 for key, data in state.items()}
+        with self._cond:
+            delta = self._diff(self._state, state)
+            if not delta:
+                self.stats['unchanged'] += 1
+                return
+            self._state = {**self._state, **state}
+            self._seq += 1
+            delta.update(seq=self._seq, ts=round(time.time(), 3))
+            self._history.append((self._seq, delta))
+            self.stats['published'] += 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {'camera': self.name, 'full': True, 'seq': self._seq, 'ts': round(time.time(), 3),
+                    **self._static, **self._state}
+
+    def _pending(self, last_seq):
+        """Các delta sau last_seq, hoặc None nếu đã bị đẩy khỏi history (cần snapshot)"""
+        if self._seq == last_seq:
+            return []
+        if not self._history or self._history[0][0] > last_seq + 1:
+            return None
+        return [delta for seq, delta in self._history if seq > last_seq]
+
+    def events(self, keepalive=KEEPALIVE_INTERVAL):
+        """Generator text/event-stream cho 1 client: snapshot rồi các delta"""
+        with self._cond:
+            self._subscribers += 1
+        try:
+            snapshot = self.snapshot()
+            last_seq = snapshot['seq']
+            yield self._format(snapshot)
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq != last_seq, timeout=keepalive)
+                    pending = self._pending(last_seq)
+                    if pending is None:
+                        pending = [self.snapshot()]
+                    last_seq = self._seq
+                if not pending:
+                    yield ': keepalive\n\n'
+                    continue
+                for message in pending:
+                    yield self._format(message)
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def _format(self, message):
+        data = json.dumps(message, separators=(',', ':'))
+        self.stats['bytes'] += len(data)
+        return f'event: detections\ndata: {data}\n\n'
+
+    def get_stats(self):
+        with self._cond:
+            return {**self.stats, 'seq': self._seq, 'subscribers': self._subscribers}
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def get_channel(name):
+    """Channel theo tên camera (tạo khi dùng lần đầu)"""
+    with _channels_lock:
+        if name not in _channels:
+            _channels[name] = DetectionChannel(name)
+        return _channels[name]
+
+
+def get_all_stats():
+    return {name: channel.get_stats() for name, channel in _channels.items()}
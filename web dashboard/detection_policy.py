@@ -0,0 +1,126 @@
+# detection_policy.py - Chọn model / độ phân giải / vùng ảnh cho ParkingDetector (camera2) theo config.json
+#
+#   "model_size": "n" | "s" | "m" | "l"   -> model/yolov8{size}.pt (bỏ trống thì dùng model_path)
+#   "imgsz": 640                           -> kích thước inference (cạnh dài, bội số 32)
+#   "roi_crop": true                       -> chỉ detect trong hình chữ nhật bao mọi parking polygon (+ roi_padding)
+#   "auto_resolution": false               -> cảnh ít thay đổi thì hạ imgsz dần xuống min_imgsz,
+#                                             có chuyển động thì quay lại imgsz ngay
+import logging
+import os
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_SIZES = ('n', 's', 'm', 'l')
+IMGSZ_STRIDE = 32
+CHANGE_THUMBNAIL = (64, 36)  # ảnh xám thu nhỏ để đo thay đổi giữa 2 frame
+
+DEFAULT_POLICY = {
+    'model_size': None,
+    'imgsz': 640,
+    'roi_crop': True,
+    'roi_padding': 32,
+    'auto_resolution': False,
+    'min_imgsz': 320,
+    'change_threshold': 0.01,  # trung bình |frame - frame trước| / 255 trên ảnh thu nhỏ
+    'calm_frames': 10  # số frame tĩnh liên tiếp trước khi hạ 1 bậc imgsz
+}
+
+
+def resolve_model_path(config):
+    """model/yolov8{model_size}.pt (cùng thư mục với model_path) hoặc model_path"""
+    size = config.get('model_size')
+    if not size:
+        return config['model_path']
+    if size not in MODEL_SIZES:
+        raise ValueError(f"model_size must be one of {', '.join(MODEL_SIZES)}, got {size!r}")
+    model_dir = os.path.dirname(config.get('model_path', '')) or 'model'
+    return os.path.join(model_dir, f'yolov8{size}.pt')
+
+
+def _round_imgsz(value):
+    return max(IMGSZ_STRIDE, int(round(value / IMGSZ_STRIDE)) * IMGSZ_STRIDE)
+
+
+def polygons_roi(polygons, frame_shape, padding=0):
+    """(x1, y1, x2, y2) bao mọi polygon, cộng padding và cắt theo kích thước frame"""
+    height, width = frame_shape[:2]
+    points = np.array([point for polygon in polygons for point in polygon], dtype=np.int32).reshape(-1, 2)
+    if not len(points):
+        return 0, 0, width, height
+    x1, y1 = points.min(axis=0) - padding
+    x2, y2 = points.max(axis=0) + padding
+    return max(0, int(x1)), max(0, int(y1)), min(width, int(x2)), min(height, int(y2))
+
+
+class DetectionPolicy:
+    def __init__(self, config, polygons):
+        self.settings = {**DEFAULT_POLICY, **{k: config[k] for k in DEFAULT_POLICY if k in config}}
+        self.polygons = polygons
+        self.imgsz = _round_imgsz(self.settings['imgsz'])
+        self.min_imgsz = min(self.imgsz, _round_imgsz(self.settings['min_imgsz']))
+        # Bậc độ phân giải của chế độ auto: imgsz, 3/4, 1/2 ... đến min_imgsz
+        self.levels = [self.imgsz]
+        while self.settings['auto_resolution'] and self.levels[-1] > self.min_imgsz:
+            self.levels.append(max(self.min_imgsz, _round_imgsz(self.levels[-1] * 0.75)))
+
+        self._roi = None
+        self._roi_shape = None
+        self._previous = None
+        self._calm = 0
+        self.level = 0
+        self.last_change = 0.0
+        self.frames_by_imgsz = {}
+
+    def roi(self, frame_shape):
+        """Vùng detect cho frame kích thước frame_shape (tính lại khi đổi kích thước video)"""
+        if frame_shape[:2] != self._roi_shape:
+            self._roi_shape = frame_shape[:2]
+            if self.settings['roi_crop']:
+                self._roi = polygons_roi(self.polygons, frame_shape, self.settings['roi_padding'])
+            else:
+                self._roi = (0, 0, frame_shape[1], frame_shape[0])
+            logger.info(f"Parking detection ROI {self._roi} of {frame_shape[1]}x{frame_shape[0]}")
+        return self._roi
+
+    def _measure_change(self, image):
+        thumbnail = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), CHANGE_THUMBNAIL,
+                               interpolation=cv2.INTER_AREA)
+        previous, self._previous = self._previous, thumbnail
+        if previous is None:
+            return 1.0
+        return float(cv2.absdiff(thumbnail, previous).mean()) / 255.0
+
+    def select_imgsz(self, image):
+        """imgsz cho ảnh (đã crop) hiện tại"""
+        if len(self.levels) > 1:
+            self.last_change = self._measure_change(image)
+            if self.last_change > self.settings['change_threshold']:
+                self._calm = 0
+                self.level = 0
+            else:
+                self._calm += 1
+                if self._calm >= self.settings['calm_frames'] and self.level < len(self.levels) - 1:
+                    self._calm = 0
+                    self.level += 1
+        imgsz = self.levels[self.level]
+        self.frames_by_imgsz[imgsz] = self.frames_by_imgsz.get(imgsz, 0) + 1
+        return imgsz
+
+    def prepare(self, frame):
+        """(ảnh cần detect, (offset_x, offset_y), imgsz)"""
+        x1, y1, x2, y2 = self.roi(frame.shape)
+        crop = frame[y1:y2, x1:x2]
+        return crop, (x1, y1), self.select_imgsz(crop)
+
+    def get_stats(self):
+        return {
+            **self.settings,
+            'roi': self._roi,
+            'levels': self.levels,
+            'current_imgsz': self.levels[self.level],
+            'last_change': round(self.last_change, 4),
+            'frames_by_imgsz': dict(self.frames_by_imgsz)
+        }
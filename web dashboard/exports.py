@@ -0,0 +1,247 @@
+# exports.py - Xuất dữ liệu dạng stream (CSV / XLSX, tùy chọn gzip) không giữ toàn bộ lịch sử trong RAM
+#
+# Đọc cursor theo từng trang fetchmany() và trả về từng chunk cho HTTP response chunked.
+# XLSX dùng openpyxl write-only: từng dòng được ghi thẳng ra file tạm, sau đó file được stream theo chunk.
+import csv
+import importlib.util
+import logging
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from io import StringIO
+
+from report_queries import day_range
+
+# openpyxl chỉ import khi xuất XLSX lần đầu (không làm chậm khởi động)
+XLSX_AVAILABLE = importlib.util.find_spec('openpyxl') is not None
+
+logger = logging.getLogger(__name__)
+
+FETCH_SIZE = 1000  # số dòng mỗi lần fetchmany
+CSV_CHUNK_ROWS = 500  # số dòng CSV gộp thành 1 chunk gửi đi
+FILE_CHUNK_SIZE = 64 * 1024
+
+# key -> (tiêu đề cột, biểu thức SQL); thứ tự = thứ tự cột mặc định của /download_plates
+PLATE_COLUMNS = {
+    'plate_number': ('Biển số xe', 'el.plate_number'),
+    'entry_time': ('Thời gian vào', 'el.entry_time'),
+    'exit_time': ('Thời gian ra', 'el.exit_time'),
+    'entry_image': ('Ảnh vào', 'el.entry_image'),
+    'exit_image': ('Ảnh ra', 'el.exit_image'),
+    'is_registered': ('Đã đăng ký', 'el.is_registered'),
+    'parking_duration': ('Thời gian đỗ (phút)', 'el.parking_duration'),
+    'owner_name': ('Chủ xe', 'rv.owner_name'),
+    'owner_phone': ('Số điện thoại', 'rv.owner_phone'),
+    'vehicle_type': ('Loại xe', 'rv.vehicle_type'),
+    'vehicle_brand': ('Hãng xe', 'rv.vehicle_brand'),
+    'vehicle_model': ('Mẫu xe', 'rv.vehicle_model'),
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class ExportOptions:
+    """Tham số export đã kiểm tra: khoảng ngày, cột, định dạng, gzip"""
+
+    def __init__(self, start_date=None, end_date=None, columns=None, fmt='csv', compress=False):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.columns = columns or list(PLATE_COLUMNS)
+        self.format = fmt
+        self.compress = compress
+
+    @classmethod
+    def from_args(cls, args, default_format='csv'):
+        """Đọc từ request.args; ValueError nếu tham số không hợp lệ"""
+        def parse_date(name):
+            value = args.get(name)
+            if not value:
+                return None
+            try:
+                return datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'Invalid {name} (YYYY-MM-DD)')
+
+        start_date, end_date = parse_date('start_date'), parse_date('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise ValueError('start_date must be before end_date')
+
+        columns = [c.strip() for c in args.get('columns', '').split(',') if c.strip()]
+        unknown = [c for c in columns if c not in PLATE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+        fmt = args.get('format', default_format).lower()
+        fmt = 'xlsx' if fmt in ('excel', 'xlsx') else fmt
+        if fmt not in MIMETYPES:
+            raise ValueError(f'Unsupported format: {fmt}')
+        if fmt == 'xlsx' and not XLSX_AVAILABLE:
+            raise ValueError('Excel export not available')
+
+        compress = args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        return cls(start_date, end_date, columns, fmt, compress)
+
+    @property
+    def headers(self):
+        return [PLATE_COLUMNS[c][0] for c in self.columns]
+
+    def filename(self, prefix):
+        if self.start_date or self.end_date:
+            start = self.start_date.strftime('%Y-%m-%d') if self.start_date else 'begin'
+            end = self.end_date.strftime('%Y-%m-%d') if self.end_date else 'now'
+            name = f"{prefix}_{start}_to_{end}.{self.format}"
+        else:
+            name = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{self.format}"
+        return name + '.gz' if self.compress else name
+
+    @property
+    def mimetype(self):
+        return 'application/gzip' if self.compress else MIMETYPES[self.format]
+
+
+class RowStream:
+    """
+    Iterator trên kết quả query, đọc theo trang fetchmany().
+    Query chạy ngay khi tạo (lỗi SQL trả về trước khi gửi response);
+    connection được trả về pool khi đọc hết hoặc khi response bị đóng giữa chừng.
+    """
+
+    def __init__(self, db, sql, params=(), fetch_size=FETCH_SIZE):
+        self.rows_read = 0
+        self._fetch_size = fetch_size
+        self._conn = db.connect()
+        try:
+            self._cursor = self._conn.execute(sql, params)
+        except Exception:
+            self._conn.close()
+            raise
+
+    def __iter__(self):
+        try:
+            while self._conn is not None:
+                rows = self._cursor.fetchmany(self._fetch_size)
+                if not rows:
+                    break
+                self.rows_read += len(rows)
+                yield from rows
+        finally:
+            self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._cursor.close()
+            self._conn.close()
+            self._conn = None
+
+
+def plate_log_rows(db, options):
+    """RowStream các lượt vào/ra (JOIN thông tin xe đăng ký) theo cột và khoảng ngày đã chọn"""
+    select = ', '.join(PLATE_COLUMNS[c][1] for c in options.columns)
+    where, params = [], []
+    if options.start_date:
+        where.append("el.entry_time >= ?")
+        params.append(options.start_date.strftime('%Y-%m-%d'))
+    if options.end_date:
+        where.append("el.entry_time < ?")
+        params.append(day_range(options.end_date, options.end_date)[1])
+
+    sql = f"""
+        SELECT {select}
+        FROM entry_exit_log el
+        LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY el.entry_time DESC
+    """
+    return RowStream(db, sql, params)
+
+
+def iter_csv(rows, headers, chunk_rows=CSV_CHUNK_ROWS):
+    """Sinh CSV (bytes UTF-8) theo từng chunk vài trăm dòng"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_xlsx(sheets, chunk_size=FILE_CHUNK_SIZE):
+    """
+    sheets: [(tên sheet, [dòng tiêu đề...], headers, rows)] - dòng tiêu đề in đậm, rows là iterable.
+    Workbook write-only ghi ra file tạm rồi stream file theo chunk.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    for title, title_rows, headers, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        for i, text in enumerate(title_rows):
+            cell = WriteOnlyCell(sheet, value=text)
+            cell.font = Font(bold=True, size=16 if i == 0 else 11)
+            sheet.append([cell])
+        if title_rows:
+            sheet.append([])
+        if headers:
+            header_cells = []
+            for header in headers:
+                cell = WriteOnlyCell(sheet, value=header)
+                cell.font = Font(bold=True)
+                header_cells.append(cell)
+            sheet.append(header_cells)
+        for row in rows:
+            sheet.append(list(row))
+
+    with tempfile.TemporaryFile(suffix='.xlsx', dir='exports' if os.path.isdir('exports') else None) as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def gzip_stream(chunks, level=6):
+    """Nén gzip từng chunk (không giữ toàn bộ output)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = định dạng gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def apply_compression(chunks, options):
+    return gzip_stream(chunks) if options.compress else chunks
+
+
+class ExportBody:
+    """Body cho Response: giữ nguồn dữ liệu để đóng connection khi client ngắt giữa chừng"""
+
+    def __init__(self, chunks, *sources):
+        self._chunks = chunks
+        self._sources = sources
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close:
+            close()
+        for source in self._sources:
+            source.close()
@@ -0,0 +1,243 @@
+# frame_ring.py - Ring buffer frame cấp phát sẵn trên shared memory (capture ghi tại chỗ, consumer đọc view)
+import logging
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RingFrame:
+    """
+    1 frame đã được pin trong ring: writer không ghi đè slot này cho tới khi release().
+    `array` là view read-only trỏ thẳng vào shared memory (không copy).
+    """
+
+    __slots__ = ('ring', 'slot', 'seq', 'timestamp', 'array', '_released')
+
+    def __init__(self, ring, slot, seq, timestamp, array):
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self.timestamp = timestamp
+        self.array = array
+        self._released = False
+
+    @property
+    def shm_name(self):
+        return self.ring.shm_name
+
+    @property
+    def offset(self):
+        """Vị trí byte của frame trong shared memory (cho process khác attach theo tên)"""
+        return self.ring.frame_offset(self.slot)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.ring.unpin(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameRing:
+    """
+    Ring N slot kích thước cố định trên 1 block shared memory.
+    - Writer: begin_write() lấy view của slot trống -> decode/ghi trực tiếp vào đó -> commit().
+    - Reader: pin_latest() trả về RingFrame (view read-only), slot đang pin không bị ghi đè.
+    Mỗi frame commit có sequence number tăng dần để consumer biết frame đã đổi hay chưa.
+    Sau close() ring không nhận pin / ghi mới; shared memory chỉ được unlink khi mọi pin đã release
+    (job inference đang chờ vẫn attach được theo tên).
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=4, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        # Header: seq (int64) + timestamp (float64) của từng slot
+        self.header_bytes = slots * 16
+        self._shm = shared_memory.SharedMemory(create=True, name=name,
+                                               size=self.header_bytes + slots * self.frame_bytes)
+        self._shm_name = self._shm.name
+        self._seqs = np.ndarray((slots,), dtype=np.int64, buffer=self._shm.buf)
+        self._times = np.ndarray((slots,), dtype=np.float64, buffer=self._shm.buf, offset=slots * 8)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf,
+                                  offset=self.header_bytes)
+        self._seqs[:] = -1
+        self._times[:] = 0
+
+        self._lock = threading.Lock()
+        self._pins = [0] * slots
+        self._seq = 0
+        self._latest = -1
+        self._writing = -1
+        self._next = 0
+        self._closed = False
+        self.frames_written = 0
+        self.writes_skipped = 0  # không còn slot trống (tất cả đang bị pin)
+
+    @property
+    def shm_name(self):
+        return self._shm_name
+
+    def frame_offset(self, slot):
+        return self.header_bytes + slot * self.frame_bytes
+
+    def fits(self, frame):
+        return frame is not None and frame.shape == self.shape and frame.dtype == self.dtype
+
+    # ------------------------------------------------------------------ writer
+
+    def begin_write(self):
+        """Trả về (slot, view ghi được) hoặc (None, None) nếu mọi slot đang bận"""
+        with self._lock:
+            if self._closed:
+                return None, None
+            for i in range(self.slots):
+                slot = (self._next + i) % self.slots
+                if slot != self._latest and self._pins[slot] == 0:
+                    self._next = (slot + 1) % self.slots
+                    self._writing = slot
+                    self._seqs[slot] = -1  # đánh dấu đang ghi
+                    return slot, self._frames[slot]
+            self.writes_skipped += 1
+            return None, None
+
+    def commit(self, slot):
+        """Công bố slot vừa ghi xong là frame mới nhất"""
+        with self._lock:
+            if self._closed:
+                self._writing = -1
+                self._release_if_unused()
+                return None
+            self._seq += 1
+            self._times[slot] = time.time()
+            self._seqs[slot] = self._seq
+            self._latest = slot
+            self._writing = -1
+            self.frames_written += 1
+            return self._seq
+
+    def abort(self, slot):
+        with self._lock:
+            if self._writing == slot:
+                self._writing = -1
+            if self._closed:
+                self._release_if_unused()
+
+    def write(self, frame):
+        """Ghi 1 frame đã có sẵn (1 lần copy) - dùng khi nguồn không decode tại chỗ được"""
+        slot, view = self.begin_write()
+        if slot is None:
+            return None
+        view[...] = frame
+        return self.commit(slot)
+
+    # ------------------------------------------------------------------ reader
+
+    def _view(self, slot):
+        view = self._frames[slot].view()
+        view.flags.writeable = False
+        return view
+
+    def pin(self, slot):
+        """Pin 1 slot đã commit (vd: frame đang gửi cho inference)"""
+        with self._lock:
+            if self._closed:
+                return None
+            seq = int(self._seqs[slot])
+            if seq < 0:
+                return None
+            self._pins[slot] += 1
+            return RingFrame(self, slot, seq, float(self._times[slot]), self._view(slot))
+
+    def pin_latest(self, max_age=None):
+        """Pin frame mới nhất; None nếu chưa có frame hoặc frame cũ hơn max_age giây"""
+        with self._lock:
+            slot = self._latest
+            if self._closed or slot < 0:
+                return None
+            if max_age is not None and time.time() - self._times[slot] > max_age:
+                return None
+            self._pins[slot] += 1
+            return RingFrame(self, slot, int(self._seqs[slot]), float(self._times[slot]), self._view(slot))
+
+    def unpin(self, slot):
+        with self._lock:
+            if self._pins[slot] > 0:
+                self._pins[slot] -= 1
+            if self._closed:
+                self._release_if_unused()
+
+    @property
+    def latest_seq(self):
+        return self._seq
+
+    # ------------------------------------------------------------------ lifecycle
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """Ngừng nhận pin / ghi; giải phóng shared memory ngay hoặc khi pin cuối cùng được release"""
+        with self._lock:
+            self._closed = True
+            self._release_if_unused()
+
+    def _release_if_unused(self):
+        # Gọi khi đang giữ _lock; slot đang pin hoặc đang ghi dở thì chờ
+        if self._shm is None or any(self._pins) or self._writing >= 0:
+            return
+        shm, self._shm = self._shm, None
+        self._seqs = self._times = self._frames = None
+        try:
+            shm.unlink()
+            shm.close()  # lỗi nếu vẫn còn view (RingFrame.array) được giữ; mapping tự giải phóng sau
+        except Exception as e:
+            logger.warning(f"Error releasing frame ring: {e}")
+
+    def get_stats(self):
+        """Thống kê ring; None nếu đã close"""
+        with self._lock:
+            if self._closed:
+                return None
+            return {
+                'shape': list(self.shape),
+                'slots': self.slots,
+                'latest_seq': self._seq,
+                'pinned_slots': sum(1 for p in self._pins if p),
+                'frames_written': self.frames_written,
+                'writes_skipped': self.writes_skipped,
+                'latest_age': round(float(time.time() - self._times[self._latest]), 3) if self._latest >= 0 else None
+            }
+
+
+def read_into_ring(vid, ring):
+    """
+    Decode 1 frame từ cv2.VideoCapture thẳng vào slot trống của ring.
+    Trả về (ret, frame) với frame là view trong ring (hoặc frame thường nếu ring hết slot/khác kích thước).
+    """
+    slot, view = ring.begin_write()
+    if slot is None:
+        return vid.read()
+
+    ret, frame = vid.read(view)
+    if not ret:
+        ring.abort(slot)
+        return ret, frame
+    if frame is not view and not np.shares_memory(frame, view):
+        # OpenCV cấp phát lại (kích thước frame thay đổi) -> không dùng slot
+        ring.abort(slot)
+        return ret, frame
+
+    ring.commit(slot)
+    return ret, view
@@ -13,9 +13,12 @@ def check_point_linear(x, y, x1, y1, x2, y2):
 
 # detect character and number in license plate
 def read_plate(yolo_license_plate, im):
-    LP_type = "1"
     results = yolo_license_plate(im)
-    bb_list = results.pandas().xyxy[0].values.tolist()
+    return format_plate(results.pandas().xyxy[0].values.tolist())
+
+# sort character boxes [x1, y1, x2, y2, conf, cls, name] into plate string
+def format_plate(bb_list):
+    LP_type = "1"
     if len(bb_list) == 0 or len(bb_list) < 7 or len(bb_list) > 10:
         return "unknown"
     center_list = []
@@ -41,7 +44,6 @@ def read_plate(yolo_license_plate, im):
                 LP_type = "2"
 
     y_mean = int(int(y_sum) / len(bb_list))
-    size = results.pandas().s
 
     # 1 line plates and 2 line plates
     line_1 = []
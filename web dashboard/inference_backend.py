@@ -0,0 +1,307 @@
+# inference_backend.py - Backend chạy model YOLO: PyTorch (ultralytics / torch.hub yolov5) hoặc ONNX Runtime
+#
+# Mọi backend có cùng API: detect(images, imgsz, conf, iou, max_det, classes) -> [Detections]
+# (mảng numpy [x1, y1, x2, y2, conf, cls] theo toạ độ ảnh gốc), nên camera1 / camera2 không phụ thuộc
+# vào kiểu Results của từng thư viện.
+#
+# Chọn backend bằng biến môi trường INFERENCE_BACKEND=torch|onnx. Với onnx, file <weights>.onnx
+# (+ <weights>.onnx.json) phải được export trước; không có thì tự quay về PyTorch.
+#
+#   python inference_backend.py export model/best.pt --family yolov8
+#   python inference_backend.py export model/LP_ocr.pt --family yolov5 --int8
+#   python inference_backend.py export yolov8l.pt --family yolov8
+#
+# ONNX Runtime: INFERENCE_THREADS (intra-op, mặc định = số core / số worker), INFERENCE_PROVIDERS
+# (vd. "OpenVINOExecutionProvider,CPUExecutionProvider" nếu cài onnxruntime-openvino).
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FAMILIES = ('yolov8', 'yolov5')  # yolov8 = ultralytics YOLO(), yolov5 = torch.hub './yolov5'
+DEFAULT_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch').lower()
+LETTERBOX_COLOR = (114, 114, 114)
+MAX_WH = 7680  # offset theo class để NMS từng class trong 1 lần gọi
+
+
+class Detections:
+    """Kết quả 1 ảnh: data (N, 6) float32 = [x1, y1, x2, y2, conf, cls]"""
+    __slots__ = ('data', 'names')
+
+    def __init__(self, data, names=None):
+        self.data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        self.names = names or {}
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5].astype(int)
+
+    def rows(self):
+        """[x1, y1, x2, y2, conf, cls, name] - giống results.pandas().xyxy của yolov5"""
+        return [[*row[:5], int(row[5]), self.names.get(int(row[5]), str(int(row[5])))]
+                for row in self.data.tolist()]
+
+
+def _names_dict(names):
+    return dict(enumerate(names)) if isinstance(names, (list, tuple)) else dict(names)
+
+
+class InferenceBackend:
+    name = 'base'
+
+    def __init__(self, family, names=None):
+        self.family = family
+        self.names = names or {}
+        self.calls = 0
+        self.images = 0
+        self.total_ms = 0.0
+
+    def detect(self, images, imgsz=640, conf=0.25, iou=0.45, max_det=300, classes=None):
+        started = time.perf_counter()
+        results = self._detect(list(images), imgsz, conf, iou, max_det, classes)
+        self.calls += 1
+        self.images += len(results)
+        self.total_ms += (time.perf_counter() - started) * 1000
+        return results
+
+    def _detect(self, images, imgsz, conf, iou, max_det, classes):
+        raise NotImplementedError
+
+    def get_stats(self):
+        return {
+            'backend': self.name,
+            'family': self.family,
+            'calls': self.calls,
+            'images': self.images,
+            'avg_ms_per_image': round(self.total_ms / self.images, 2) if self.images else None
+        }
+
+
+class UltralyticsBackend(InferenceBackend):
+    """YOLO() của ultralytics (.pt); ảnh BGR như OpenCV"""
+    name = 'torch'
+
+    def __init__(self, weights, overrides=None):
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+        if overrides:
+            self.model.overrides.update(overrides)
+        self.model.overrides['verbose'] = False
+        super().__init__('yolov8', _names_dict(self.model.names))
+
+    def _detect(self, images, imgsz, conf, iou, max_det, classes):
+        results = self.model.predict(images, imgsz=imgsz, conf=conf, iou=iou, max_det=max_det,
+                                     classes=classes, verbose=False)
+        return [Detections(r.boxes.data.cpu().numpy() if r.boxes is not None else (), self.names)
+                for r in results]
+
+
+class Yolov5HubBackend(InferenceBackend):
+    """Model torch.hub './yolov5' (AutoShape); ảnh numpy được coi là RGB giống khi gọi model(im)"""
+    name = 'torch'
+
+    def __init__(self, weights, repo='./yolov5'):
+        import torch
+        self.model = torch.hub.load(repo, 'custom', path=weights, source='local')
+        super().__init__('yolov5', _names_dict(self.model.names))
+
+    def _detect(self, images, imgsz, conf, iou, max_det, classes):
+        self.model.conf, self.model.iou, self.model.max_det, self.model.classes = conf, iou, max_det, classes
+        results = self.model(images, size=imgsz)
+        return [Detections(pred.cpu().numpy(), self.names) for pred in results.xyxy]
+
+
+def letterbox(image, imgsz, stride=32):
+    """Resize giữ tỉ lệ + pad về bội số stride (giống letterbox auto=True của YOLO); trả về (ảnh, ratio, (pad_x, pad_y))"""
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    pad_x = ((imgsz - new_width) % stride) / 2
+    pad_y = ((imgsz - new_height) % stride) / 2
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return image, ratio, (left, top)
+
+
+def postprocess(output, family, conf, iou, max_det, classes=None):
+    """
+    Output thô của 1 ảnh -> (N, 6) [x1, y1, x2, y2, conf, cls] theo toạ độ ảnh đã letterbox.
+    yolov8: (4 + nc, anchors), không có objectness; yolov5: (anchors, 5 + nc).
+    """
+    if family == 'yolov8':
+        predictions = output.T
+        boxes, class_scores = predictions[:, :4], predictions[:, 4:]
+    else:
+        predictions = output
+        boxes, class_scores = predictions[:, :4], predictions[:, 5:] * predictions[:, 4:5]
+
+    class_ids = class_scores.argmax(1)
+    scores = class_scores[np.arange(len(class_scores)), class_ids]
+    keep = scores > conf
+    if classes is not None:
+        keep &= np.isin(class_ids, classes)
+    boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+    if not len(boxes):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    xyxy = np.empty_like(boxes)
+    xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+    xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+    xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+    xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+
+    # NMS từng class: dời box theo class id để các class không chồng lên nhau
+    offset = class_ids[:, None].astype(np.float32) * MAX_WH
+    shifted = xyxy + offset
+    nms_boxes = np.concatenate([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]], axis=1)
+    indices = cv2.dnn.NMSBoxes(nms_boxes.tolist(), scores.tolist(), conf, iou)
+    indices = np.array(indices, dtype=int).reshape(-1)
+    indices = indices[np.argsort(-scores[indices])][:max_det]
+    return np.concatenate([xyxy[indices], scores[indices, None], class_ids[indices, None]], axis=1)
+
+
+class OnnxBackend(InferenceBackend):
+    """Model ONNX (export bởi export_onnx) chạy bằng ONNX Runtime; tiền/hậu xử lý bằng numpy/OpenCV"""
+    name = 'onnx'
+
+    def __init__(self, onnx_path, threads=None, providers=None):
+        import onnxruntime as ort
+
+        with open(onnx_path + '.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        super().__init__(meta['family'], {int(k): v for k, v in meta['names'].items()})
+        self.stride = meta.get('stride', 32)
+        self.input_bgr = meta['family'] == 'yolov8'  # ultralytics đổi BGR -> RGB, AutoShape yolov5 thì không
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads or int(os.environ.get('INFERENCE_THREADS', 0)) or _default_threads()
+        options.inter_op_num_threads = 1
+
+        available = ort.get_available_providers()
+        wanted = providers or [p for p in os.environ.get('INFERENCE_PROVIDERS', '').split(',') if p]
+        self.providers = [p for p in wanted if p in available] or ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+        logger.info(f"ONNX model {os.path.basename(onnx_path)} loaded ({', '.join(self.providers)}, "
+                    f"{options.intra_op_num_threads} threads)")
+
+    def _detect(self, images, imgsz, conf, iou, max_det, classes):
+        results = []
+        for image in images:
+            padded, ratio, (pad_x, pad_y) = letterbox(image, imgsz, self.stride)
+            if self.input_bgr:
+                padded = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB)
+            blob = np.ascontiguousarray(padded.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+            output = self.session.run(None, {self.input_name: blob})[0][0]
+
+            data = postprocess(output, self.family, conf, iou, max_det, classes)
+            if len(data):
+                data[:, [0, 2]] = ((data[:, [0, 2]] - pad_x) / ratio).clip(0, image.shape[1])
+                data[:, [1, 3]] = ((data[:, [1, 3]] - pad_y) / ratio).clip(0, image.shape[0])
+            results.append(Detections(data, self.names))
+        return results
+
+    def get_stats(self):
+        return {**super().get_stats(), 'providers': self.providers}
+
+
+def _default_threads():
+    workers = max(1, int(os.environ.get('INFERENCE_WORKERS', 1)))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def load_backend(weights, family, backend=None, overrides=None):
+    """Backend cho file weights .pt; backend=None lấy theo INFERENCE_BACKEND"""
+    if family not in FAMILIES:
+        raise ValueError(f"Unknown model family: {family}")
+    backend = (backend or DEFAULT_BACKEND).lower()
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+
+    if backend == 'onnx':
+        if os.path.exists(onnx_path) and os.path.exists(onnx_path + '.json'):
+            try:
+                return OnnxBackend(onnx_path)
+            except ImportError:
+                logger.warning("onnxruntime not installed, using PyTorch backend")
+        else:
+            logger.warning(f"{onnx_path} not found (run: python inference_backend.py export {weights} "
+                           f"--family {family}), using PyTorch backend")
+
+    if family == 'yolov8':
+        return UltralyticsBackend(weights, overrides)
+    return Yolov5HubBackend(weights)
+
+
+# ---------------------------------------------------------------------- export
+
+def export_onnx(weights, family, imgsz=640, opset=12, int8=False):
+    """.pt -> .onnx (batch 1, H/W động) + file .json metadata; int8=True lượng tử hoá dynamic INT8"""
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+    started = time.perf_counter()
+
+    if family == 'yolov8':
+        from ultralytics import YOLO
+        model = YOLO(weights)
+        exported = model.export(format='onnx', imgsz=imgsz, opset=opset, dynamic=True, simplify=True)
+        names, stride = _names_dict(model.names), int(max(model.model.stride))
+        if os.path.abspath(exported) != os.path.abspath(onnx_path):
+            os.replace(exported, onnx_path)
+    else:
+        # export.py của repo yolov5 local (cùng phiên bản với torch.hub.load('./yolov5'))
+        subprocess.run([sys.executable, os.path.join('yolov5', 'export.py'), '--weights', weights,
+                        '--include', 'onnx', '--imgsz', str(imgsz), '--opset', str(opset), '--dynamic'],
+                       check=True)
+        model = Yolov5HubBackend(weights)
+        names, stride = model.names, int(max(model.model.stride))
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        fp32_path = onnx_path.replace('.onnx', '.fp32.onnx')
+        os.replace(onnx_path, fp32_path)
+        quantize_dynamic(fp32_path, onnx_path, weight_type=QuantType.QUInt8)
+
+    with open(onnx_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'family': family, 'names': names, 'stride': stride, 'imgsz': imgsz, 'int8': int8,
+                   'source': os.path.basename(weights)}, f, ensure_ascii=False, indent=2)
+    logger.info(f"Exported {weights} -> {onnx_path}{' (INT8)' if int8 else ''} "
+                f"in {time.perf_counter() - started:.1f}s")
+    return onnx_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export YOLO weights to ONNX for the ONNX Runtime backend')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export')
+    export_parser.add_argument('weights')
+    export_parser.add_argument('--family', choices=FAMILIES, required=True)
+    export_parser.add_argument('--imgsz', type=int, default=640)
+    export_parser.add_argument('--opset', type=int, default=12)
+    export_parser.add_argument('--int8', action='store_true', help='dynamic INT8 quantization')
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    export_onnx(cli_args.weights, cli_args.family, cli_args.imgsz, cli_args.opset, cli_args.int8)
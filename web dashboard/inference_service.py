@@ -0,0 +1,396 @@
+# inference_service.py - Pool process chạy YOLO/OCR ngoài web process (tránh tranh GIL với Flask/SocketIO)
+#
+# Web process chỉ ghi frame vào shared memory và gửi job; worker process load model 1 lần,
+# đọc frame trực tiếp từ shared memory rồi trả kết quả (list/dict nhỏ) qua pipe.
+import argparse
+import importlib
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MAX_FRAME_BYTES = 1920 * 1080 * 3
+WORKER_START_TIMEOUT = 120.0  # load model trên CPU có thể mất khá lâu
+# Segment FrameRing worker giữ attach (ring cũ bị thay khi camera đổi độ phân giải / khởi động lại):
+# quá số này thì đóng segment ít dùng nhất, để ring đã đóng không còn map trong worker
+MAX_RING_SEGMENTS = 2
+
+
+class JobDropped(Exception):
+    """Job bị bỏ do hàng đợi đầy (drop-oldest)"""
+
+
+class _Worker:
+    def __init__(self, worker_id, process):
+        self.id = worker_id
+        self.process = process
+        self.conn = None
+        self.busy_job = None
+        self.alive = False
+
+
+class _Job:
+    __slots__ = ('id', 'task', 'slot', 'location', 'shape', 'dtype', 'args', 'future', 'submitted_at')
+
+    def __init__(self, job_id, task, slot, location, shape, dtype, args):
+        self.id = job_id
+        self.task = task
+        self.slot = slot  # slot của service (None nếu frame nằm trong FrameRing)
+        self.location = location  # (tên shared memory, offset)
+        self.shape = shape
+        self.dtype = dtype
+        self.args = args
+        self.future = Future()
+        self.submitted_at = time.time()
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class InferenceService:
+    """
+    Pool N worker process, mỗi worker gọi `initializer` 1 lần (load model) rồi xử lý job.
+    `tasks` map tên task -> "module:function", function nhận (frame, *args).
+    Hàng đợi giới hạn `queue_depth`: khi đầy thì bỏ job cũ nhất (frame cũ không còn giá trị).
+    """
+
+    def __init__(self, name, initializer, tasks, num_workers=1, queue_depth=2,
+                 max_frame_bytes=DEFAULT_MAX_FRAME_BYTES):
+        self.name = name
+        self.initializer = initializer
+        self.tasks = dict(tasks)
+        self.num_workers = num_workers
+        self.queue_depth = queue_depth
+        self.max_frame_bytes = max_frame_bytes
+
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._workers = []
+        self._job_ids = 0
+        self._listener = None
+
+        # Mỗi job đang chờ/đang chạy giữ 1 slot shared memory
+        self._slots = []
+        self._free_slots = []
+
+        self._queue_wait_ms = deque(maxlen=500)
+        self._compute_ms = deque(maxlen=500)
+        self._counters = {'submitted': 0, 'completed': 0, 'dropped': 0, 'errors': 0}
+        self.started_at = None
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self):
+        """Khởi động worker; trả về True nếu có ít nhất 1 worker sẵn sàng"""
+        num_slots = self.queue_depth + self.num_workers
+        for _ in range(num_slots):
+            self._slots.append(shared_memory.SharedMemory(create=True, size=self.max_frame_bytes))
+        self._free_slots = list(range(num_slots))
+
+        authkey = secrets.token_bytes(16)
+        self._listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        host, port = self._listener.address
+
+        env = dict(os.environ, INFERENCE_AUTHKEY=authkey.hex())
+        for worker_id in range(self.num_workers):
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--worker', str(worker_id),
+                 '--host', host, '--port', str(port)],
+                cwd=BASE_DIR, env=env
+            )
+            self._workers.append(_Worker(worker_id, process))
+
+        # Chờ worker kết nối lại + báo load model xong
+        accepted = threading.Thread(target=self._accept_workers, daemon=True)
+        accepted.start()
+        accepted.join(WORKER_START_TIMEOUT)
+
+        alive = [w for w in self._workers if w.alive]
+        if not alive:
+            logger.error(f"Inference service '{self.name}': no worker became ready")
+            self.shutdown()
+            return False
+
+        self.started_at = time.time()
+        logger.info(f"Inference service '{self.name}' started with {len(alive)}/{self.num_workers} workers")
+        return True
+
+    def _accept_workers(self):
+        by_id = {w.id: w for w in self._workers}
+        for _ in range(self.num_workers):
+            try:
+                conn = self._listener.accept()
+                worker_id = conn.recv()
+                conn.send(('init', self.initializer, self.tasks, [shm.name for shm in self._slots]))
+                ok, error = conn.recv()
+            except Exception as e:
+                logger.error(f"Inference worker handshake failed: {e}")
+                continue
+
+            worker = by_id.get(worker_id)
+            if worker is None:
+                conn.close()
+                continue
+            if not ok:
+                logger.error(f"Inference worker {worker_id} failed to initialize: {error}")
+                conn.close()
+                continue
+
+            worker.conn = conn
+            worker.alive = True
+            threading.Thread(target=self._read_results, args=(worker,),
+                             name=f"inference-{self.name}-{worker_id}", daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            workers = list(self._workers)
+        for job in pending:
+            job.future.set_exception(JobDropped('service shutting down'))
+
+        for worker in workers:
+            worker.alive = False
+            if worker.conn is not None:
+                try:
+                    worker.conn.send(None)
+                    worker.conn.close()
+                except Exception:
+                    pass
+            try:
+                worker.process.wait(timeout=5)
+            except Exception:
+                worker.process.kill()
+
+        if self._listener is not None:
+            self._listener.close()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+
+    @property
+    def healthy(self):
+        return any(w.alive for w in self._workers)
+
+    # ------------------------------------------------------------------ submit / dispatch
+
+    def submit(self, task, frame, *args):
+        """
+        Gửi 1 frame cho pool; trả về Future với kết quả của task.
+        frame: numpy array (copy 1 lần vào slot của service) hoặc RingFrame đã pin
+        (worker đọc thẳng từ FrameRing, không copy - caller giữ pin tới khi Future xong).
+        """
+        if task not in self.tasks:
+            raise ValueError(f"Unknown inference task: {task}")
+        ring_frame = frame if hasattr(frame, 'shm_name') else None
+        if ring_frame is not None:
+            frame = ring_frame.array
+        elif frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame too large for shared memory slot: {frame.nbytes} bytes")
+        if not self.healthy:
+            raise RuntimeError(f"Inference service '{self.name}' has no live workers")
+
+        with self._lock:
+            # Drop-oldest: hàng đợi đầy -> bỏ job cũ nhất, giải phóng slot của nó
+            while (len(self._pending) >= self.queue_depth or
+                   (ring_frame is None and not self._free_slots)):
+                if not self._pending:
+                    raise RuntimeError('No free shared memory slot')
+                dropped = self._pending.popleft()
+                self._release_slot(dropped)
+                self._counters['dropped'] += 1
+                dropped.future.set_exception(JobDropped(f"job {dropped.id} dropped (queue full)"))
+
+            if ring_frame is not None:
+                slot, location = None, (ring_frame.shm_name, ring_frame.offset)
+            else:
+                slot = self._free_slots.pop()
+                location = (self._slots[slot].name, 0)
+                view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._slots[slot].buf)
+                view[...] = frame
+                del view
+
+            self._job_ids += 1
+            job = _Job(self._job_ids, task, slot, location, frame.shape, frame.dtype.str, args)
+            self._pending.append(job)
+            self._counters['submitted'] += 1
+            self._dispatch()
+        return job.future
+
+    def _release_slot(self, job):
+        if job.slot is not None:
+            self._free_slots.append(job.slot)
+
+    def _dispatch(self):
+        """Giao job cho worker rảnh (gọi khi đang giữ self._lock)"""
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if not worker.alive or worker.busy_job is not None:
+                continue
+            job = self._pending.popleft()
+            try:
+                worker.conn.send((job.id, job.task, job.location, job.shape, job.dtype, job.args, job.submitted_at))
+                worker.busy_job = job
+            except Exception as e:
+                logger.error(f"Inference worker {worker.id} send failed: {e}")
+                worker.alive = False
+                self._pending.appendleft(job)
+
+    def _read_results(self, worker):
+        while True:
+            try:
+                job_id, ok, payload, queue_wait_ms, compute_ms = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                job = worker.busy_job
+                worker.busy_job = None
+                if job is not None:
+                    self._release_slot(job)
+                    self._queue_wait_ms.append(queue_wait_ms)
+                    self._compute_ms.append(compute_ms)
+                    self._counters['completed' if ok else 'errors'] += 1
+                self._dispatch()
+
+            if job is not None and job.id == job_id:
+                if ok:
+                    job.future.set_result(payload)
+                else:
+                    job.future.set_exception(RuntimeError(payload))
+
+        # Worker chết -> trả lỗi cho job đang chạy
+        with self._lock:
+            if worker.alive:
+                logger.error(f"Inference worker {worker.id} of '{self.name}' exited")
+            worker.alive = False
+            job = worker.busy_job
+            worker.busy_job = None
+            if job is not None:
+                self._release_slot(job)
+                self._counters['errors'] += 1
+            self._dispatch()
+        if job is not None:
+            job.future.set_exception(RuntimeError('inference worker exited'))
+
+    # ------------------------------------------------------------------ metrics
+
+    def get_stats(self):
+        with self._lock:
+            queue_wait = list(self._queue_wait_ms)
+            compute = list(self._compute_ms)
+            return {
+                'name': self.name,
+                'workers': self.num_workers,
+                'workers_alive': sum(1 for w in self._workers if w.alive),
+                'workers_busy': sum(1 for w in self._workers if w.busy_job is not None),
+                'queue_depth': len(self._pending),
+                'queue_limit': self.queue_depth,
+                **self._counters,
+                'queue_wait_ms': {
+                    'avg': round(sum(queue_wait) / len(queue_wait), 2) if queue_wait else None,
+                    'p95': round(_percentile(queue_wait, 95), 2) if queue_wait else None
+                },
+                'compute_ms': {
+                    'avg': round(sum(compute) / len(compute), 2) if compute else None,
+                    'p95': round(_percentile(compute, 95), 2) if compute else None
+                },
+                'uptime': round(time.time() - self.started_at, 1) if self.started_at else 0
+            }
+
+
+def _resolve(spec):
+    module_name, func_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _attach_shared_memory(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # Web process sở hữu segment; không để resource_tracker của worker unlink khi thoát
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _close_stale_segments(attached, slot_names):
+    """Giữ tối đa MAX_RING_SEGMENTS segment FrameRing (slot của service luôn giữ); đóng cái ít dùng nhất"""
+    rings = [name for name in attached if name not in slot_names]
+    for name in rings[:max(0, len(rings) - MAX_RING_SEGMENTS)]:
+        try:
+            attached.pop(name).close()
+        except BufferError:
+            pass  # kết quả task còn giữ view vào segment: mmap được đóng khi view được giải phóng
+
+
+def worker_main(worker_id, host, port):
+    """Vòng lặp của 1 worker process"""
+    authkey = bytes.fromhex(os.environ['INFERENCE_AUTHKEY'])
+    conn = Client((host, port), authkey=authkey)
+    conn.send(worker_id)
+    _, initializer, task_specs, slot_names = conn.recv()
+
+    try:
+        if initializer:
+            _resolve(initializer)()
+        tasks = {name: _resolve(spec) for name, spec in task_specs.items()}
+    except Exception as e:
+        conn.send((False, str(e)))
+        return
+    conn.send((True, None))
+
+    slot_names = set(slot_names)
+    attached = OrderedDict()  # shared memory đã attach theo tên (slot của service + FrameRing), LRU
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        job_id, task, (shm_name, offset), shape, dtype, args, submitted_at = message
+        started = time.time()
+        try:
+            if shm_name not in attached:
+                attached[shm_name] = _attach_shared_memory(shm_name)
+                _close_stale_segments(attached, slot_names)
+            attached.move_to_end(shm_name)
+            frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=attached[shm_name].buf, offset=offset)
+            result = (True, tasks[task](frame, *args))
+            del frame
+        except Exception as e:
+            result = (False, f"{type(e).__name__}: {e}")
+        finished = time.time()
+
+        conn.send((job_id, result[0], result[1],
+                   (started - submitted_at) * 1000, (finished - started) * 1000))
+
+    for shm in attached.values():
+        shm.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inference worker process')
+    parser.add_argument('--worker', type=int, required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    cli_args = parser.parse_args()
+    worker_main(cli_args.worker, cli_args.host, cli_args.port)
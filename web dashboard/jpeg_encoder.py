@@ -0,0 +1,114 @@
+# jpeg_encoder.py - Encode JPEG cho MJPEG stream: libjpeg-turbo (PyTurboJPEG / simplejpeg) nếu có, không thì OpenCV
+#
+# Mọi encoder có cùng API: encode(frame_bgr, quality) -> bytes. Chọn bằng biến môi trường
+# JPEG_ENCODER=auto|turbojpeg|simplejpeg|opencv (auto: thử lần lượt turbojpeg, simplejpeg, opencv).
+#
+#   pip install PyTurboJPEG   # cần libturbojpeg (apt install libturbojpeg0)
+#   pip install simplejpeg    # wheel đã kèm libjpeg-turbo
+#
+# Encoder libjpeg-turbo dùng fast DCT + chroma 4:2:0 (giống mặc định của cv2.imencode), không có
+# optimize Huffman - IMWRITE_JPEG_OPTIMIZE chỉ giảm vài % dung lượng nhưng tốn thêm 1 lượt encode.
+import logging
+import os
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODER = os.environ.get('JPEG_ENCODER', 'auto').lower()
+ENCODER_ORDER = ('turbojpeg', 'simplejpeg', 'opencv')
+
+
+class JpegEncoder:
+    name = 'base'
+
+    def encode(self, frame, quality=80):
+        raise NotImplementedError
+
+
+class OpenCVEncoder(JpegEncoder):
+    name = 'opencv'
+
+    def __init__(self, optimize=False):
+        self.optimize = optimize
+
+    def encode(self, frame, quality=80):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        if self.optimize:
+            params += [int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+        ok, buffer = cv2.imencode('.jpg', frame, params)
+        if not ok:
+            raise ValueError('cv2.imencode failed')
+        return buffer.tobytes()
+
+
+class TurboJpegEncoder(JpegEncoder):
+    """PyTurboJPEG (ctypes tới libturbojpeg của hệ thống)"""
+    name = 'turbojpeg'
+
+    def __init__(self, fast_dct=True):
+        import turbojpeg
+
+        self._jpeg = turbojpeg.TurboJPEG()  # OSError/RuntimeError nếu không tìm thấy libturbojpeg
+        self._pixel_format = turbojpeg.TJPF_BGR
+        self._subsample = turbojpeg.TJSAMP_420
+        self._flags = turbojpeg.TJFLAG_FASTDCT if fast_dct else 0
+
+    def encode(self, frame, quality=80):
+        return self._jpeg.encode(np.ascontiguousarray(frame), quality=int(quality),
+                                 pixel_format=self._pixel_format, jpeg_subsample=self._subsample,
+                                 flags=self._flags)
+
+
+class SimpleJpegEncoder(JpegEncoder):
+    name = 'simplejpeg'
+
+    def __init__(self, fast_dct=True):
+        import simplejpeg
+
+        self._encode = simplejpeg.encode_jpeg
+        self.fast_dct = fast_dct
+
+    def encode(self, frame, quality=80):
+        return self._encode(np.ascontiguousarray(frame), quality=int(quality), colorspace='BGR',
+                            colorsubsampling='420', fastdct=self.fast_dct)
+
+
+ENCODERS = {
+    'turbojpeg': TurboJpegEncoder,
+    'simplejpeg': SimpleJpegEncoder,
+    'opencv': OpenCVEncoder
+}
+
+
+def create_encoder(name=None):
+    """Encoder theo tên (None = JPEG_ENCODER); encoder không dùng được thì thử cái tiếp theo, cuối cùng là OpenCV"""
+    name = (name or DEFAULT_ENCODER).lower()
+    if name == 'auto':
+        candidates = ENCODER_ORDER
+    elif name in ENCODERS:
+        candidates = (name, 'opencv')
+    else:
+        logger.warning(f"Unknown JPEG encoder '{name}', using auto")
+        candidates = ENCODER_ORDER
+
+    for candidate in candidates:
+        try:
+            return ENCODERS[candidate]()
+        except (ImportError, OSError, RuntimeError) as e:
+            if candidate == name:
+                logger.warning(f"JPEG encoder {candidate} not available ({e})")
+    return OpenCVEncoder()
+
+
+_encoder = None
+
+
+def get_encoder():
+    """Encoder dùng chung cho mọi stream (tạo lần đầu dùng)"""
+    global _encoder
+    if _encoder is None:
+        _encoder = create_encoder()
+        logger.info(f"JPEG encoder: {_encoder.name}")
+    return _encoder
@@ -0,0 +1,139 @@
+# motion_gate.py - Bỏ qua inference khi cảnh không đổi (camera cổng ban đêm, bãi xe ít xe ra vào)
+#
+# Frame được thu nhỏ (xám, blur) và so với nền trung bình động; pixel lệch quá `pixel_threshold`
+# là pixel thay đổi. Mỗi vùng (polygon ô đỗ / vùng cổng) có mask riêng: chỉ vùng có tỉ lệ pixel
+# thay đổi > `threshold` mới kích hoạt inference. Sau `refresh_interval` giây không chạy thì
+# bắt buộc chạy 1 lần (xe vào/ra quá chậm, đổi ánh sáng dần...).
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from slot_raster import label_raster
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTH = 160  # chiều rộng ảnh thu nhỏ để so sánh
+DEFAULT_THRESHOLD = 0.02
+DEFAULT_PIXEL_THRESHOLD = 25
+DEFAULT_REFRESH_INTERVAL = 10.0
+DEFAULT_BACKGROUND_ALPHA = 0.2  # nền hấp thụ xe mới đỗ sau ~10 lần kiểm tra
+
+
+class GateResult:
+    __slots__ = ('run', 'forced', 'active', 'changes')
+
+    def __init__(self, run, forced, active, changes):
+        self.run = run
+        self.forced = forced
+        self.active = active  # index các vùng có thay đổi (forced: mọi vùng)
+        self.changes = changes  # tỉ lệ pixel thay đổi theo vùng
+
+    def __bool__(self):
+        return self.run
+
+
+class MotionGate:
+    """`regions`: danh sách polygon theo toạ độ frame gốc; None = cả frame là 1 vùng"""
+
+    def __init__(self, regions=None, threshold=DEFAULT_THRESHOLD, pixel_threshold=DEFAULT_PIXEL_THRESHOLD,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL, width=DEFAULT_WIDTH,
+                 background_alpha=DEFAULT_BACKGROUND_ALPHA, enabled=True):
+        self.regions = regions
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.refresh_interval = refresh_interval
+        self.width = width
+        self.background_alpha = background_alpha
+        self.enabled = enabled
+
+        self._shape = None
+        self._size = None
+        self._labels = None  # uint16: 0 = ngoài mọi vùng, i + 1 = vùng i
+        self._areas = None
+        self._background = None
+        self._last_run = 0.0
+
+        self.stats = {'checked': 0, 'skipped': 0, 'forced': 0, 'triggered': 0}
+        self._gate_seconds = 0.0
+        self._inference_seconds = 0.0
+        self._inference_count = 0
+
+    def _prepare(self, shape):
+        """Mask vùng ở độ phân giải thu nhỏ - tính lại khi đổi kích thước frame"""
+        height, width = shape[:2]
+        scale = self.width / width
+        self._size = (self.width, max(1, int(round(height * scale))))
+        self._shape = shape[:2]
+        self._background = None
+
+        count = len(self.regions) if self.regions else 1
+        if self.regions:
+            labels = label_raster(self.regions, (self._size[1], self._size[0]), scale)
+        else:
+            labels = np.ones((self._size[1], self._size[0]), dtype=np.uint16)
+        self._labels = labels.ravel()
+        self._areas = np.bincount(self._labels, minlength=count + 1)[1:].astype(np.float32)
+
+    def check(self, frame, now=None):
+        """Có cần chạy inference cho frame này không (GateResult, dùng như bool)"""
+        now = time.time() if now is None else now
+        count = len(self.regions) if self.regions else 1
+        if not self.enabled:
+            self._last_run = now
+            return GateResult(True, True, list(range(count)), None)
+
+        started = time.perf_counter()
+        if frame.shape[:2] != self._shape:
+            self._prepare(frame.shape)
+
+        small = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._background is None:
+            self._background = gray.astype(np.float32)
+            changes = np.ones(count, dtype=np.float32)
+        else:
+            changed = cv2.absdiff(gray, cv2.convertScaleAbs(self._background)) > self.pixel_threshold
+            counts = np.bincount(self._labels, weights=changed.ravel(), minlength=count + 1)[1:]
+            changes = counts / np.maximum(self._areas, 1)
+            cv2.accumulateWeighted(gray, self._background, self.background_alpha)
+
+        active = np.flatnonzero(changes > self.threshold).tolist()
+        forced = not active and now - self._last_run >= self.refresh_interval
+        run = bool(active) or forced
+
+        self.stats['checked'] += 1
+        if forced:
+            self.stats['forced'] += 1
+            active = list(range(count))
+        elif run:
+            self.stats['triggered'] += 1
+        else:
+            self.stats['skipped'] += 1
+        if run:
+            self._last_run = now
+        self._gate_seconds += time.perf_counter() - started
+        return GateResult(run, forced, active, changes.tolist())
+
+    def record_inference(self, seconds):
+        """Thời gian 1 lần inference thật - dùng để ước lượng thời gian CPU tiết kiệm được"""
+        self._inference_seconds += seconds
+        self._inference_count += 1
+
+    def get_stats(self):
+        checked = self.stats['checked']
+        average_inference = self._inference_seconds / self._inference_count if self._inference_count else None
+        saved = None
+        if average_inference is not None:
+            saved = self.stats['skipped'] * average_inference - self._gate_seconds
+        return {
+            **self.stats,
+            'enabled': self.enabled,
+            'regions': len(self.regions) if self.regions else 1,
+            'skip_ratio': round(self.stats['skipped'] / checked, 3) if checked else 0.0,
+            'gate_ms': round(self._gate_seconds / checked * 1000, 3) if checked else None,
+            'inference_ms': round(average_inference * 1000, 1) if average_inference is not None else None,
+            'estimated_saved_seconds': round(saved, 1) if saved is not None else None
+        }
@@ -0,0 +1,179 @@
+# ocr_scheduler.py - Lập lịch biến thể preprocessing cho OCR biển số (early-exit + học online)
+import threading
+import time
+from collections import defaultdict
+
+# Chi phí mặc định (ms) cho biến thể chưa có số liệu đo
+DEFAULT_VARIANT_COST_MS = 20.0
+
+
+class VariantStats:
+    """Thống kê 1 biến thể cho 1 điều kiện ánh sáng"""
+
+    __slots__ = ('tries', 'hits', 'wins', 'total_cost_ms')
+
+    def __init__(self):
+        self.tries = 0  # số lần được chạy
+        self.hits = 0  # số lần cho ra biển số hợp lệ
+        self.wins = 0  # số lần là kết quả được chọn
+        self.total_cost_ms = 0.0
+
+    @property
+    def avg_cost_ms(self):
+        return self.total_cost_ms / self.tries if self.tries else None
+
+    def to_dict(self):
+        return {
+            'tries': self.tries,
+            'hits': self.hits,
+            'wins': self.wins,
+            'hit_rate': round(self.hits / self.tries, 3) if self.tries else 0.0,
+            'win_rate': round(self.wins / self.tries, 3) if self.tries else 0.0,
+            'avg_cost_ms': round(self.avg_cost_ms, 2) if self.tries else None
+        }
+
+
+class VariantScheduler:
+    """
+    Sắp xếp biến thể theo tỉ lệ thắng / chi phí cho từng điều kiện ánh sáng.
+    Biến thể rẻ và hay thắng được thử trước; thống kê cập nhật online sau mỗi lần OCR.
+    """
+
+    def __init__(self, camera_id, default_costs=None):
+        self.camera_id = camera_id
+        self.default_costs = default_costs or {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(VariantStats))  # condition -> name -> stats
+        self._disabled = defaultdict(set)  # condition -> {name}
+        self.journal = None  # list khi chạy trong worker process: các lần record chờ gửi về web process
+        self.epoch = 0  # tăng sau mỗi reset(); worker có epoch khác thì xoá thống kê của nó
+        self.created_at = time.time()
+
+    def _score(self, name, stats):
+        # Laplace smoothing: biến thể mới có win-rate 0.5 để vẫn được khám phá
+        win_rate = (stats.wins + 1) / (stats.tries + 2)
+        cost = stats.avg_cost_ms or self.default_costs.get(name, DEFAULT_VARIANT_COST_MS)
+        return win_rate / max(cost, 1.0)
+
+    def order(self, condition, names):
+        """Trả về danh sách biến thể đã sắp xếp (bỏ các biến thể đã bị tắt)"""
+        with self._lock:
+            disabled = self._disabled.get(condition, set())
+            stats = self._stats.get(condition, {})
+            candidates = [name for name in names if name not in disabled]
+            # sorted ổn định: khi điểm bằng nhau giữ thứ tự mặc định của registry
+            return sorted(candidates, key=lambda name: -self._score(name, stats.get(name) or VariantStats()))
+
+    def record(self, condition, name, cost_ms, hit):
+        """Ghi nhận 1 lần chạy biến thể"""
+        with self._lock:
+            stats = self._stats[condition][name]
+            stats.tries += 1
+            stats.total_cost_ms += cost_ms
+            if hit:
+                stats.hits += 1
+            if self.journal is not None:
+                self.journal.append((condition, name, cost_ms, hit, False))
+
+    def record_win(self, condition, name):
+        """Ghi nhận biến thể cho ra kết quả cuối cùng"""
+        with self._lock:
+            self._stats[condition][name].wins += 1
+            if self.journal is not None:
+                self.journal.append((condition, name, 0.0, False, True))
+
+    def drain_journal(self):
+        """Lấy và xoá các lần record từ lần drain trước (worker gửi kèm kết quả OCR)"""
+        with self._lock:
+            entries, self.journal = self.journal or [], []
+            return entries
+
+    def replay(self, entries, epoch=None):
+        """Áp dụng journal của worker vào thống kê của process này (/api/ocr/variant-stats)"""
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return  # journal ghi trước lần reset gần nhất
+            for condition, name, cost_ms, hit, win in entries:
+                stats = self._stats[condition][name]
+                if win:
+                    stats.wins += 1
+                    continue
+                stats.tries += 1
+                stats.total_cost_ms += cost_ms
+                if hit:
+                    stats.hits += 1
+
+    def get_disabled(self):
+        with self._lock:
+            return {condition: sorted(names) for condition, names in self._disabled.items() if names}
+
+    def set_disabled(self, disabled):
+        """Thay toàn bộ danh sách biến thể bị tắt (worker đồng bộ theo web process)"""
+        with self._lock:
+            self._disabled = defaultdict(set, {condition: set(names) for condition, names in disabled.items()})
+
+    def get_settings(self):
+        """Cấu hình web process gửi kèm mỗi job OCR cho worker (biến thể bị tắt + epoch reset)"""
+        return {'epoch': self.epoch, 'disabled': self.get_disabled()}
+
+    def apply_settings(self, settings):
+        """Worker: đồng bộ theo get_settings() của web process; epoch khác -> reset thống kê"""
+        self.set_disabled(settings.get('disabled', {}))
+        with self._lock:
+            epoch = settings.get('epoch', self.epoch)
+            if epoch != self.epoch:
+                self._stats.clear()
+                self.epoch = epoch
+                if self.journal is not None:
+                    self.journal = []
+
+    def set_enabled(self, condition, name, enabled):
+        """Bật/tắt 1 biến thể cho 1 điều kiện ánh sáng (vd: tắt multi_scale_retinex ban đêm)"""
+        with self._lock:
+            if enabled:
+                self._disabled[condition].discard(name)
+            else:
+                self._disabled[condition].add(name)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.epoch += 1
+            if self.journal is not None:
+                self.journal = []
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'camera_id': self.camera_id,
+                'since': self.created_at,
+                'conditions': {
+                    condition: {
+                        'variants': {name: s.to_dict() for name, s in variants.items()},
+                        'disabled': sorted(self._disabled.get(condition, set()))
+                    }
+                    for condition, variants in self._stats.items()
+                },
+                'disabled': {condition: sorted(names) for condition, names in self._disabled.items() if names}
+            }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_variant_scheduler(camera_id='camera1', default_costs=None):
+    """Lấy scheduler cho 1 camera (mỗi camera học thứ tự riêng)"""
+    with _schedulers_lock:
+        if camera_id not in _schedulers:
+            _schedulers[camera_id] = VariantScheduler(camera_id, default_costs)
+        elif default_costs and not _schedulers[camera_id].default_costs:
+            # Được tạo trước bởi caller không có chi phí mặc định (vd. route admin)
+            _schedulers[camera_id].default_costs = default_costs
+        return _schedulers[camera_id]
+
+
+def get_all_variant_stats():
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {s.camera_id: s.get_stats() for s in schedulers}
@@ -0,0 +1,285 @@
+# plate_search.py - Tìm kiếm biển số / chủ xe / số điện thoại bằng key chuẩn hoá + index FTS5 trigram
+#
+# - plate_key: bỏ '-', '.', khoảng trắng..., viết hoa -> '51B-123.45', '51b 12345' có cùng key. Key dùng để
+#   so bằng (cùng 1 xe), nên không gộp ký tự dễ nhầm: '51B-123.45' và '518-123.45' là 2 biển khác nhau.
+# - fuzzy_plate_key: plate_key + gộp ký tự OCR dễ nhầm (O/Q->0, I/L->1, S->5, B->8, G->6), chỉ dùng để xếp
+#   hạng ứng viên gần giống kết quả OCR (find_similar_plates).
+# - plate_key / phone_key là generated column (biểu thức SQL thuần) nên mọi writer (kể cả db_manager)
+#   đều có key đúng mà không cần hàm Python đăng ký trên connection.
+# - vehicle_search: FTS5 trigram (external content) trên plate_key, owner_name, phone_key; nếu SQLite
+#   không hỗ trợ trigram thì tìm kiếm quay về LIKE.
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+PLATE_SEPARATORS = '-. _/'
+# Giống bảng sửa lỗi trong camera1.post_process_plate_text - chỉ cho so khớp gần đúng
+PLATE_CONFUSABLES = {'O': '0', 'Q': '0', 'I': '1', 'L': '1', 'S': '5', 'B': '8', 'G': '6'}
+PHONE_SEPARATORS = ' -.()+'
+
+SEARCH_TABLE = 'vehicle_search'
+MIN_TRIGRAM_LENGTH = 3
+FUZZY_CANDIDATES = 50
+
+
+def plate_key(text):
+    """Key so khớp biển số (cùng kết quả với biểu thức SQL plate_key_sql)"""
+    key = (text or '').upper()
+    for ch in PLATE_SEPARATORS:
+        key = key.replace(ch, '')
+    return key
+
+
+def fuzzy_plate_key(text):
+    """plate_key với ký tự dễ nhầm đã gộp - không dùng làm định danh xe"""
+    key = plate_key(text)
+    for src, dst in PLATE_CONFUSABLES.items():
+        key = key.replace(src, dst)
+    return key
+
+
+def phone_key(text):
+    """Chỉ giữ chữ số, '84xxxxxxxxx' -> '0xxxxxxxxx' (cùng kết quả với phone_key_sql)"""
+    key = text or ''
+    for ch in PHONE_SEPARATORS:
+        key = key.replace(ch, '')
+    if key.startswith('84') and len(key) == 11:
+        key = '0' + key[2:]
+    return key
+
+
+def plate_key_sql(column):
+    expr = f"upper({column})"
+    for ch in PLATE_SEPARATORS:
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+
+def phone_key_sql(column):
+    expr = column
+    for ch in PHONE_SEPARATORS:
+        expr = f"replace({expr}, '{ch}', '')"
+    return f"CASE WHEN {expr} LIKE '84%' AND length({expr}) = 11 THEN '0' || substr({expr}, 3) ELSE {expr} END"
+
+
+def trigram_supported():
+    try:
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(a, tokenize='trigram')")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+SEARCH_TRIGGERS = ('trg_vehicle_search_insert', 'trg_vehicle_search_delete', 'trg_vehicle_search_update')
+
+
+def _plate_key_statements():
+    return [
+        f"ALTER TABLE registered_vehicles ADD COLUMN plate_key TEXT "
+        f"GENERATED ALWAYS AS ({plate_key_sql('plate_number')}) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS idx_rv_plate_key ON registered_vehicles(plate_key, is_active)",
+        # Lịch sử theo biển số (search_plate) khi biển số nhập khác định dạng đã lưu
+        f"ALTER TABLE entry_exit_log ADD COLUMN plate_key TEXT "
+        f"GENERATED ALWAYS AS ({plate_key_sql('plate_number')}) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS idx_eel_plate_key ON entry_exit_log(plate_key, timestamp)",
+    ]
+
+
+def migration_statements(conn):
+    """db_migrations version 5: generated column key + index, FTS5 trigram nếu được hỗ trợ"""
+    statements = _plate_key_statements() + [
+        f"ALTER TABLE registered_vehicles ADD COLUMN phone_key TEXT "
+        f"GENERATED ALWAYS AS ({phone_key_sql('owner_phone')}) VIRTUAL",
+    ]
+    return statements + _search_index_statements()
+
+
+def rekey_statements(conn):
+    """
+    db_migrations version 7: plate_key của version 5 cũ gộp ký tự dễ nhầm (B->8...) nên 2 biển khác nhau
+    có thể trùng key - tạo lại cột plate_key, index và FTS với key chỉ bỏ dấu phân cách.
+    """
+    statements = [f"DROP TRIGGER IF EXISTS {trigger}" for trigger in SEARCH_TRIGGERS]
+    statements += [
+        f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+        "DROP INDEX IF EXISTS idx_rv_plate_key",
+        "DROP INDEX IF EXISTS idx_eel_plate_key",
+        "ALTER TABLE registered_vehicles DROP COLUMN plate_key",
+        "ALTER TABLE entry_exit_log DROP COLUMN plate_key",
+    ]
+    return statements + _plate_key_statements() + _search_index_statements()
+
+
+def _search_index_statements():
+    if not trigram_supported():
+        logger.warning(f"SQLite {sqlite3.sqlite_version} has no FTS5 trigram tokenizer, "
+                       f"vehicle search will use LIKE")
+        return []
+
+    columns = 'plate_key, owner_name, phone_key'
+    new_values = 'NEW.rowid, NEW.plate_key, NEW.owner_name, NEW.phone_key'
+    old_values = 'OLD.rowid, OLD.plate_key, OLD.owner_name, OLD.phone_key'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5({columns}, "
+        f"content='registered_vehicles', content_rowid='rowid', tokenize='trigram')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vehicle_search_insert AFTER INSERT ON registered_vehicles
+        BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES ({new_values});
+        END""",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vehicle_search_delete AFTER DELETE ON registered_vehicles
+        BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', {old_values});
+        END""",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vehicle_search_update
+        AFTER UPDATE OF plate_number, owner_name, owner_phone ON registered_vehicles
+        BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', {old_values});
+            INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES ({new_values});
+        END""",
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def has_search_index(conn):
+    row = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (SEARCH_TABLE,)).fetchone()
+    return bool(row and row[0])
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+# search_type -> (cột FTS, cột LIKE, hàm chuẩn hoá truy vấn)
+SEARCH_FIELDS = {
+    'plate': ('plate_key', 'rv.plate_key', plate_key),
+    'owner': ('owner_name', 'rv.owner_name', lambda q: q.strip()),
+    'phone': ('phone_key', 'rv.phone_key', phone_key),
+}
+
+
+def search_condition(conn, query, search_type=None):
+    """
+    Điều kiện WHERE (trên alias rv của registered_vehicles) cho chuỗi tìm kiếm.
+    search_type: 'plate' / 'owner' / 'phone', hoặc None = tìm trên cả 3.
+    Trả về (sql, params) hoặc (None, []) nếu chuỗi rỗng sau chuẩn hoá.
+    """
+    fields = [search_type] if search_type in SEARCH_FIELDS else list(SEARCH_FIELDS)
+    use_fts = has_search_index(conn)
+
+    fts_terms, like_terms, params = [], [], []
+    for field in fields:
+        fts_column, like_column, normalize = SEARCH_FIELDS[field]
+        term = normalize(query)
+        if not term:
+            continue
+        if use_fts and len(term) >= MIN_TRIGRAM_LENGTH:
+            fts_terms.append(f"{fts_column} : {_fts_phrase(term)}")
+        else:
+            # Chuỗi < 3 ký tự không có trigram nào: LIKE (quét, nhưng chỉ với truy vấn rất ngắn)
+            like_terms.append((f"{like_column} LIKE ?", f"%{term}%"))
+
+    conditions = []
+    if fts_terms:
+        conditions.append(f"rv.rowid IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ?)")
+        params.append(' OR '.join(fts_terms))
+    for sql, param in like_terms:
+        conditions.append(sql)
+        params.append(param)
+
+    if not conditions:
+        return None, []
+    return '(' + ' OR '.join(conditions) + ')', params
+
+
+def search_vehicles(db, query, search_type=None, limit=50):
+    """Xe đang hoạt động khớp chuỗi tìm kiếm (list dict)"""
+    with db.connection() as conn:
+        condition, params = search_condition(conn, query, search_type)
+        if condition is None:
+            return []
+        result = conn.execute(f"""
+            SELECT rv.* FROM registered_vehicles rv
+            WHERE rv.is_active = 1 AND {condition}
+            ORDER BY rv.plate_number
+            LIMIT ?
+        """, params + [limit])
+        columns = [desc[0] for desc in result.description]
+        return [dict(zip(columns, row)) for row in result.fetchall()]
+
+
+def find_vehicle(db, plate, phone=None, columns='rv.*'):
+    """1 xe đang hoạt động theo plate_key (và phone_key nếu có) - 1 lần tra index"""
+    sql = f"SELECT {columns} FROM registered_vehicles rv WHERE rv.plate_key = ? AND rv.is_active = 1"
+    params = [plate_key(plate)]
+    if phone is not None:
+        sql += " AND rv.phone_key = ?"
+        params.append(phone_key(phone))
+    with db.connection() as conn:
+        result = conn.execute(sql + " LIMIT 1", params)
+        row = result.fetchone()
+        if row is None:
+            return None
+        return dict(zip([desc[0] for desc in result.description], row))
+
+
+def edit_distance(a, b, max_distance=None):
+    """Levenshtein; dừng sớm khi chắc chắn > max_distance"""
+    if abs(len(a) - len(b)) > (max_distance if max_distance is not None else len(a) + len(b)):
+        return abs(len(a) - len(b))
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if max_distance is not None and min(current) > max_distance:
+            return min(current)
+        previous = current
+    return previous[-1]
+
+
+def find_similar_plates(db, text, max_distance=1, limit=5):
+    """
+    Biển số đăng ký gần giống kết quả OCR (sai/thiếu/thừa tối đa max_distance ký tự, không tính
+    ký tự dễ nhầm như B/8). Ứng viên lấy từ FTS (khớp nhiều trigram nhất), không có FTS thì lọc theo độ dài.
+    Trả về [(plate_number, owner_name, distance)] tăng dần theo distance.
+    """
+    key = plate_key(text)
+    if len(key) < MIN_TRIGRAM_LENGTH:
+        return []
+    fuzzy_key = fuzzy_plate_key(key)
+
+    with db.connection() as conn:
+        if has_search_index(conn):
+            # FTS lưu key gốc: lấy trigram của cả key gốc và key đã gộp ký tự dễ nhầm
+            trigrams = sorted({k[i:i + 3] for k in (key, fuzzy_key) for i in range(len(k) - 2)})
+            candidates = conn.execute(f"""
+                SELECT rv.plate_number, rv.owner_name, rv.plate_key
+                FROM {SEARCH_TABLE} s JOIN registered_vehicles rv ON rv.rowid = s.rowid
+                WHERE {SEARCH_TABLE} MATCH ? AND rv.is_active = 1
+                ORDER BY s.rank
+                LIMIT ?
+            """, ('plate_key : (' + ' OR '.join(_fts_phrase(t) for t in trigrams) + ')',
+                  FUZZY_CANDIDATES)).fetchall()
+        else:
+            candidates = conn.execute("""
+                SELECT plate_number, owner_name, plate_key FROM registered_vehicles
+                WHERE is_active = 1 AND length(plate_key) BETWEEN ? AND ?
+            """, (len(key) - max_distance, len(key) + max_distance)).fetchall()
+
+    ranked = []
+    for plate_number, owner_name, candidate_key in candidates:
+        distance = edit_distance(fuzzy_key, fuzzy_plate_key(candidate_key), max_distance)
+        if distance <= max_distance:
+            # Cùng distance: biển khớp đúng từng ký tự (không qua gộp ký tự dễ nhầm) đứng trước
+            ranked.append((distance, edit_distance(key, candidate_key or ''), plate_number, owner_name))
+    ranked.sort()
+    return [(plate_number, owner_name, distance) for distance, _, plate_number, owner_name in ranked[:limit]]
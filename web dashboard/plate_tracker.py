@@ -0,0 +1,260 @@
+# plate_tracker.py - Gộp kết quả OCR biển số theo thời gian (tracking + bỏ phiếu từng ký tự)
+import itertools
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_plate_key(text):
+    """Bỏ dấu '-', '.', khoảng trắng để so sánh/bỏ phiếu theo ký tự"""
+    return ''.join(ch for ch in (text or '').upper() if ch.isalnum())
+
+
+def box_iou(box1, box2):
+    x1, y1, x2, y2 = box1[:4]
+    x1b, y1b, x2b, y2b = box2[:4]
+    dx = max(0, min(x2, x2b) - max(x1, x1b))
+    dy = max(0, min(y2, y2b) - max(y1, y1b))
+    overlap = dx * dy
+    union = (x2 - x1) * (y2 - y1) + (x2b - x1b) * (y2b - y1b) - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def box_center(box):
+    return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+
+class PlateTrack:
+    """1 biển số đang được theo dõi qua nhiều frame (1 lượt xe qua cổng)"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, bbox, now):
+        self.id = next(self._ids)
+        self.bbox = list(bbox[:4])
+        self.first_seen = now
+        self.last_seen = now
+        self.frames_seen = 1
+        self.reads = []  # các key đã chuẩn hoá từ OCR
+        self.best_confidence = 0.0
+        self.plate_type = None
+        self.locked_text = None
+        self.exhausted = False  # hết max_reads mà không đồng thuận: ngừng OCR, không chốt
+        self.committed = False
+
+    @property
+    def locked(self):
+        return self.locked_text is not None
+
+    @property
+    def needs_ocr(self):
+        return not self.locked and not self.exhausted
+
+    def consensus(self):
+        """
+        Bỏ phiếu: chọn độ dài phổ biến nhất, rồi chọn ký tự phổ biến nhất ở từng vị trí.
+        Trả về (key, số lượt đọc cùng độ dài, tỉ lệ đồng thuận thấp nhất giữa các vị trí)
+        """
+        if not self.reads:
+            return None, 0, 0.0
+
+        length, _ = Counter(len(r) for r in self.reads).most_common(1)[0]
+        same_length = [r for r in self.reads if len(r) == length]
+
+        chars = []
+        min_agreement = 1.0
+        for pos in range(length):
+            char, count = Counter(r[pos] for r in same_length).most_common(1)[0]
+            chars.append(char)
+            min_agreement = min(min_agreement, count / len(same_length))
+
+        return ''.join(chars), len(same_length), min_agreement
+
+
+class PlateAggregator:
+    """
+    Liên kết box biển số giữa các frame (IoU / khoảng cách tâm), tích luỹ phiếu ký tự
+    và chốt 1 biển số cho mỗi lượt xe khi đủ đồng thuận. Track đã chốt không cần OCR nữa;
+    track đọc đủ max_reads mà không đồng thuận thì ngừng OCR và chỉ chốt theo luật của lúc hết hạn.
+    on_commit được gọi ngoài lock.
+    """
+
+    def __init__(self, formatter=None, on_commit=None, iou_threshold=0.3, max_center_distance=80,
+                 track_timeout=3.0, min_reads=3, consensus_ratio=0.6, max_reads=12):
+        self.formatter = formatter or (lambda key: key)
+        self.on_commit = on_commit
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.track_timeout = track_timeout  # giây không thấy nữa -> kết thúc lượt xe
+        self.min_reads = min_reads
+        self.consensus_ratio = consensus_ratio
+        self.max_reads = max_reads  # quá số lượt đọc này thì ngừng OCR track
+
+        self._lock = threading.Lock()
+        self.tracks = {}
+        self.stats = {'ocr_reads': 0, 'ocr_skipped': 0, 'committed': 0, 'exhausted': 0}
+
+    @staticmethod
+    def _suppress_duplicates(detections, iou_threshold=0.5):
+        """Multi-scale detection trả về box trùng cho cùng 1 biển -> giữ box conf cao nhất"""
+        kept = []
+        for det in sorted(detections, key=lambda d: d[4], reverse=True):
+            if all(box_iou(det, k) < iou_threshold for k in kept):
+                kept.append(det)
+        return kept
+
+    def associate(self, detections, now):
+        """Gán detection vào track. Trả về list (track, detection)"""
+        with self._lock:
+            expired = self._expire(now)
+
+            matches = []
+            used = set()
+            for det in self._suppress_duplicates(detections):
+                best_track, best_score = None, 0.0
+                cx, cy = box_center(det)
+
+                for track in self.tracks.values():
+                    if track.id in used:
+                        continue
+                    iou = box_iou(det, track.bbox)
+                    if iou >= self.iou_threshold:
+                        score = 1.0 + iou
+                    else:
+                        tx, ty = box_center(track.bbox)
+                        distance = ((cx - tx) ** 2 + (cy - ty) ** 2) ** 0.5
+                        if distance > self.max_center_distance:
+                            continue
+                        score = 1.0 - distance / self.max_center_distance
+                    if score > best_score:
+                        best_track, best_score = track, score
+
+                if best_track is None:
+                    best_track = PlateTrack(det, now)
+                    self.tracks[best_track.id] = best_track
+                else:
+                    best_track.bbox = list(det[:4])
+                    best_track.last_seen = now
+                    best_track.frames_seen += 1
+
+                used.add(best_track.id)
+                if not best_track.needs_ocr:
+                    self.stats['ocr_skipped'] += 1
+                matches.append((best_track, det))
+
+        for track in expired:
+            self._notify_commit(track)
+        return matches
+
+    def add_read(self, track, text, confidence=0.0, plate_type=None):
+        """Thêm 1 kết quả OCR cho track; trả về biển số nếu track vừa được chốt"""
+        key = normalize_plate_key(text)
+        if not key:
+            return None
+
+        with self._lock:
+            if not track.needs_ocr:
+                return None
+
+            track.reads.append(key)
+            track.best_confidence = max(track.best_confidence, float(confidence))
+            track.plate_type = plate_type or track.plate_type
+            self.stats['ocr_reads'] += 1
+
+            consensus, support, agreement = track.consensus()
+            reached = support >= self.min_reads and agreement >= self.consensus_ratio
+            if not reached:
+                if len(track.reads) < self.max_reads:
+                    return None
+                consensus = self._final_consensus(track)
+                if consensus is None:
+                    track.exhausted = True
+                    self.stats['exhausted'] += 1
+                    logger.info(f"Plate track {track.id} gave up after {len(track.reads)} reads "
+                                f"without agreement ({support} same length, agreement {agreement:.2f})")
+                    return None
+
+            track.locked_text = self.formatter(consensus)
+            logger.info(f"Plate track {track.id} locked: {track.locked_text} "
+                        f"({support}/{len(track.reads)} reads, agreement {agreement:.2f})")
+            commit = self._claim_commit(track)
+
+        if commit:
+            self._notify_commit(track)
+        return track.locked_text
+
+    def provisional_text(self, track):
+        """Biển số tạm thời (chưa đủ đồng thuận)"""
+        if track.locked:
+            return track.locked_text
+        consensus, _, _ = track.consensus()
+        return self.formatter(consensus) if consensus else None
+
+    def current_plate(self):
+        """Biển số ổn định cho /capture: ưu tiên track đã chốt được thấy gần nhất"""
+        with self._lock:
+            tracks = sorted(self.tracks.values(), key=lambda t: t.last_seen, reverse=True)
+            for track in tracks:
+                if track.locked:
+                    return track.locked_text
+            for track in tracks:
+                text = self.provisional_text(track) if not track.exhausted else None
+                if text:
+                    return text
+        return None
+
+    def has_open_tracks(self):
+        """Còn track chưa chốt (đang bỏ phiếu) - cần detect tiếp dù cảnh đứng yên"""
+        with self._lock:
+            return any(track.needs_ocr for track in self.tracks.values())
+
+    def _final_consensus(self, track):
+        """
+        Chuỗi bỏ phiếu khi track dừng mà chưa đạt min_reads / consensus_ratio (hết hạn hoặc hết max_reads):
+        cần >= 2 lượt cùng độ dài đạt tỉ lệ đồng thuận, hoặc >= 2 lượt đọc giống hệt chuỗi bỏ phiếu
+        (support chỉ đếm lượt cùng độ dài, không phải trùng nhau). None nếu không đủ.
+        """
+        consensus, support, agreement = track.consensus()
+        if consensus is None:
+            return None
+        if (support >= 2 and agreement >= self.consensus_ratio) or track.reads.count(consensus) >= 2:
+            return consensus
+        return None
+
+    def _claim_commit(self, track):
+        """Gọi trong lock: đánh dấu track đã ghi nhận; True nếu caller cần gọi on_commit (ngoài lock)"""
+        if track.committed or not self.on_commit:
+            return False
+        track.committed = True
+        self.stats['committed'] += 1
+        return True
+
+    def _notify_commit(self, track):
+        try:
+            self.on_commit(track.locked_text, track.best_confidence, track)
+        except Exception as e:
+            logger.error(f"Plate commit callback error: {e}")
+
+    def _expire(self, now):
+        """Gọi trong lock: bỏ track hết hạn; trả về các track cần gọi on_commit sau khi nhả lock"""
+        to_commit = []
+        for track_id in [tid for tid, t in self.tracks.items() if now - t.last_seen > self.track_timeout]:
+            track = self.tracks.pop(track_id)
+            # Xe đã đi qua mà chưa chốt: vẫn ghi nhận nếu các lượt đọc đủ đồng thuận
+            if not track.committed and not track.locked and track.reads:
+                consensus = self._final_consensus(track)
+                if consensus is not None:
+                    track.locked_text = self.formatter(consensus)
+                    if self._claim_commit(track):
+                        to_commit.append(track)
+        return to_commit
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                'active_tracks': len(self.tracks),
+                'locked_tracks': sum(1 for t in self.tracks.values() if t.locked)
+            }
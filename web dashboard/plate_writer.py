@@ -0,0 +1,178 @@
+# plate_writer.py - 1 thread ghi biển số phát hiện được vào bảng license_plates theo lô
+#
+# Thay cho mỗi detection 1 thread + 1 connection + 1 commit: detection vào hàng đợi, writer gom
+# tối đa `batch_size` dòng hoặc chờ `flush_interval` giây rồi ghi trong 1 transaction.
+# Cùng 1 biển số (plate_key) trong `dedup_window` giây chỉ ghi 1 lần (giữ confidence cao nhất trong lô).
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from plate_search import plate_key
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = ("INSERT INTO license_plates (plate_number, confidence, timestamp, detection_method) "
+              "VALUES (?, ?, ?, ?)")
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_DEDUP_WINDOW = 5.0
+DEFAULT_MAX_QUEUE = 2000
+MAX_RETRY_ROWS = 5000  # DB bị khoá lâu: giữ tối đa ngần này dòng chờ ghi lại
+MAX_WRITE_ATTEMPTS = 5  # số lần ghi 1 lô khi DB bị khoá trước khi bỏ (mỗi lần cách ~flush_interval)
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _utc_timestamp(ts):
+    """Cùng định dạng CURRENT_TIMESTAMP (UTC) - giờ phát hiện, không phải giờ ghi lô"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+class BatchedPlateWriter:
+    """Writer dùng chung cho 1 database; thread được tạo ở lần submit() đầu tiên"""
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 dedup_window=DEFAULT_DEDUP_WINDOW, max_queue=DEFAULT_MAX_QUEUE):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedup_window = dedup_window
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._retry_rows = []  # (plate_key, thời điểm phát hiện, dòng INSERT) chờ ghi lại
+        self._retry_attempts = 0
+        self._last_written = {}  # plate_key -> thời điểm phát hiện đã ghi (commit xong) gần nhất
+        self.stats = {'submitted': 0, 'written': 0, 'deduplicated': 0, 'dropped': 0,
+                      'batches': 0, 'errors': 0, 'lost': 0}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='plate-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, plate, confidence, method):
+        """Không chặn; hàng đợi đầy (DB treo) thì bỏ detection"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((plate, float(confidence), method, time.time()))
+            self.stats['submitted'] += 1
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _collect(self):
+        """Chờ detection đầu tiên rồi gom thêm đến khi đủ lô hoặc hết flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stopping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _coalesce(self, batch, pending_keys=()):
+        """
+        Bỏ biển số đã ghi trong dedup_window hoặc đang chờ ghi lại (pending_keys); trong lô giữ dòng
+        confidence cao nhất. Trả về [(plate_key, thời điểm phát hiện, dòng INSERT)]
+        """
+        best = {}
+        for plate, confidence, method, detected_at in batch:
+            key = plate_key(plate)
+            last = self._last_written.get(key)
+            if key in pending_keys or (last is not None and detected_at - last < self.dedup_window):
+                self.stats['deduplicated'] += 1
+                continue
+            current = best.get(key)
+            if current is None:
+                best[key] = (plate, confidence, method, detected_at)
+            else:
+                self.stats['deduplicated'] += 1
+                if confidence > current[1]:
+                    best[key] = (plate, confidence, method, current[3])
+
+        return [(key, detected_at, (plate, confidence, _utc_timestamp(detected_at), method))
+                for key, (plate, confidence, method, detected_at) in best.items()]
+
+    def _write(self, entries):
+        try:
+            with self.db.transaction() as conn:
+                conn.executemany(INSERT_SQL, [row for _, _, row in entries])
+        except Exception as e:
+            self.stats['errors'] += 1
+            self._retry_attempts += 1
+            transient = isinstance(e, sqlite3.OperationalError) and _is_busy(e)
+            if transient and self._retry_attempts < MAX_WRITE_ATTEMPTS:
+                # Khoá ghi / busy: giữ lại để ghi cùng lô sau
+                self._retry_rows = entries[-MAX_RETRY_ROWS:]
+                self.stats['lost'] += len(entries) - len(self._retry_rows)
+                logger.warning(f"Plate batch write failed ({len(self._retry_rows)} rows kept for retry, "
+                               f"attempt {self._retry_attempts}/{MAX_WRITE_ATTEMPTS}): {e}")
+                return
+            # Lỗi không tự hết (thiếu bảng, DB read-only...) hoặc khoá quá lâu: bỏ lô;
+            # _last_written chưa cập nhật nên lần đọc sau của các biển này vẫn được ghi
+            self.stats['lost'] += len(entries)
+            self._retry_rows = []
+            self._retry_attempts = 0
+            logger.error(f"Plate batch write error, {len(entries)} rows lost: {e}")
+            return
+
+        self._retry_rows = []
+        self._retry_attempts = 0
+        # Chỉ coi là đã ghi (dedup) sau khi commit xong
+        for key, detected_at, _ in entries:
+            if detected_at > self._last_written.get(key, 0):
+                self._last_written[key] = detected_at
+        self.stats['written'] += len(entries)
+        self.stats['batches'] += 1
+        logger.debug(f"Saved {len(entries)} plates to DB")
+
+    def _prune(self, now):
+        if len(self._last_written) > 1000:
+            self._last_written = {k: t for k, t in self._last_written.items() if now - t < self.dedup_window}
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # _retry_rows giữ nguyên tới khi _write xong (flush() chờ cả lô đang ghi lại)
+            retry = self._retry_rows
+            entries = retry + self._coalesce(batch, {key for key, _, _ in retry})
+            if entries:
+                self._write(entries)
+            for _ in batch:
+                self._queue.task_done()
+            self._prune(time.time())
+            if self._stopping and self._queue.empty():
+                return
+
+    def flush(self, timeout=5.0):
+        """Chờ hàng đợi được ghi hết (dùng khi tắt / test)"""
+        deadline = time.monotonic() + timeout
+        while (self._queue.unfinished_tasks or self._retry_rows) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def get_stats(self):
+        return {**self.stats, 'queued': self._queue.qsize(), 'retry_rows': len(self._retry_rows)}
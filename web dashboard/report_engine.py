@@ -0,0 +1,302 @@
+# report_engine.py - Tính toàn bộ báo cáo (summary, hourly, weekly, loại xe, đăng ký) trong 1 lần quét
+#
+# Thay vì ~30 query riêng lẻ trên cùng khoảng ngày, engine quét entry_exit_log 1 lần (GROUP BY ngày/giờ/
+# loại xe/đăng ký với aggregate có điều kiện), 1 lần cho lượt ra, rồi gom bucket bằng Python.
+# Khoảng quét gồm cả kỳ trước (để tính % thay đổi) và 7 ngày kết thúc ở end_date (weekly trend).
+# Khi đã có rollup (report_rollups), đọc bảng tổng hợp theo ngày/giờ và (ngày, biển số) thay vì quét bảng
+# gốc: chi phí chỉ phụ thuộc độ dài khoảng báo cáo, không phụ thuộc tổng lịch sử. Rollup do trigger cập nhật
+# trong cùng transaction với entry_exit_log nên đã gồm cả giờ đang chạy; bảng gốc chỉ còn đọc cho 50 lượt
+# gần nhất (LIMIT trên index entry_time) và số xe đang trong bãi (partial index phiên chưa ra).
+import logging
+import time
+from datetime import datetime, timedelta
+
+from report_queries import day_range, generate_table_data_safe, get_empty_report_data
+from report_rollups import PLATE_ROLLUP_TABLE, TYPE_GROUPS, has_plate_rollups, has_rollups, type_group_sql
+
+logger = logging.getLogger(__name__)
+
+WEEKDAY_LABELS = ['T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN']
+
+# Bucket theo 'YYYY-MM-DD HH' (cột thời gian lưu dạng ISO, giống điều kiện khoảng ngày của report_queries)
+ENTRY_BUCKETS_SQL = f"""
+    SELECT substr(el.entry_time, 1, 13) AS hour_key,
+           {type_group_sql('rv.vehicle_type')} AS type_group,
+           COALESCE(el.is_registered, 0) = 1 AS registered,
+           COUNT(*) AS entries,
+           0 AS exits,
+           SUM(CASE WHEN el.parking_duration > 0 THEN el.parking_duration ELSE 0 END) AS duration_sum,
+           SUM(el.parking_duration > 0) AS duration_count
+    FROM entry_exit_log el
+    LEFT JOIN registered_vehicles rv ON rv.plate_number = el.plate_number
+    WHERE el.entry_time >= ? AND el.entry_time < ?
+    GROUP BY hour_key, type_group, registered
+"""
+
+EXIT_BUCKETS_SQL = """
+    SELECT substr(exit_time, 1, 13) AS hour_key, 3, 0, 0, COUNT(*) AS exits, 0, 0
+    FROM entry_exit_log
+    WHERE exit_time >= ? AND exit_time < ?
+    GROUP BY hour_key
+"""
+
+# Rollup theo ngày: đủ cho summary, loại xe, weekly/registration trend
+DAILY_ROLLUP_SQL = """
+    SELECT bucket, type_group, registered, SUM(entries), SUM(exits), SUM(duration_sum), SUM(duration_count)
+    FROM report_rollup_daily
+    WHERE bucket >= ? AND bucket < ?
+    GROUP BY bucket, type_group, registered
+"""
+
+# Rollup theo giờ chỉ dùng cho biểu đồ phân bố theo giờ trong ngày
+HOURLY_ROLLUP_SQL = """
+    SELECT CAST(substr(bucket, 12, 2) AS INTEGER) AS hour, SUM(entries), SUM(exits)
+    FROM report_rollup_hourly
+    WHERE bucket >= ? AND bucket < ?
+    GROUP BY hour
+"""
+
+# Số xe khác nhau của kỳ hiện tại và kỳ trước trong cùng 1 lần quét covering index
+DISTINCT_PLATES_SQL = """
+    SELECT COUNT(DISTINCT CASE WHEN entry_time >= ? THEN plate_number END),
+           COUNT(DISTINCT CASE WHEN entry_time < ? THEN plate_number END)
+    FROM entry_exit_log
+    WHERE entry_time >= ? AND entry_time < ?
+"""
+
+# Cùng tham số với DISTINCT_PLATES_SQL; mỗi kỳ 1 lần quét khoảng khoá chính của rollup
+DISTINCT_PLATES_ROLLUP_SQL = f"""
+    SELECT (SELECT COUNT(DISTINCT plate_number) FROM {PLATE_ROLLUP_TABLE} WHERE bucket >= ?1 AND bucket < ?4),
+           (SELECT COUNT(DISTINCT plate_number) FROM {PLATE_ROLLUP_TABLE} WHERE bucket >= ?3 AND bucket < ?2)
+"""
+
+# Top parkers từ rollup (ngày, biển số): cùng cột với report_queries.generate_table_data_safe
+TOP_PARKERS_ROLLUP_SQL = f"""
+    SELECT p.plate_number,
+           COALESCE(rv.owner_name, 'Không xác định') AS owner_name,
+           p.visit_count,
+           p.duration_sum * 1.0 / p.visit_count AS avg_duration,
+           p.duration_sum
+    FROM (
+        SELECT plate_number, SUM(visits) AS visit_count, SUM(duration_sum) AS duration_sum
+        FROM {PLATE_ROLLUP_TABLE}
+        WHERE bucket >= ? AND bucket < ?
+        GROUP BY plate_number
+        HAVING SUM(visits) > 1
+        ORDER BY duration_sum DESC, visit_count DESC
+        LIMIT 20
+    ) p
+    LEFT JOIN registered_vehicles rv ON p.plate_number = rv.plate_number AND rv.is_active = 1
+    ORDER BY p.duration_sum DESC, p.visit_count DESC
+"""
+
+# 50 lượt vào gần nhất: duyệt ngược idx_eel_entry_time và dừng sau 50 dòng
+RECENT_ACTIVITIES_SQL = """
+    SELECT el.plate_number,
+           COALESCE(rv.owner_name, 'Không xác định') AS owner_name,
+           COALESCE(rv.vehicle_type, 'Không xác định') AS vehicle_type,
+           el.entry_time, el.exit_time, el.parking_duration,
+           rv.plate_number IS NOT NULL AS is_registered
+    FROM entry_exit_log el
+    LEFT JOIN registered_vehicles rv ON el.plate_number = rv.plate_number AND rv.is_active = 1
+    WHERE el.entry_time >= ? AND el.entry_time < ?
+    ORDER BY el.entry_time DESC
+    LIMIT 50
+"""
+
+CURRENT_PARKING_SQL = """
+    SELECT COUNT(*) FROM entry_exit_log
+    WHERE exit_time IS NULL
+    AND +entry_time IS NOT NULL
+    AND (status = 'active' OR status IS NULL)
+"""
+
+
+def _split_hour_key(hour_key):
+    """'YYYY-MM-DD HH' -> ('YYYY-MM-DD', HH); giờ là None nếu giá trị chỉ có ngày"""
+    hour = hour_key[11:13]
+    return hour_key[:10], int(hour) if hour.isdigit() and int(hour) < 24 else None
+
+
+def _percent_change(current, previous):
+    if not previous:
+        return 100 if current else 0
+    return round((current - previous) / previous * 100, 1)
+
+
+class _Period:
+    """Bộ đếm cho 1 kỳ báo cáo"""
+
+    def __init__(self):
+        self.entries = 0
+        self.exits = 0
+        self.registered = 0
+        self.duration_sum = 0
+        self.duration_count = 0
+
+    @property
+    def avg_duration(self):
+        return round(self.duration_sum / self.duration_count, 1) if self.duration_count else 0
+
+
+def generate_report(db, start_date, end_date):
+    """
+    Trả về {'summary', 'charts', 'tables'} đúng cấu trúc reports.html dùng.
+    start_date / end_date là datetime (tính theo ngày, gồm cả 2 đầu).
+    """
+    started = time.perf_counter()
+    report = get_empty_report_data()
+
+    period_days = (end_date.date() - start_date.date()).days + 1
+    prev_start = start_date - timedelta(days=period_days)
+    week_start = end_date - timedelta(days=6)
+    scan_start = min(prev_start, week_start)
+
+    start_key, end_key = day_range(start_date, end_date)
+    prev_key = prev_start.strftime('%Y-%m-%d')
+    week_days = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+    week_index = {day: i for i, day in enumerate(week_days)}
+
+    current, previous = _Period(), _Period()
+    hourly_entries = [0] * 24
+    hourly_exits = [0] * 24
+    type_counts = [0] * len(TYPE_GROUPS)
+    weekly = [0] * 7
+    weekly_registered = [0] * 7
+    weekly_unregistered = [0] * 7
+
+    with db.connection() as conn:
+        use_rollups = has_rollups(conn)
+        scan_range = day_range(scan_start, end_date)
+
+        if use_rollups:
+            rows = conn.execute(DAILY_ROLLUP_SQL, scan_range).fetchall()
+        else:
+            rows = conn.execute(ENTRY_BUCKETS_SQL, scan_range).fetchall()
+            rows += conn.execute(EXIT_BUCKETS_SQL, scan_range).fetchall()
+
+        for key, type_group, registered, entries, exits, duration_sum, duration_count in rows:
+            if not key:
+                continue
+            day, hour = _split_hour_key(key)
+            period = current if start_key <= day < end_key else previous if prev_key <= day < start_key else None
+            if period is not None:
+                period.entries += entries
+                period.exits += exits
+                period.registered += entries if registered else 0
+                period.duration_sum += duration_sum or 0
+                period.duration_count += duration_count or 0
+            if period is current:
+                if hour is not None:
+                    hourly_entries[hour] += entries
+                    hourly_exits[hour] += exits
+                type_counts[type_group] += entries
+
+            i = week_index.get(day)
+            if i is not None:
+                weekly[i] += entries
+                if registered:
+                    weekly_registered[i] += entries
+                else:
+                    weekly_unregistered[i] += entries
+
+        if use_rollups:
+            for hour, entries, exits in conn.execute(HOURLY_ROLLUP_SQL, (start_key, end_key)):
+                if hour is not None and 0 <= hour < 24:
+                    hourly_entries[hour] += entries
+                    hourly_exits[hour] += exits
+
+        use_plate_rollups = has_plate_rollups(conn)
+        vehicles, prev_vehicles = conn.execute(
+            DISTINCT_PLATES_ROLLUP_SQL if use_plate_rollups else DISTINCT_PLATES_SQL,
+            (start_key, start_key, prev_key, end_key)).fetchone()
+        current_parking = conn.execute(CURRENT_PARKING_SQL).fetchone()[0]
+        tables = _table_data(conn, start_key, end_key) if use_plate_rollups else None
+
+    report['summary'] = {
+        'total_vehicles': vehicles or 0,
+        'total_entries': current.entries,
+        'total_exits': current.exits,
+        'registered_vehicles': current.registered,
+        'current_parking': current_parking or 0,
+        'avg_duration': current.avg_duration,
+        'vehicles_change': _percent_change(vehicles or 0, prev_vehicles or 0),
+        'entries_change': _percent_change(current.entries, previous.entries),
+        'exits_change': _percent_change(current.exits, previous.exits),
+        'registered_change': _percent_change(current.registered, previous.registered),
+        'parking_change': 0,  # không lưu lịch sử số xe trong bãi
+        'duration_change': _percent_change(current.avg_duration, previous.avg_duration)
+    }
+
+    week_labels = [WEEKDAY_LABELS[(week_start + timedelta(days=i)).weekday()] for i in range(7)]
+    report['charts'] = {
+        'hourly': {'entries': hourly_entries, 'exits': hourly_exits},
+        # reports.html hiển thị 2 nhóm: Xe hơi / Khác
+        'vehicle_types': {'labels': ['Xe hơi', 'Khác'], 'data': [type_counts[0], sum(type_counts[1:])]},
+        'weekly_trend': {'labels': week_labels, 'data': weekly},
+        'registration_trend': {
+            'labels': week_labels,
+            'registered': weekly_registered,
+            'unregistered': weekly_unregistered
+        }
+    }
+
+    report['tables'] = tables or generate_table_data_safe(db, start_date, end_date)
+
+    logger.info(f"Report {start_key}..{end_date.strftime('%Y-%m-%d')} generated in "
+                f"{(time.perf_counter() - started) * 1000:.0f}ms ({'rollups' if use_rollups else 'raw scan'})")
+    return report
+
+
+def _table_data(conn, start_key, end_key):
+    """Bảng recent_activities / top_parkers; None nếu lỗi để caller dùng report_queries"""
+    try:
+        activities = conn.execute(RECENT_ACTIVITIES_SQL, (start_key, end_key)).fetchall()
+        parkers = conn.execute(TOP_PARKERS_ROLLUP_SQL, (start_key, end_key)).fetchall()
+    except Exception as e:
+        logger.warning(f"Report tables from rollups failed: {e}")
+        return None
+
+    return {
+        'recent_activities': [{
+            'plate_number': plate or 'N/A',
+            'owner_name': owner_name,
+            'vehicle_type': vehicle_type,
+            'entry_time': entry_time,
+            'exit_time': exit_time,
+            'parking_duration': duration,
+            'is_registered': bool(is_registered)
+        } for plate, owner_name, vehicle_type, entry_time, exit_time, duration, is_registered in activities],
+        'top_parkers': [{
+            'plate_number': plate or 'N/A',
+            'owner_name': owner_name,
+            'visit_count': visit_count or 0,
+            'avg_duration': round(avg_duration or 0, 1),
+            'total_hours': round((duration_sum or 0) / 60, 2)  # phút -> giờ
+        } for plate, owner_name, visit_count, avg_duration, duration_sum in parkers]
+    }
+
+
+def get_day_statistics(db, day=None):
+    """
+    Thống kê 1 ngày từ rollup (cùng key với db_manager.get_parking_statistics).
+    Trả về None nếu chưa có rollup để caller dùng cách cũ.
+    """
+    day_key = (day or datetime.now()).strftime('%Y-%m-%d')
+    with db.connection() as conn:
+        if not has_rollups(conn):
+            return None
+        entries, exits, registered = conn.execute("""
+            SELECT COALESCE(SUM(entries), 0), COALESCE(SUM(exits), 0),
+                   COALESCE(SUM(CASE WHEN registered THEN entries ELSE 0 END), 0)
+            FROM report_rollup_daily WHERE bucket = ?
+        """, (day_key,)).fetchone()
+        current_parking = conn.execute(CURRENT_PARKING_SQL).fetchone()[0]
+
+    return {
+        'total_entries': entries,
+        'total_exits': exits,
+        'registered_entries': registered,
+        'unregistered_entries': entries - registered,
+        'current_in_parking': current_parking or 0
+    }
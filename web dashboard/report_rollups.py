@@ -0,0 +1,261 @@
+# report_rollups.py - Bảng tổng hợp theo giờ/ngày cho báo cáo, cập nhật tăng dần bằng trigger trên entry_exit_log
+#
+# Mỗi dòng rollup = (bucket, nhóm loại xe, đã đăng ký) -> số lượt vào, lượt ra, tổng/số phiên có thời gian đỗ.
+#   - Lượt vào + thời gian đỗ tính theo bucket của entry_time, lượt ra theo bucket của exit_time
+#     (giống cách report_engine quét bảng gốc).
+#   - entry_exit_log do module database ghi (log_entry_exit), nên rollup được giữ bằng trigger SQLite:
+#     cập nhật trong cùng transaction với INSERT/UPDATE/DELETE, không cần sửa code ghi.
+#   - Loại xe lấy từ registered_vehicles tại thời điểm ghi; đổi loại xe sau đó chỉ áp dụng khi rebuild.
+#   - report_rollup_daily_plates = (ngày vào, biển số) -> số lượt, tổng thời gian đỗ: số xe khác nhau và
+#     top parkers của khoảng báo cáo đọc từ đây thay vì quét entry_exit_log.
+#
+#   python report_rollups.py parking.db --rebuild [--since 2025-01-01]
+import argparse
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# (bảng, độ dài bucket): 'YYYY-MM-DD HH' / 'YYYY-MM-DD'
+ROLLUP_TABLES = (
+    ('report_rollup_hourly', 13),
+    ('report_rollup_daily', 10),
+)
+
+PLATE_ROLLUP_TABLE = 'report_rollup_daily_plates'
+
+TYPE_GROUPS = ['Xe hơi', 'Xe máy', 'Xe tải', 'Khác']
+
+
+def type_group_sql(column):
+    """Biểu thức SQL nhóm vehicle_type về chỉ số trong TYPE_GROUPS"""
+    return f"""CASE
+               WHEN {column} IN ('car', 'xe hơi') THEN 0
+               WHEN {column} IN ('motorbike', 'motorcycle', 'xe máy') THEN 1
+               WHEN {column} IN ('truck', 'xe tải') THEN 2
+               ELSE 3
+           END"""
+
+
+def _row_type_group(plate_column):
+    return (f"COALESCE((SELECT {type_group_sql('rv.vehicle_type')} FROM registered_vehicles rv "
+            f"WHERE rv.plate_number = {plate_column} LIMIT 1), 3)")
+
+
+def _create_table_sql(table):
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT NOT NULL,
+            type_group INTEGER NOT NULL,
+            registered INTEGER NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            exits INTEGER NOT NULL DEFAULT 0,
+            duration_sum INTEGER NOT NULL DEFAULT 0,
+            duration_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, type_group, registered)
+        ) WITHOUT ROWID
+    """
+
+
+def _apply_row_sql(table, length, row, sign):
+    """2 câu upsert cộng (sign='+') hoặc trừ (sign='-') đóng góp của 1 dòng NEW/OLD vào rollup"""
+    type_group = _row_type_group(f"{row}.plate_number")
+    registered = f"COALESCE({row}.is_registered, 0) = 1"
+    return f"""
+        INSERT INTO {table} (bucket, type_group, registered, entries, duration_sum, duration_count)
+        SELECT substr({row}.entry_time, 1, {length}), {type_group}, {registered}, {sign}1,
+               {sign}CASE WHEN {row}.parking_duration > 0 THEN {row}.parking_duration ELSE 0 END,
+               {sign}COALESCE({row}.parking_duration > 0, 0)
+        WHERE {row}.entry_time IS NOT NULL
+        ON CONFLICT (bucket, type_group, registered) DO UPDATE SET
+            entries = entries + excluded.entries,
+            duration_sum = duration_sum + excluded.duration_sum,
+            duration_count = duration_count + excluded.duration_count;
+        INSERT INTO {table} (bucket, type_group, registered, exits)
+        SELECT substr({row}.exit_time, 1, {length}), {type_group}, {registered}, {sign}1
+        WHERE {row}.exit_time IS NOT NULL
+        ON CONFLICT (bucket, type_group, registered) DO UPDATE SET
+            exits = exits + excluded.exits;"""
+
+
+def _apply_sql(row, sign):
+    return ''.join(_apply_row_sql(table, length, row, sign) for table, length in ROLLUP_TABLES)
+
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON entry_exit_log
+    BEGIN {_apply_sql('NEW', '+')}
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+    AFTER UPDATE OF plate_number, entry_time, exit_time, is_registered, parking_duration ON entry_exit_log
+    WHEN OLD.plate_number IS NOT NEW.plate_number
+      OR OLD.entry_time IS NOT NEW.entry_time
+      OR OLD.exit_time IS NOT NEW.exit_time
+      OR OLD.is_registered IS NOT NEW.is_registered
+      OR OLD.parking_duration IS NOT NEW.parking_duration
+    BEGIN {_apply_sql('OLD', '-')}{_apply_sql('NEW', '+')}
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON entry_exit_log
+    BEGIN {_apply_sql('OLD', '-')}
+    END""",
+]
+
+
+def _apply_plate_sql(row, sign):
+    """Cộng/trừ 1 lượt vào của dòng NEW/OLD vào rollup (ngày, biển số); trừ về 0 thì xoá dòng"""
+    sql = f"""
+        INSERT INTO {PLATE_ROLLUP_TABLE} (bucket, plate_number, visits, duration_sum)
+        SELECT substr({row}.entry_time, 1, 10), {row}.plate_number, {sign}1,
+               {sign}COALESCE({row}.parking_duration, 0)
+        WHERE {row}.entry_time IS NOT NULL AND {row}.plate_number IS NOT NULL
+        ON CONFLICT (bucket, plate_number) DO UPDATE SET
+            visits = visits + excluded.visits,
+            duration_sum = duration_sum + excluded.duration_sum;"""
+    if sign == '-':
+        sql += f"""
+        DELETE FROM {PLATE_ROLLUP_TABLE}
+        WHERE bucket = substr({row}.entry_time, 1, 10) AND plate_number = {row}.plate_number AND visits <= 0;"""
+    return sql
+
+
+PLATE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_plate_rollup_insert AFTER INSERT ON entry_exit_log
+    BEGIN {_apply_plate_sql('NEW', '+')}
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_plate_rollup_update
+    AFTER UPDATE OF plate_number, entry_time, parking_duration ON entry_exit_log
+    WHEN OLD.plate_number IS NOT NEW.plate_number
+      OR OLD.entry_time IS NOT NEW.entry_time
+      OR OLD.parking_duration IS NOT NEW.parking_duration
+    BEGIN {_apply_plate_sql('OLD', '-')}{_apply_plate_sql('NEW', '+')}
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_plate_rollup_delete AFTER DELETE ON entry_exit_log
+    BEGIN {_apply_plate_sql('OLD', '-')}
+    END""",
+]
+
+
+def _plate_backfill_sql(since=None):
+    entry_filter = "entry_time >= :since" if since else "entry_time IS NOT NULL"
+    return f"""
+        INSERT INTO {PLATE_ROLLUP_TABLE} (bucket, plate_number, visits, duration_sum)
+        SELECT substr(entry_time, 1, 10), plate_number, COUNT(*), SUM(COALESCE(parking_duration, 0))
+        FROM entry_exit_log
+        WHERE {entry_filter} AND plate_number IS NOT NULL
+        GROUP BY 1, 2
+    """
+
+
+def _backfill_sql(table, length, since=None):
+    """Tổng hợp lại từ bảng gốc (từ ngày `since` nếu có) - dùng cho migration và rebuild"""
+    entry_filter = "entry_time >= :since" if since else "entry_time IS NOT NULL"
+    exit_filter = "exit_time >= :since" if since else "exit_time IS NOT NULL"
+    type_group = _row_type_group('el.plate_number')
+    return [
+        f"""
+        INSERT INTO {table} (bucket, type_group, registered, entries, duration_sum, duration_count)
+        SELECT substr(entry_time, 1, {length}), type_group, registered, COUNT(*),
+               SUM(CASE WHEN parking_duration > 0 THEN parking_duration ELSE 0 END),
+               SUM(COALESCE(parking_duration > 0, 0))
+        FROM (SELECT el.entry_time, el.parking_duration, COALESCE(el.is_registered, 0) = 1 AS registered,
+                     {type_group} AS type_group
+              FROM entry_exit_log el WHERE {entry_filter})
+        GROUP BY 1, 2, 3
+        """,
+        f"""
+        INSERT INTO {table} (bucket, type_group, registered, exits)
+        SELECT substr(exit_time, 1, {length}), type_group, registered, COUNT(*)
+        FROM (SELECT el.exit_time, COALESCE(el.is_registered, 0) = 1 AS registered,
+                     {type_group} AS type_group
+              FROM entry_exit_log el WHERE {exit_filter})
+        WHERE true
+        GROUP BY 1, 2, 3
+        ON CONFLICT (bucket, type_group, registered) DO UPDATE SET exits = excluded.exits
+        """,
+    ]
+
+
+def migration_statements():
+    """Tạo bảng + trigger + backfill lần đầu (db_migrations version 3)"""
+    statements = [_create_table_sql(table) for table, _ in ROLLUP_TABLES]
+    statements += TRIGGERS
+    for table, length in ROLLUP_TABLES:
+        statements += _backfill_sql(table, length)
+    return statements
+
+
+def plate_migration_statements():
+    """Rollup (ngày, biển số) + trigger + backfill (db_migrations version 6)"""
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {PLATE_ROLLUP_TABLE} (
+            bucket TEXT NOT NULL,
+            plate_number TEXT NOT NULL,
+            visits INTEGER NOT NULL DEFAULT 0,
+            duration_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, plate_number)
+        ) WITHOUT ROWID
+        """,
+        *PLATE_TRIGGERS,
+        _plate_backfill_sql(),
+    ]
+
+
+def has_rollups(conn, trigger='trg_rollup_insert'):
+    row = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                       (trigger,)).fetchone()
+    return bool(row and row[0])
+
+
+def has_plate_rollups(conn):
+    return has_rollups(conn, 'trg_plate_rollup_insert')
+
+
+def rebuild(db, since=None):
+    """Tính lại rollup từ entry_exit_log (toàn bộ, hoặc từ ngày `since` 'YYYY-MM-DD')"""
+    started = time.perf_counter()
+    with db.transaction() as conn:
+        if not has_rollups(conn):
+            raise RuntimeError('Rollup tables are missing, run db_migrations first')
+        for table, length in ROLLUP_TABLES:
+            if since:
+                conn.execute(f"DELETE FROM {table} WHERE bucket >= ?", (since,))
+            else:
+                conn.execute(f"DELETE FROM {table}")
+            for sql in _backfill_sql(table, length, since):
+                conn.execute(sql, {'since': since} if since else ())
+        if has_plate_rollups(conn):
+            if since:
+                conn.execute(f"DELETE FROM {PLATE_ROLLUP_TABLE} WHERE bucket >= ?", (since,))
+            else:
+                conn.execute(f"DELETE FROM {PLATE_ROLLUP_TABLE}")
+            conn.execute(_plate_backfill_sql(since), {'since': since} if since else ())
+    logger.info(f"Rollups rebuilt{f' since {since}' if since else ''} in "
+                f"{(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    from db_access import get_database
+    from db_migrations import migrate
+
+    parser = argparse.ArgumentParser(description='Rebuild report rollup tables from entry_exit_log')
+    parser.add_argument('db_path', nargs='?', default='parking.db')
+    parser.add_argument('--rebuild', action='store_true', help='tính lại rollup từ dữ liệu gốc')
+    parser.add_argument('--since', help='chỉ tính lại từ ngày YYYY-MM-DD')
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    database = get_database(cli_args.db_path)
+    migrate(database)
+    if cli_args.rebuild:
+        rebuild(database, cli_args.since)
+    with database.connection() as connection:
+        for rollup_table in [table for table, _ in ROLLUP_TABLES] + [PLATE_ROLLUP_TABLE]:
+            count = connection.execute(f"SELECT COUNT(*) FROM {rollup_table}").fetchone()[0]
+            print(f"{rollup_table}: {count} rows")
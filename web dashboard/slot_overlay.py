@@ -0,0 +1,145 @@
+# slot_overlay.py - Vẽ vùng đỗ xe (tô màu mờ + viền + số thứ tự) bằng layer dựng sẵn
+#
+# Trước đây mỗi ô: frame.copy() + cv2.addWeighted cả frame -> 50 ô = 50 lần copy/blend mỗi frame.
+# Ở đây layer màu tô, layer viền/nhãn và mask được dựng 1 lần theo kích thước frame; khi trạng thái
+# 1 ô đổi thì chỉ vẽ lại vùng của ô đó trong layer. Mỗi frame chỉ còn 1 lần blend + 1 lần copy có mask
+# trên hình chữ nhật bao các ô - không phụ thuộc số ô.
+import cv2
+import numpy as np
+
+from slot_raster import label_raster
+
+DEFAULT_ALPHA = 0.2  # độ đậm màu tô trong ô
+DEFAULT_THICKNESS = 3
+
+
+class _Slot:
+    __slots__ = ('points', 'box', 'fill_mask', 'outline_mask')
+
+    def __init__(self, points, box, fill_mask, outline_mask):
+        self.points = points
+        self.box = box  # (x1, y1, x2, y2) trong frame, đã gồm độ dày viền
+        self.fill_mask = fill_mask
+        self.outline_mask = outline_mask
+
+
+class SlotOverlayRenderer:
+    """`colors`: trạng thái -> màu BGR; `numbered`: vẽ số thứ tự ô (1, 2, ...) ở tâm ô"""
+
+    def __init__(self, polygons, colors, alpha=DEFAULT_ALPHA, thickness=DEFAULT_THICKNESS, numbered=False,
+                 font=cv2.FONT_HERSHEY_DUPLEX, font_scale=0.7, font_thickness=2, default_state='empty'):
+        self.polygons = polygons
+        self.colors = colors
+        self.alpha = alpha
+        self.thickness = thickness
+        self.numbered = numbered
+        self.font = font
+        self.font_scale = font_scale
+        self.font_thickness = font_thickness
+        self.default_state = default_state
+
+        self._shape = None
+        self._slots = []
+        self._states = []
+        self._roi = None
+        self.stats = {'frames': 0, 'rebuilds': 0, 'slot_updates': 0}
+
+    # ------------------------------------------------------------------ dựng layer
+
+    def _build(self, shape):
+        height, width = shape[:2]
+        self._shape = shape[:2]
+        self.stats['rebuilds'] += 1
+
+        labels = label_raster(self.polygons, (height, width))
+        self._fill = np.zeros((height, width, 3), dtype=np.uint8)
+        self._sprite = np.zeros((height, width, 3), dtype=np.uint8)  # viền + nhãn
+        self._sprite_mask = np.zeros((height, width), dtype=bool)
+        self._label_layer = np.zeros((height, width, 3), dtype=np.uint8)
+        label_mask = np.zeros((height, width), dtype=np.uint8)
+        self._fill_mask = labels > 0
+
+        margin = self.thickness
+        self._slots = []
+        for index, polygon in enumerate(self.polygons):
+            points = np.array(polygon, dtype=np.int32).reshape(-1, 2)
+            x1, y1 = np.maximum(points.min(axis=0) - margin, 0)
+            x2, y2 = np.minimum(points.max(axis=0) + margin + 1, (width, height))
+            if x2 <= x1 or y2 <= y1:
+                self._slots.append(None)  # ô nằm ngoài frame
+                continue
+            outline = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.polylines(outline, [points - (x1, y1)], True, 255, self.thickness)
+            self._slots.append(_Slot(points, (x1, y1, x2, y2), labels[y1:y2, x1:x2] == index + 1, outline > 0))
+            if self.numbered:
+                self._draw_label(index, points, label_mask)
+        self._label_mask = label_mask > 0
+        self._sprite[self._label_mask] = self._label_layer[self._label_mask]
+        self._sprite_mask |= self._label_mask
+        self._sprite_dirty = True
+
+        boxes = np.array([slot.box for slot in self._slots if slot is not None]).reshape(-1, 4)
+        if len(boxes):
+            x1, y1 = boxes[:, :2].min(axis=0)
+            x2, y2 = boxes[:, 2:].max(axis=0)
+            self._roi = (slice(int(y1), int(y2)), slice(int(x1), int(x2)))
+        else:
+            self._roi = (slice(0, 0), slice(0, 0))
+        self._roi_fill_mask = self._fill_mask[self._roi].astype(np.uint8)
+        self._states = [None] * len(self.polygons)
+
+    def _draw_label(self, index, points, label_mask):
+        """Số thứ tự trên nền đen ở tâm ô - không đổi theo trạng thái nên vẽ 1 lần"""
+        center_x, center_y = (int(value) for value in points.mean(axis=0))
+        text = str(index + 1)
+        text_size = cv2.getTextSize(text, self.font, self.font_scale, self.font_thickness)[0]
+        top_left = (center_x - text_size[0] // 2 - 5, center_y - text_size[1] // 2 - 5)
+        bottom_right = (center_x + text_size[0] // 2 + 5, center_y + text_size[1] // 2 + 5)
+        cv2.rectangle(self._label_layer, top_left, bottom_right, (0, 0, 0), -1)
+        cv2.putText(self._label_layer, text, (center_x - text_size[0] // 2, center_y + text_size[1] // 2),
+                    self.font, self.font_scale, (255, 255, 255), self.font_thickness)
+        cv2.rectangle(label_mask, top_left, bottom_right, 1, -1)
+
+    def _update_slot(self, index, state):
+        slot = self._slots[index]
+        self._states[index] = state
+        if slot is None:
+            return
+        color = self.colors[state]
+        x1, y1, x2, y2 = slot.box
+        self._fill[y1:y2, x1:x2][slot.fill_mask] = color
+        self._sprite[y1:y2, x1:x2][slot.outline_mask] = color
+        self._sprite_mask[y1:y2, x1:x2] |= slot.outline_mask
+        self._sprite_dirty = True
+        if self.numbered:
+            # Nhãn luôn nằm trên viền
+            labels = self._label_mask[y1:y2, x1:x2]
+            self._sprite[y1:y2, x1:x2][labels] = self._label_layer[y1:y2, x1:x2][labels]
+            self._sprite_mask[y1:y2, x1:x2] |= labels
+        self.stats['slot_updates'] += 1
+
+    # ------------------------------------------------------------------ vẽ
+
+    def draw(self, frame, status):
+        """Vẽ lên frame (tại chỗ); `status`: index ô -> trạng thái (thiếu = default_state)"""
+        if frame.shape[:2] != self._shape:
+            self._build(frame.shape)
+        for index in range(len(self._slots)):
+            state = status.get(index, self.default_state)
+            if state != self._states[index]:
+                self._update_slot(index, state)
+
+        self.stats['frames'] += 1
+        region = frame[self._roi]
+        if not region.size:
+            return frame
+        if self._sprite_dirty:
+            self._roi_sprite_mask = self._sprite_mask[self._roi].astype(np.uint8)
+            self._sprite_dirty = False
+        blended = cv2.addWeighted(region, 1 - self.alpha, self._fill[self._roi], self.alpha, 0)
+        cv2.copyTo(blended, self._roi_fill_mask, region)
+        cv2.copyTo(self._sprite[self._roi], self._roi_sprite_mask, region)
+        return frame
+
+    def get_stats(self):
+        return dict(self.stats)
@@ -0,0 +1,54 @@
+# slot_raster.py - Ảnh nhãn ô đỗ (mỗi pixel = số thứ tự ô + 1, 0 = ngoài mọi ô) tính 1 lần lúc load
+#
+# Gán N tâm xe vào ô đỗ = 1 lần tra mảng (thay cho N x số ô lần cv2.pointPolygonTest),
+# tỉ lệ box phủ lên ô = np.bincount trên vùng ảnh nhãn trong box.
+import cv2
+import numpy as np
+
+
+def label_raster(polygons, shape=None, scale=1.0):
+    """
+    Ảnh nhãn uint16 cho `polygons` (toạ độ gốc, nhân `scale`); shape=None thì vừa đủ bao các polygon.
+    Polygon chồng nhau: ô có số thứ tự nhỏ hơn thắng (giống vòng lặp pointPolygonTest ... break).
+    """
+    arrays = [np.round(np.array(polygon, dtype=np.float32).reshape(-1, 2) * scale).astype(np.int32)
+              for polygon in polygons]
+    if shape is None:
+        extent = np.max([points.max(axis=0) for points in arrays], axis=0) + 1 if arrays else (1, 1)
+        shape = (int(extent[1]), int(extent[0]))
+    labels = np.zeros(shape[:2], dtype=np.uint16)
+    for index in range(len(arrays) - 1, -1, -1):
+        cv2.fillPoly(labels, [arrays[index]], index + 1)
+    return labels
+
+
+class SlotRaster:
+    def __init__(self, polygons):
+        self.count = len(polygons)
+        self.labels = label_raster(polygons)
+        self.height, self.width = self.labels.shape
+        self.areas = np.bincount(self.labels.ravel(), minlength=self.count + 1)[1:]
+
+    def lookup(self, points):
+        """Số thứ tự ô chứa từng điểm (x, y); -1 nếu không thuộc ô nào"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(points):
+            return np.zeros(0, dtype=np.int64)
+        x = np.round(points[:, 0]).astype(np.int64)
+        y = np.round(points[:, 1]).astype(np.int64)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        slots = np.full(len(points), -1, dtype=np.int64)
+        slots[inside] = self.labels[y[inside], x[inside]].astype(np.int64) - 1
+        return slots
+
+    def coverage(self, boxes):
+        """(N, số ô): tỉ lệ diện tích mỗi ô bị box xyxy phủ"""
+        result = np.zeros((len(boxes), self.count), dtype=np.float32)
+        for row, (x1, y1, x2, y2) in enumerate(boxes):
+            x1, x2 = max(0, int(x1)), min(self.width, int(x2))
+            y1, y2 = max(0, int(y1)), min(self.height, int(y2))
+            if x2 <= x1 or y2 <= y1:
+                continue
+            counts = np.bincount(self.labels[y1:y2, x1:x2].ravel(), minlength=self.count + 1)[1:]
+            result[row] = counts / np.maximum(self.areas, 1)
+        return result
@@ -0,0 +1,195 @@
+# startup.py - Khởi động: đo thời gian từng giai đoạn, import lười, load model song song ở background
+#
+# - checkpoint(name): giai đoạn tuần tự lúc import app.py (thời gian từ checkpoint trước đến giờ).
+# - lazy_import(name): module nặng (torch/ultralytics...) chỉ import khi dùng lần đầu hoặc trong task nền.
+# - add_task()/start(): load model + warm-up chạy song song trong thread; /health báo 'warming'
+#   cho đến khi mọi task bắt buộc xong thì chuyển 'ready' (có task lỗi -> 'degraded').
+import importlib
+import importlib.util
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Proxy import module ở lần truy cập thuộc tính đầu tiên; import lỗi -> AttributeError (hasattr() = False)"""
+
+    def __init__(self, name, profile):
+        self.__dict__['_name'] = name
+        self.__dict__['_profile'] = profile
+        self.__dict__['_module'] = None
+        self.__dict__['_error'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        if self._module is None and self._error is None:
+            with self._lock:
+                if self._module is None and self._error is None:
+                    try:
+                        with self._profile.phase(f'import {self._name}'):
+                            self.__dict__['_module'] = importlib.import_module(self._name)
+                    except Exception as e:
+                        self.__dict__['_error'] = e
+                        logger.warning(f"Module {self._name} not available: {e}")
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        if module is None:
+            raise AttributeError(f"module '{self._name}' not available ({self._error})")
+        return getattr(module, attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __bool__(self):
+        """Có cài đặt (chưa import) và chưa import lỗi"""
+        if self._module is not None:
+            return True
+        return self._error is None and importlib.util.find_spec(self._name) is not None
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'failed' if self._error else 'lazy'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+class _Task:
+    __slots__ = ('name', 'func', 'required', 'status', 'seconds', 'error')
+
+    def __init__(self, name, func, required):
+        self.name = name
+        self.func = func
+        self.required = required
+        self.status = 'pending'
+        self.seconds = None
+        self.error = None
+
+
+class Startup:
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._last_checkpoint = self._t0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._tasks = {}
+        self.phases = []  # (tên, bắt đầu (giây từ lúc khởi động), thời gian, thread)
+        self.state = 'starting'
+        self.ready_after = None
+
+    # ------------------------------------------------------------------ đo thời gian
+
+    def _record(self, name, started, seconds):
+        with self._lock:
+            self.phases.append((name, started - self._t0, seconds, threading.current_thread().name))
+
+    def checkpoint(self, name):
+        now = time.perf_counter()
+        self._record(name, self._last_checkpoint, now - self._last_checkpoint)
+        self._last_checkpoint = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started, time.perf_counter() - started)
+
+    def lazy_import(self, name):
+        return LazyModule(name, self)
+
+    @staticmethod
+    def module_available(name):
+        return importlib.util.find_spec(name) is not None
+
+    # ------------------------------------------------------------------ task nền
+
+    def add_task(self, name, func, required=True):
+        """func() chạy trong thread riêng khi start(); required=False thì không chặn trạng thái ready"""
+        self._tasks[name] = _Task(name, func, required)
+
+    def start(self):
+        self.state = 'warming'
+        if not self._tasks:
+            self._finish()
+            return
+        for task in self._tasks.values():
+            threading.Thread(target=self._run_task, args=(task,), name=f'startup-{task.name}', daemon=True).start()
+
+    def _run_task(self, task):
+        task.status = 'running'
+        started = time.perf_counter()
+        try:
+            with self.phase(f'task {task.name}'):
+                result = task.func()
+            task.status = 'failed' if result is False else 'done'
+        except Exception as e:
+            task.status = 'failed'
+            task.error = str(e)
+            logger.error(f"Startup task {task.name} failed: {e}", exc_info=True)
+        task.seconds = time.perf_counter() - started
+
+        with self._lock:
+            waiting = [t for t in self._tasks.values() if t.required and t.status in ('pending', 'running')]
+        if not waiting:
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._ready.is_set():
+                return
+            failed = [t.name for t in self._tasks.values() if t.required and t.status == 'failed']
+            self.state = 'degraded' if failed else 'ready'
+            self.ready_after = time.perf_counter() - self._t0
+            self._ready.set()
+        logger.info(f"Startup {self.state} after {self.ready_after:.1f}s\n{self.report()}")
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def component_done(self, name):
+        task = self._tasks.get(name)
+        return task is not None and task.status == 'done'
+
+    # ------------------------------------------------------------------ báo cáo
+
+    def report(self):
+        """Bảng thời gian theo giai đoạn (sắp theo thời điểm bắt đầu)"""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = [f"{'phase':<36} {'start':>8} {'seconds':>8}  thread"]
+        for name, started, seconds, thread in phases:
+            lines.append(f"{name:<36} {started:>8.2f} {seconds:>8.2f}  {thread}")
+        return '\n'.join(lines)
+
+    def get_status(self, include_phases=False):
+        status = {
+            'state': self.state,
+            'ready': self.is_ready(),
+            'ready_after': round(self.ready_after, 2) if self.ready_after is not None else None,
+            'components': {
+                task.name: {
+                    'status': task.status,
+                    'required': task.required,
+                    'seconds': round(task.seconds, 2) if task.seconds is not None else None,
+                    'error': task.error
+                } for task in self._tasks.values()
+            }
+        }
+        if include_phases:
+            with self._lock:
+                status['phases'] = [
+                    {'name': name, 'start': round(started, 3), 'seconds': round(seconds, 3), 'thread': thread}
+                    for name, started, seconds, thread in sorted(self.phases, key=lambda p: p[1])
+                ]
+        return status
+
+
+startup = Startup()
@@ -0,0 +1,285 @@
+# stream_hub.py - Pipeline capture/inference dùng chung cho mọi MJPEG viewer
+import logging
+import threading
+import time
+
+import cv2
+
+from jpeg_encoder import get_encoder
+from stream_rate import AdaptiveRate, ViewerSession
+
+logger = logging.getLogger(__name__)
+
+
+def mjpeg_part(jpeg_bytes):
+    """Đóng gói 1 frame JPEG thành 1 phần multipart/x-mixed-replace"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n\r\n')
+
+
+VARIANTS = ('annotated', 'raw')
+
+# Ladder độ phân giải / chất lượng: viewer chọn bằng ?w=640&q=70, giá trị được làm tròn về bậc gần nhất
+# để số bản encode mỗi frame có giới hạn. w lớn hơn bậc cao nhất (hoặc >= frame gốc) = kích thước gốc.
+LADDER_WIDTHS = (320, 480, 640, 960, 1280)
+LADDER_QUALITIES = (40, 50, 60, 70, 80, 90)
+
+
+def snap_width(width):
+    """Bậc ladder lớn nhất <= width; None = kích thước gốc"""
+    if not width or width > LADDER_WIDTHS[-1]:
+        return None
+    fitting = [w for w in LADDER_WIDTHS if w <= width]
+    return fitting[-1] if fitting else LADDER_WIDTHS[0]
+
+
+def snap_quality(quality):
+    return min(LADDER_QUALITIES, key=lambda q: abs(q - quality))
+
+
+class FrameBroadcaster:
+    """
+    Một producer thread cho mỗi nguồn camera: decode, inference và encode JPEG đúng 1 lần,
+    frame mới nhất được phát cho tất cả viewer mà không tốn thêm inference.
+    Viewer chậm chỉ nhận frame mới nhất (bỏ qua frame cũ), producer không bao giờ bị chặn.
+
+    Có `render` thì frame_source trả về frame sạch: biến thể 'raw' (client tự vẽ từ detection_channel)
+    được encode nguyên, biến thể 'annotated' = render(frame).
+    Mỗi viewer xem 1 rendition (biến thể, chiều rộng, quality); mỗi frame chỉ encode các rendition
+    đang có viewer, mỗi rendition đúng 1 lần dù bao nhiêu viewer.
+    """
+
+    def __init__(self, name, frame_source, jpeg_quality=80, idle_timeout=10.0, frame_timeout=5.0,
+                 render=None, encoder=None):
+        self.name = name
+        self.frame_source = frame_source  # callable trả về iterator các frame BGR
+        self.render = render  # callable(frame) -> frame đã vẽ kết quả detection (vẽ tại chỗ)
+        self.encoder = encoder or get_encoder()
+        self.jpeg_quality = jpeg_quality  # quality mặc định khi viewer không chọn q
+        self.idle_timeout = idle_timeout  # dừng producer khi không còn viewer sau N giây
+        self.frame_timeout = frame_timeout
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._latest = {}  # rendition -> JPEG mới nhất
+        self._seq = {}
+        self._published_at = {}
+        self._rendition_viewers = {}
+        self._sessions = {}  # id -> ViewerSession
+        self._viewers = 0
+
+        self.frames_produced = 0
+        self.producer_started_at = None
+        self.last_frame_time = None
+        self._encode_seconds = 0.0
+        self._encodes = 0
+
+    def _ensure_running(self):
+        """Khởi động producer thread nếu chưa chạy"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f"stream-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        logger.info(f"Stream producer '{self.name}' started")
+        self.producer_started_at = time.time()
+        frames = None
+        idle_since = None
+        try:
+            frames = self.frame_source()
+            for frame in frames:
+                if frame is None:
+                    continue
+
+                self._encode_variants(frame)
+
+                # Không còn viewer -> dừng sau idle_timeout để giải phóng camera/model
+                with self._cond:
+                    if self._viewers > 0:
+                        idle_since = None
+                    elif idle_since is None:
+                        idle_since = time.time()
+                    elif time.time() - idle_since >= self.idle_timeout:
+                        # Bỏ đăng ký ngay trong lock: viewer kết nối trong lúc đang đóng nguồn
+                        # sẽ khởi động producer mới thay vì chờ frame_timeout
+                        self._thread = None
+                        break
+        except Exception as e:
+            logger.error(f"Stream producer '{self.name}' error: {e}")
+        finally:
+            if frames is not None and hasattr(frames, 'close'):
+                try:
+                    frames.close()
+                except Exception as e:
+                    logger.warning(f"Error closing frame source '{self.name}': {e}")
+            with self._cond:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                self._cond.notify_all()
+            logger.info(f"Stream producer '{self.name}' stopped")
+
+    def rendition(self, raw=False, width=None, quality=None):
+        """Key (biến thể, chiều rộng hoặc None = gốc, quality) đã làm tròn về ladder"""
+        # Không có render: 2 biến thể giống nhau, dùng chung 1 lần encode
+        variant = 'raw' if raw and self.render is not None else 'annotated'
+        return variant, snap_width(width), snap_quality(quality) if quality else self.jpeg_quality
+
+    def _encode_variants(self, frame):
+        with self._cond:
+            wanted = [key for key, count in self._rendition_viewers.items() if count] \
+                or [self.rendition()]
+        # raw trước: render vẽ tại chỗ lên frame
+        for variant in ('raw', 'annotated'):
+            keys = [key for key in wanted if key[0] == variant]
+            if not keys:
+                continue
+            try:
+                if variant == 'annotated' and self.render is not None:
+                    frame = self.render(frame)
+                self.publish(self._encode_renditions(frame, keys))
+            except Exception as e:
+                logger.warning(f"Stream '{self.name}' encode error: {e}")
+
+    def _encode_renditions(self, frame, keys):
+        """{rendition: JPEG}; các rendition trùng kích thước thực tế/quality dùng chung 1 lần encode"""
+        started = time.perf_counter()
+        height, width = frame.shape[:2]
+        scaled, encoded, result = {}, {}, {}
+        for key in keys:
+            target = key[1] if key[1] and key[1] < width else None
+            if (target, key[2]) not in encoded:
+                if target not in scaled:
+                    scaled[target] = frame if target is None else cv2.resize(
+                        frame, (target, max(1, round(height * target / width))), interpolation=cv2.INTER_AREA)
+                encoded[(target, key[2])] = self.encoder.encode(scaled[target], key[2])
+            result[key] = encoded[(target, key[2])]
+        self._encode_seconds += time.perf_counter() - started
+        self._encodes += len(encoded)
+        return result
+
+    def publish(self, frames):
+        """Cập nhật JPEG mới nhất của các rendition ({rendition: bytes}) và đánh thức các viewer"""
+        with self._cond:
+            now = time.time()
+            for key, jpeg_bytes in frames.items():
+                self._latest[key] = jpeg_bytes
+                self._seq[key] = self._seq.get(key, 0) + 1
+                self._published_at[key] = now
+            self.frames_produced += 1
+            self.last_frame_time = now
+            self._cond.notify_all()
+
+    def stream(self, raw=False, width=None, quality=None, adaptive=False, client=None):
+        """
+        Generator MJPEG cho 1 viewer; raw=True: frame không vẽ kết quả detection,
+        width / quality: bậc ladder (None = kích thước gốc / quality mặc định),
+        adaptive=True: tự hạ/nâng FPS, quality, chiều rộng theo tốc độ client nhận (stream_rate)
+        """
+        requested = self.rendition(raw, width, quality)
+        viewer = ViewerSession(client, AdaptiveRate() if adaptive else None)
+        key = viewer.key = viewer.rendition(requested)
+        with self._cond:
+            self._viewers += 1
+            self._rendition_viewers[key] = self._rendition_viewers.get(key, 0) + 1
+            self._sessions[viewer.id] = viewer
+        self._ensure_running()
+
+        last_seq = 0
+        next_send = 0.0
+        try:
+            while True:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)  # giới hạn FPS của bậc ABR; frame bỏ lỡ trong lúc chờ thì bỏ qua
+
+                with self._cond:
+                    has_new = self._cond.wait_for(lambda: self._seq.get(key, 0) != last_seq,
+                                                  timeout=self.frame_timeout)
+                    jpeg_bytes, seq = self._latest.get(key), self._seq.get(key, 0)
+                    published_at = self._published_at.get(key)
+
+                if not has_new:
+                    # Producer có thể đã dừng (lỗi video...) -> khởi động lại
+                    self._ensure_running()
+                    continue
+
+                last_seq = seq
+                part = mjpeg_part(jpeg_bytes)
+                next_send = time.monotonic() + viewer.min_interval
+                started = time.perf_counter()
+                yield part  # quay lại khi server đã ghi xong frame vào socket
+                write_seconds = time.perf_counter() - started
+
+                if viewer.record(len(part), write_seconds, time.time() - published_at):
+                    new_key = viewer.rendition(requested)
+                    if new_key != key:
+                        with self._cond:
+                            self._rendition_viewers[key] -= 1
+                            self._rendition_viewers[new_key] = self._rendition_viewers.get(new_key, 0) + 1
+                            # Chờ frame mới của rendition mới (frame đang giữ có thể đã cũ)
+                            key = viewer.key = new_key
+                            last_seq = self._seq.get(key, 0)
+                        logger.info(f"Stream '{self.name}' viewer {viewer.id} ({client}): ABR level "
+                                    f"{viewer.rate.level}, {viewer.rate.fps} FPS, width {key[1] or 'native'}, "
+                                    f"q{key[2]}")
+        finally:
+            with self._cond:
+                self._viewers -= 1
+                self._rendition_viewers[key] -= 1
+                self._sessions.pop(viewer.id, None)
+
+    def get_viewer_stats(self):
+        """Theo từng viewer: rendition, FPS thực tế, băng thông, độ trễ, bậc ABR"""
+        with self._cond:
+            sessions = list(self._sessions.values())
+        return [session.get_stats() for session in sessions]
+
+    def get_stats(self):
+        with self._cond:
+            running = self._thread is not None and self._thread.is_alive()
+            uptime = time.time() - self.producer_started_at if running and self.producer_started_at else 0
+            viewers_by_variant = dict.fromkeys(VARIANTS, 0)
+            renditions = {}
+            for (variant, width, quality), count in self._rendition_viewers.items():
+                viewers_by_variant[variant] += count
+                if count:
+                    renditions[f"{variant} {width or 'native'} q{quality}"] = count
+            return {
+                'name': self.name,
+                'running': running,
+                'viewers': self._viewers,
+                'viewers_by_variant': viewers_by_variant,
+                'renditions': renditions,
+                'encoder': self.encoder.name,
+                'encode_ms': round(self._encode_seconds / self._encodes * 1000, 2) if self._encodes else None,
+                'frames_produced': self.frames_produced,
+                'last_frame_time': self.last_frame_time,
+                'producer_uptime': round(uptime, 1)
+            }
+
+
+# Registry các broadcaster theo tên camera
+_broadcasters = {}
+_registry_lock = threading.Lock()
+
+
+def register_broadcaster(name, frame_source, **kwargs):
+    """Đăng ký (hoặc lấy lại) broadcaster cho 1 nguồn camera"""
+    with _registry_lock:
+        if name not in _broadcasters:
+            _broadcasters[name] = FrameBroadcaster(name, frame_source, **kwargs)
+        return _broadcasters[name]
+
+
+def get_broadcaster(name):
+    return _broadcasters.get(name)
+
+
+def get_all_stats():
+    return {name: b.get_stats() for name, b in _broadcasters.items()}
+
+
+def get_all_viewer_stats():
+    return {name: b.get_viewer_stats() for name, b in _broadcasters.items()}
@@ -0,0 +1,153 @@
+# stream_rate.py - Theo dõi tốc độ gửi của từng MJPEG viewer và adaptive bitrate (FPS / quality / độ phân giải)
+#
+# Server chạy threading: yield 1 frame chỉ quay lại sau khi socket nhận hết dữ liệu. Client không đọc kịp
+# (điện thoại bảo vệ trên Wi-Fi yếu) -> buffer TCP đầy, thời gian write tăng và frame đến trễ dần.
+# Write trung bình vượt `backlog_ratio` khoảng cách giữa 2 frame (hoặc độ trễ frame vượt `max_latency`)
+# thì hạ 1 bậc; write nhanh liên tục trong `up_hold` giây thì nâng lại 1 bậc. Nâng lên rồi lại phải hạ
+# ngay thì lần nâng sau chờ gấp đôi (tránh dao động giữa 2 bậc).
+import itertools
+import time
+from collections import deque
+
+# Bậc ABR: (FPS tối đa, quality tối đa, chiều rộng tối đa); None = giữ giá trị viewer chọn
+ABR_RUNGS = (
+    (25, None, None),
+    (15, 70, None),
+    (10, 60, 960),
+    (6, 50, 640),
+    (3, 40, 480),
+    (1, 40, 320),
+)
+STATS_WINDOW = 5.0  # giây, cho FPS / băng thông thực tế
+
+
+def _ewma(previous, value, alpha):
+    return value if previous is None else previous + alpha * (value - previous)
+
+
+class AdaptiveRate:
+    def __init__(self, rungs=ABR_RUNGS, backlog_ratio=0.5, drain_ratio=0.15, max_latency=1.0,
+                 down_hold=1.0, up_hold=5.0, max_up_hold=60.0, alpha=0.3):
+        self.rungs = rungs
+        self.backlog_ratio = backlog_ratio
+        self.drain_ratio = drain_ratio
+        self.max_latency = max_latency
+        self.down_hold = down_hold
+        self.base_up_hold = up_hold
+        self.max_up_hold = max_up_hold
+        self.alpha = alpha
+
+        self.level = 0
+        self.up_hold = up_hold
+        self.write_time = None  # EWMA giây / frame ở bậc hiện tại
+        self.latency = None
+        self._last_change = time.monotonic()
+        self._last_up = None
+        self.stats = {'step_downs': 0, 'step_ups': 0}
+
+    @property
+    def fps(self):
+        return self.rungs[self.level][0]
+
+    def apply(self, width, quality):
+        """(chiều rộng, quality) viewer xem ở bậc hiện tại; width None = kích thước gốc"""
+        _, max_quality, max_width = self.rungs[self.level]
+        if max_width:
+            width = min(width, max_width) if width else max_width
+        if max_quality:
+            quality = min(quality, max_quality)
+        return width, quality
+
+    def record(self, write_seconds, latency, now=None):
+        """Cập nhật sau mỗi frame gửi xong; True nếu đổi bậc"""
+        now = time.monotonic() if now is None else now
+        self.write_time = _ewma(self.write_time, write_seconds, self.alpha)
+        self.latency = _ewma(self.latency, latency, self.alpha)
+        since_change = now - self._last_change
+
+        congested = self.write_time > self.backlog_ratio / self.fps or self.latency > self.max_latency
+        if congested and self.level < len(self.rungs) - 1 and since_change >= self.down_hold:
+            if self._last_up is not None and now - self._last_up < 2 * self.up_hold:
+                self.up_hold = min(self.up_hold * 2, self.max_up_hold)
+            self._change(self.level + 1, now)
+            self.stats['step_downs'] += 1
+            return True
+
+        if self.level > 0 and since_change >= self.up_hold and not congested \
+                and self.write_time < self.drain_ratio / self.rungs[self.level - 1][0]:
+            if self._last_up is None or now - self._last_up >= self.max_up_hold:
+                self.up_hold = self.base_up_hold  # ổn định lâu rồi -> quay lại chờ ngắn
+            self._last_up = now
+            self._change(self.level - 1, now)
+            self.stats['step_ups'] += 1
+            return True
+        return False
+
+    def _change(self, level, now):
+        self.level = level
+        self._last_change = now
+        # Đo lại từ đầu ở bậc mới (phần backlog cũ trong buffer TCP không tính cho bậc mới)
+        self.write_time = None
+        self.latency = None
+
+
+class ViewerSession:
+    """1 kết nối MJPEG: rendition đang xem, FPS / băng thông / độ trễ thực tế, bộ điều khiển ABR (nếu bật)"""
+    _ids = itertools.count(1)
+
+    def __init__(self, client=None, rate=None):
+        self.id = next(self._ids)
+        self.client = client
+        self.rate = rate
+        self.key = None
+        self.connected_at = time.time()
+        self.frames = 0
+        self.bytes = 0
+        self.latency = None
+        self.write_time = None
+        self._window = deque()  # (thời điểm gửi xong, số byte)
+
+    @property
+    def min_interval(self):
+        """Khoảng cách tối thiểu giữa 2 frame (giới hạn FPS của bậc ABR), 0 = theo tốc độ producer"""
+        return 1.0 / self.rate.fps if self.rate else 0.0
+
+    def rendition(self, key):
+        """Rendition thực tế từ rendition viewer yêu cầu (biến thể, chiều rộng, quality)"""
+        if not self.rate:
+            return key
+        return (key[0], *self.rate.apply(key[1], key[2]))
+
+    def record(self, nbytes, write_seconds, latency):
+        """Sau mỗi frame gửi xong; True nếu bậc ABR đổi (cần chọn lại rendition)"""
+        now = time.time()
+        self.frames += 1
+        self.bytes += nbytes
+        self.latency = _ewma(self.latency, latency, 0.3)
+        self.write_time = _ewma(self.write_time, write_seconds, 0.3)
+        self._window.append((now, nbytes))
+        while self._window and now - self._window[0][0] > STATS_WINDOW:
+            self._window.popleft()
+        return self.rate.record(write_seconds, latency) if self.rate else False
+
+    def get_stats(self):
+        now = time.time()
+        span = min(STATS_WINDOW, now - self.connected_at) or 1.0
+        recent = [entry for entry in self._window if now - entry[0] <= STATS_WINDOW]
+        variant, width, quality = self.key
+        stats = {
+            'id': self.id,
+            'client': self.client,
+            'rendition': {'variant': variant, 'width': width, 'quality': quality},
+            'connected_seconds': round(now - self.connected_at, 1),
+            'frames': self.frames,
+            'effective_fps': round(len(recent) / span, 1),
+            'kbps': round(sum(size for _, size in recent) * 8 / 1000 / span, 1),
+            'latency_ms': round(self.latency * 1000) if self.latency is not None else None,
+            'write_ms': round(self.write_time * 1000, 1) if self.write_time is not None else None,
+            'adaptive': self.rate is not None
+        }
+        if self.rate:
+            stats.update(level=self.rate.level, max_fps=self.rate.fps, up_hold=self.rate.up_hold,
+                         **self.rate.stats)
+        return stats
@@ -0,0 +1,118 @@
+# vehicle_cache.py - Cache trong RAM các xe đăng ký đang hoạt động + phiên đang đỗ (plate -> entry_time)
+#
+# Dùng cho đường /capture: tra chủ xe và giờ vào không cần query.
+# Nạp 1 lần lúc khởi động; route đăng ký/sửa/xoá xe gọi refresh(plate) (đọc lại đúng 1 dòng),
+# capture cập nhật phiên đỗ ngay sau khi ghi log (write-through).
+import logging
+import threading
+import time
+
+from plate_search import plate_key
+
+logger = logging.getLogger(__name__)
+
+VEHICLE_COLUMNS = ('plate_number', 'owner_name', 'owner_phone', 'vehicle_type',
+                   'vehicle_brand', 'vehicle_model', 'owner_email')
+
+
+class RegisteredVehicleCache:
+    """Xe đăng ký theo plate_key và phiên chưa ra theo plate_key, dùng chung cho mọi thread"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._vehicles = {}
+        self._open_sessions = {}
+        self._loaded = False
+        self.loaded_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Nạp lại toàn bộ (khởi động, hoặc khi cần đồng bộ lại)"""
+        started = time.perf_counter()
+        with self.db.connection() as conn:
+            vehicles = conn.execute(
+                f"SELECT {', '.join(VEHICLE_COLUMNS)} FROM registered_vehicles WHERE is_active = 1"
+            ).fetchall()
+            # Partial index idx_eel_open_sessions (exit_time IS NULL)
+            sessions = conn.execute("""
+                SELECT plate_number, MAX(entry_time) FROM entry_exit_log
+                WHERE exit_time IS NULL AND entry_time IS NOT NULL
+                GROUP BY plate_number
+            """).fetchall()
+
+        vehicle_map = {plate_key(row[0]): dict(zip(VEHICLE_COLUMNS, row)) for row in vehicles}
+        session_map = {}
+        for plate, entry_time in sessions:
+            key = plate_key(plate)
+            if entry_time and entry_time > session_map.get(key, ''):
+                session_map[key] = entry_time
+
+        with self._lock:
+            self._vehicles = vehicle_map
+            self._open_sessions = session_map
+            self._loaded = True
+            self.loaded_at = time.time()
+        logger.info(f"Vehicle cache loaded: {len(vehicle_map)} vehicles, {len(session_map)} open sessions "
+                    f"({(time.perf_counter() - started) * 1000:.0f}ms)")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    # ------------------------------------------------------------------ registered vehicles
+
+    def get_vehicle(self, plate):
+        """Thông tin xe đăng ký (dict, bản copy) hoặc None - không query"""
+        self._ensure_loaded()
+        with self._lock:
+            vehicle = self._vehicles.get(plate_key(plate))
+            if vehicle is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(vehicle)
+
+    def refresh(self, plate):
+        """Đọc lại 1 xe sau khi đăng ký / cập nhật / xoá"""
+        if not self._loaded:
+            return  # lần get_vehicle đầu tiên sẽ nạp toàn bộ
+        key = plate_key(plate)
+        with self.db.connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(VEHICLE_COLUMNS)} FROM registered_vehicles "
+                f"WHERE plate_key = ? AND is_active = 1 LIMIT 1", (key,)
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self._vehicles.pop(key, None)
+            else:
+                self._vehicles[key] = dict(zip(VEHICLE_COLUMNS, row))
+
+    # ------------------------------------------------------------------ open sessions
+
+    def open_session(self, plate):
+        """entry_time của phiên chưa ra gần nhất, hoặc None"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._open_sessions.get(plate_key(plate))
+
+    def record_entry(self, plate, entry_time):
+        with self._lock:
+            self._open_sessions[plate_key(plate)] = entry_time
+
+    def record_exit(self, plate):
+        with self._lock:
+            return self._open_sessions.pop(plate_key(plate), None)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'vehicles': len(self._vehicles),
+                'open_sessions': len(self._open_sessions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'loaded_at': self.loaded_at
+            }
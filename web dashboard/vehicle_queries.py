@@ -0,0 +1,145 @@
+# vehicle_queries.py - Danh sách xe đăng ký: phân trang keyset + cache tổng số theo bộ lọc
+#
+# visit_count / last_visit là cột denormalized trên registered_vehicles (db_migrations version 4),
+# được trigger cập nhật khi entry_exit_log thay đổi - không còn 2 subquery tương quan cho mỗi xe.
+import base64
+import logging
+import threading
+import time
+
+import plate_search
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_TTL = 60.0  # giây; ngoài ra cache bị xoá khi đăng ký/sửa/xoá xe
+
+# Thứ tự trang: registration_date mới nhất trước, rowid để phân biệt xe đăng ký cùng thời điểm
+ORDER_BY = " ORDER BY rv.registration_date DESC, rv.rowid DESC"
+
+
+def encode_cursor(registration_date, rowid):
+    raw = f"{registration_date if registration_date is not None else ''}|{rowid}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Cursor -> (registration_date hoặc None, rowid); ValueError nếu cursor hỏng"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        registration_date, rowid = raw.rsplit('|', 1)
+        return registration_date or None, int(rowid)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+class VehicleCountCache:
+    """Tổng số xe theo bộ lọc (search, search_type, vehicle_type) - tránh COUNT(*) mỗi lần chuyển trang"""
+
+    def __init__(self, ttl=COUNT_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None and now - cached[1] < self.ttl:
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        count = compute()
+        with self._lock:
+            self._counts[key] = (count, now)
+        return count
+
+    def invalidate(self):
+        with self._lock:
+            self._counts.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {'entries': len(self._counts), 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+
+vehicle_counts = VehicleCountCache()
+
+
+def invalidate_vehicle_counts():
+    """Gọi sau khi đăng ký / cập nhật / xoá xe"""
+    vehicle_counts.invalidate()
+
+
+def _filters(conn, search, search_type, vehicle_type):
+    where, params = ["rv.is_active = 1"], []
+    if search:
+        condition, search_params = plate_search.search_condition(conn, search, search_type)
+        if condition:
+            where.append(condition)
+            params.extend(search_params)
+    if vehicle_type:
+        where.append("rv.vehicle_type = ?")
+        params.append(vehicle_type)
+    return where, params
+
+
+def count_vehicles(db, search='', vehicle_type='', search_type=None):
+    def compute():
+        with db.connection() as conn:
+            where, params = _filters(conn, search, search_type, vehicle_type)
+            return conn.execute(f"SELECT COUNT(*) FROM registered_vehicles rv WHERE {' AND '.join(where)}",
+                                params).fetchone()[0]
+
+    return vehicle_counts.get((search, search_type, vehicle_type), compute)
+
+
+def list_vehicles(db, per_page, search='', vehicle_type='', cursor=None, offset=0, search_type=None):
+    """
+    1 trang xe đang hoạt động, mới đăng ký trước.
+    cursor: lấy các xe sau cursor (keyset); không có cursor thì dùng offset (tương thích ?page=).
+    Trả về (danh sách dict, next_cursor hoặc None nếu hết).
+    """
+    limit = per_page + 1  # thêm 1 dòng để biết còn trang sau hay không
+    select = "SELECT rv.*, rv.rowid AS _rowid FROM registered_vehicles rv WHERE "
+
+    # Mỗi phần: (điều kiện thêm, tham số, ORDER BY); NULL registration_date đứng cuối khi sắp xếp DESC,
+    # tách riêng để điều kiện row-value seek thẳng vào index idx_rv_active_registration
+    if not cursor:
+        parts = [([], [], ORDER_BY)]
+    else:
+        registration_date, rowid = decode_cursor(cursor)
+        null_part = (["rv.registration_date IS NULL"], [], " ORDER BY rv.rowid DESC")
+        if registration_date is None:
+            null_part[0].append("rv.rowid < ?")
+            null_part[1].append(rowid)
+            parts = [null_part]
+        else:
+            parts = [(["(rv.registration_date, rv.rowid) < (?, ?)"], [registration_date, rowid], ORDER_BY),
+                     null_part]
+
+    rows, columns = [], None
+    with db.connection() as conn:
+        where, params = _filters(conn, search, search_type, vehicle_type)
+        for conditions, extra_params, order_by in parts:
+            query = select + ' AND '.join(where + conditions) + order_by + " LIMIT ?"
+            query_params = params + extra_params + [limit - len(rows)]
+            if not cursor and offset:
+                query += " OFFSET ?"
+                query_params.append(offset)
+            result = conn.execute(query, query_params)
+            columns = [desc[0] for desc in result.description]
+            rows += result.fetchall()
+            if len(rows) >= limit:
+                break
+
+    vehicles = [dict(zip(columns, row)) for row in rows[:per_page]]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = vehicles[-1]
+        next_cursor = encode_cursor(last.get('registration_date'), last['_rowid'])
+    for vehicle in vehicles:
+        vehicle.pop('_rowid', None)
+    return vehicles, next_cursor